@@ -0,0 +1,93 @@
+# analysis_service.py
+"""Serviço de análises subjetivas: cache persistente + geração em segundo plano.
+
+A chave do cache é (usuário, hash das mensagens e estatísticas usadas no prompt);
+se as entradas mudam, o hash muda e a análise antiga simplesmente deixa de ser usada.
+A página nunca espera pelo LLM: recebe o resultado em cache ou o estado 'pending'.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+ANALYSIS_MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", "2"))
+
+
+def compute_input_hash(user_messages, user_stats):
+    payload = json.dumps({'messages': list(user_messages), 'stats': user_stats},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AnalysisService:
+    def __init__(self, max_workers=ANALYSIS_MAX_WORKERS, ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._errors = {}
+
+    def get_or_schedule(self, username, input_hash, generate):
+        """Retorna {'status': 'ready'|'pending'|'error', ...} sem bloquear.
+
+        `generate` é chamado numa thread do pool quando não há cache válido;
+        deve retornar o texto da análise ou levantar exceção.
+        """
+        cached = db.get_cached_analysis(username, input_hash, self.ttl_seconds)
+        if cached:
+            self._clear_errors(username)
+            return {'status': 'ready', 'result': cached['result'], 'created_at': cached['created_at']}
+        key = (username, input_hash)
+        with self._lock:
+            if key in self._errors:
+                return {'status': 'error', 'error': self._errors[key]}
+            if key not in self._in_flight:
+                self._in_flight[key] = self._executor.submit(self._generate, key, generate)
+        return {'status': 'pending'}
+
+    def _generate(self, key, generate):
+        username, input_hash = key
+        try:
+            result = generate()
+            db.save_cached_analysis(username, input_hash, result)
+            self._clear_errors(username)
+        except Exception as e:
+            with self._lock:
+                self._errors[key] = str(e)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _clear_errors(self, username):
+        """Uma análise do usuário deu certo: falhas anteriores (transitórias) não ficam mais visíveis."""
+        with self._lock:
+            for key in [key for key in self._errors if key[0] == username]:
+                del self._errors[key]
+
+    def invalidate(self, username, input_hash):
+        """Descarta somente a entrada (usuário, hash) para que seja gerada de novo."""
+        with self._lock:
+            self._errors.pop((username, input_hash), None)
+        db.delete_cached_analysis(username, input_hash)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._in_flight)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_analysis_service():
+    """Instância única por processo (sobrevive aos reruns do Streamlit)."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = AnalysisService()
+    return _service
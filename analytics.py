@@ -0,0 +1,83 @@
+# analytics.py
+"""Agregações vetorizadas das ações dos usuários para os dashboards.
+
+`prepare_actions` calcula uma única vez as colunas booleanas (acerto/erro) e a
+data; as demais funções somam essas colunas em groupby, sem lambdas por grupo.
+"""
+import pandas as pd
+
+
+def prepare_actions(df_actions, outcome_column='outcome'):
+    """Adiciona as colunas is_acerto, is_erro, has_outcome e date (uma passada)."""
+    outcome = df_actions[outcome_column]
+    timestamps = df_actions['timestamp']
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps)
+    return df_actions.assign(
+        timestamp=timestamps,
+        is_acerto=outcome.eq('acerto').to_numpy(),
+        is_erro=outcome.eq('erro').to_numpy(),
+        has_outcome=outcome.notna().to_numpy(),
+        # normalize() mantém datetime64 (muito mais rápido que objetos date do Python)
+        date=timestamps.dt.normalize(),
+    )
+
+
+def compute_overview(prepared):
+    total_decisoes = len(prepared)
+    total_acertos = int(prepared['is_acerto'].sum())
+    total_erros = int(prepared['is_erro'].sum())
+    return {
+        'total_decisoes': total_decisoes,
+        'total_acertos': total_acertos,
+        'total_erros': total_erros,
+        'taxa_acerto': (total_acertos / total_decisoes * 100) if total_decisoes > 0 else 0,
+    }
+
+
+def compute_ranking(prepared):
+    """Ranking por usuário: decisões, acertos, erros e taxa de acerto (desc)."""
+    grouped = prepared.groupby('username', observed=True)[['has_outcome', 'is_acerto', 'is_erro']].sum()
+    ranking = grouped.rename(columns={
+        'has_outcome': 'total_decisoes',
+        'is_acerto': 'total_acertos',
+        'is_erro': 'total_erros',
+    }).reset_index()
+    ranking['username'] = ranking['username'].astype(object)
+    ranking['taxa_acerto'] = ranking['total_acertos'] / ranking['total_decisoes'] * 100
+    return ranking.sort_values(by='taxa_acerto', ascending=False)
+
+
+def compute_daily_stats(prepared):
+    """Totais por dia: decisões, acertos, usuários únicos e taxa de acerto diária."""
+    grouped = prepared.groupby('date')
+    daily = grouped[['is_acerto']].sum().rename(columns={'is_acerto': 'acertos'})
+    daily.insert(0, 'total_decisions', grouped.size())
+    daily['usuarios_unicos'] = grouped['username'].nunique()
+    daily = daily.reset_index()
+    daily['taxa_acerto_diaria'] = daily['acertos'] / daily['total_decisions'] * 100
+    return daily
+
+
+def compute_user_timeseries(prepared, username):
+    """Taxa de acerto diária de um usuário (colunas Data, Taxa_Acerto_Diaria)."""
+    user_data = prepared[prepared['username'] == username]
+    daily = user_data.groupby('date')['is_acerto'].mean().mul(100).reset_index()
+    daily.columns = ['Data', 'Taxa_Acerto_Diaria']
+    return daily
+
+
+def summarize_user(prepared, username):
+    """Dados de um usuário: linhas e métricas agregadas (a série temporal vem de compute_user_timeseries)."""
+    user_data = prepared[prepared['username'] == username]
+    total_decisions = len(user_data)
+    acertos = int(user_data['is_acerto'].sum())
+    erros = int(user_data['is_erro'].sum())
+    return {
+        'data': user_data,
+        'total_decisions': total_decisions,
+        'acertos': acertos,
+        'erros': erros,
+        'taxa_acerto': (acertos / total_decisions * 100) if total_decisions > 0 else 0,
+    }
+
@@ -0,0 +1,92 @@
+# benchmarks/bench_analytics.py
+"""Compara as agregações do dashboard (groupby com lambdas) com analytics.py.
+
+Uso: python benchmarks/bench_analytics.py [--sizes 10000 100000 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analytics
+
+
+def synthetic_actions(n, users=500, seed=42):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'username': pd.Categorical(rng.choice([f"user{i}" for i in range(users)], n)),
+        'action_type': pd.Categorical(np.full(n, 'avaliacao_automatica')),
+        'outcome': pd.Categorical(rng.choice(['acerto', 'erro'], n)),
+        'timestamp': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 90 * 86400, n), unit='s'),
+    })
+
+
+def legacy(df_actions, outcome_column, username):
+    # Cópia das agregações que existiam em pages/01dashboard.py
+    user_summary = df_actions.groupby('username', observed=True).agg(
+        total_decisoes=(outcome_column, 'count'),
+        total_acertos=(outcome_column, lambda x: (x == 'acerto').sum()),
+        total_erros=(outcome_column, lambda x: (x == 'erro').sum())
+    ).reset_index()
+    user_summary['taxa_acerto'] = (user_summary['total_acertos'] / user_summary['total_decisoes']) * 100
+    user_summary = user_summary.sort_values(by='taxa_acerto', ascending=False)
+
+    df_actions['date'] = df_actions['timestamp'].dt.date
+    daily_stats = df_actions.groupby('date').agg(
+        total_decisions=('username', 'count'),
+        acertos=(outcome_column, lambda x: (x == 'acerto').sum()),
+        usuarios_unicos=('username', 'nunique')
+    ).reset_index()
+    daily_stats['taxa_acerto_diaria'] = (daily_stats['acertos'] / daily_stats['total_decisions']) * 100
+
+    user_data = df_actions[df_actions['username'] == username].copy()
+    user_data['date'] = pd.to_datetime(user_data['timestamp']).dt.date
+    daily_performance = user_data.groupby('date').agg({
+        outcome_column: lambda x: (x == 'acerto').sum() / len(x) * 100
+    }).reset_index()
+    return user_summary, daily_stats, daily_performance
+
+
+def vectorized(df_actions, outcome_column, username):
+    prepared = analytics.prepare_actions(df_actions, outcome_column)
+    user_summary = analytics.compute_ranking(prepared)
+    daily_stats = analytics.compute_daily_stats(prepared)
+    user_data = analytics.summarize_user(prepared, username)['data']
+    daily_performance = analytics.compute_user_timeseries(user_data, username)
+    return user_summary, daily_stats, daily_performance
+
+
+def best_of(fn, *args, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'ações':>10} {'lambdas (s)':>12} {'analytics (s)':>14} {'ganho':>7}")
+    for n in args.sizes:
+        df = synthetic_actions(n)
+        username = df['username'].iloc[0]
+        old_ranking = legacy(df.copy(), 'outcome', username)[0].set_index('username').sort_index()
+        new_ranking = vectorized(df, 'outcome', username)[0].set_index('username').sort_index()
+        pd.testing.assert_frame_equal(old_ranking, new_ranking, check_dtype=False, check_index_type=False,
+                                      check_categorical=False)
+        t_old = best_of(legacy, df.copy(), 'outcome', username)
+        t_new = best_of(vectorized, df, 'outcome', username)
+        print(f"{n:>10} {t_old:>12.3f} {t_new:>14.3f} {t_old / t_new:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/bench_bulk_users.py
+"""Benchmark da importação em lote de usuários (create_users_bulk) contra create_user em laço.
+
+Gera um CSV com N usuários (alguns inválidos e alguns já existentes, para exercitar
+o relatório de erros), importa-o com create_users_from_csv, percorre list_users
+página a página e remove todos com delete_users_bulk; o caminho antigo é medido
+numa amostra e extrapolado.
+
+O hash de senha (bcrypt/scrypt) custaria o mesmo nos dois caminhos e dominaria as
+medições, então o benchmark usa por padrão o custo mínimo (--hash-cost low) e mede o
+custo do hash à parte; --hash-cost production usa o custo configurado no ambiente.
+
+Uso: python benchmarks/bench_bulk_users.py [--users 10000] [--loop-sample 1000] [--hash-cost low|production]
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+import password_hashing
+
+# Custos mínimos aceitos por bcrypt (4 rounds) e um N pequeno para o scrypt
+LOW_COST = {'bcrypt_rounds': 4, 'scrypt_n': 2 ** 4, 'scrypt_r': 1}
+
+
+def write_csv(path, users, prefix):
+    with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(['username', 'email', 'password', 'name'])
+        for i in range(users):
+            password = 'abc' if i % 500 == 0 else 'senha123'  # 0,2% inválidos
+            writer.writerow([f"{prefix}{i:06d}", f"{prefix}{i:06d}@empresa.com", password, f"Trainee {i}"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--loop-sample", type=int, default=1000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--hash-cost", choices=("low", "production"), default="low")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_users_"))
+    db.DB_NAME = os.path.join(os.getcwd(), "bench.db")
+    db.ensure_database()
+
+    if args.hash_cost == "low":
+        password_hashing.configure_password_hasher(**LOW_COST)
+    hasher = password_hashing.get_password_hasher()
+    sample = ["senha123"] * min(args.loop_sample, 200)
+    start = time.perf_counter()
+    hasher.hash_many(sample)
+    hash_per_user = (time.perf_counter() - start) / len(sample)
+    print(f"hash de senha ({hasher.scheme}, custo {args.hash_cost}): {hash_per_user * 1000:.2f} ms/usuário "
+          f"em paralelo -> ~{hash_per_user * args.users:6.1f} s para {args.users} (incluído nos tempos abaixo)")
+
+    start = time.perf_counter()
+    for i in range(args.loop_sample):
+        db.create_user(f"laco{i:06d}", f"laco{i:06d}@empresa.com", "senha123", name=f"Trainee {i}")
+    loop_elapsed = time.perf_counter() - start
+    per_user = loop_elapsed / args.loop_sample
+    print(f"create_user em laço:   {args.loop_sample} usuários em {loop_elapsed:6.2f} s "
+          f"({args.loop_sample / loop_elapsed:8.0f}/s) -> ~{per_user * args.users:6.1f} s para {args.users}")
+
+    start = time.perf_counter()
+    deleted = 0
+    for i in range(args.loop_sample):
+        deleted += db.delete_user(f"laco{i:06d}")[0]
+    loop_delete = time.perf_counter() - start
+    print(f"delete_user em laço:   {deleted} usuários em {loop_delete:6.2f} s "
+          f"({deleted / loop_delete:8.0f}/s)")
+
+    csv_path = os.path.join(os.getcwd(), "cohort.csv")
+    write_csv(csv_path, args.users, "trainee")
+    # Metade dos primeiros já existe: exercita a detecção de conflitos em conjunto
+    db.create_users_bulk({'username': f"trainee{i:06d}", 'email': f"trainee{i:06d}@empresa.com",
+                          'password': 'senha123'} for i in range(1, 200, 2))
+
+    start = time.perf_counter()
+    result = db.create_users_from_csv(csv_path)
+    bulk_elapsed = time.perf_counter() - start
+    print(f"create_users_from_csv: {len(result['created'])} usuários em {bulk_elapsed:6.2f} s "
+          f"({len(result['created']) / bulk_elapsed:8.0f}/s), {len(result['errors'])} linhas com erro")
+
+    start = time.perf_counter()
+    pages = 0
+    listed = 0
+    cursor = None
+    while True:
+        page = db.list_users(limit=args.page_size, after=cursor)
+        pages += 1
+        listed += len(page['users'])
+        if not page['has_more']:
+            break
+        cursor = page['next_cursor']
+    list_elapsed = time.perf_counter() - start
+    print(f"list_users:            {listed} usuários em {pages} páginas, {list_elapsed / pages * 1000:6.2f} ms/página")
+
+    start = time.perf_counter()
+    usernames = [user['username'] for user in db.list_users(limit=args.users * 2)['users']]
+    removed = db.delete_users_bulk(usernames)
+    print(f"delete_users_bulk:     {removed} usuários em {time.perf_counter() - start:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
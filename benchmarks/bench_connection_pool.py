@@ -0,0 +1,85 @@
+# benchmarks/bench_connection_pool.py
+"""Micro-benchmark: custo por chamada com conexão nova vs. conexão persistente (WAL)
+
+Uso: python benchmarks/bench_connection_pool.py [--calls 2000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def legacy_save_conversation(db_name, username, role, content):
+    # Reprodução do padrão antigo: uma conexão por chamada
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO conversations (username, role, content)
+        VALUES (?, ?, ?)
+    ''', (username, role, content))
+    conn.commit()
+    conn.close()
+
+
+def legacy_get_user_stats(db_name, username):
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM user_actions WHERE username = ?", (username,))
+    cursor.fetchone()
+    cursor.execute("SELECT COUNT(*) FROM user_actions WHERE username = ? AND outcome = 'acerto'", (username,))
+    cursor.fetchone()
+    conn.close()
+
+
+def timed(label, fn, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<45} {elapsed / calls * 1e6:10.1f} µs/chamada")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_pool_")
+    os.chdir(workdir)
+    import database as db
+
+    legacy_db = os.path.join(workdir, "legacy.db")
+    db.DB_NAME = legacy_db
+    db.ensure_database()
+    # O banco "legado" volta para o journal padrão, como antes do gerenciador
+    db.get_connection_manager().close_all()
+    conn = sqlite3.connect(legacy_db)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+
+    db.DB_NAME = os.path.join(workdir, "pooled.db")
+    db.ensure_database()
+
+    print(f"{args.calls} chamadas por cenário\n")
+    legacy_write = timed("escrita - conexão nova por chamada",
+                         lambda i: legacy_save_conversation(legacy_db, "bench", "user", f"msg {i}"),
+                         args.calls)
+    pooled_write = timed("escrita - conexão persistente (WAL)",
+                         lambda i: db.save_conversation("bench", "user", f"msg {i}"),
+                         args.calls)
+    legacy_read = timed("leitura - conexão nova por chamada",
+                        lambda i: legacy_get_user_stats(legacy_db, "bench"),
+                        args.calls)
+    pooled_read = timed("leitura - conexão persistente (WAL)",
+                        lambda i: db.get_user_stats("bench"),
+                        args.calls)
+    print(f"\nGanho escrita: {legacy_write / pooled_write:.1f}x | leitura: {legacy_read / pooled_read:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/bench_context.py
+"""Tamanho do prompt e latência por turno numa sessão longa, com e sem rotação de contexto.
+
+Usa o servidor de fake_openai.py com latência proporcional ao tamanho da thread
+(o modelo relê a thread inteira a cada run) e simula T turnos de um mesmo usuário:
+  - sem gestão: a thread permanente cresce para sempre (comportamento anterior)
+  - com gestão: ThreadContextManager resume e troca de thread ao passar do limite
+
+Uso: python benchmarks/bench_context.py [--turns 200] [--threshold 4000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+import fake_openai
+import llm_client
+import thread_context
+
+ASSISTANT_ID = "asst_fake"
+USER_TEXT = ("Eu reuniria a equipe para entender as causas do atraso, renegociaria o prazo com o "
+             "cliente e definiria um plano de acompanhamento semanal com responsáveis claros. ")
+
+
+def run_session(server, username, turns, threshold, report_every):
+    client = llm_client.LLMClient(api_key="fake", base_url=server.base_url)
+    context = thread_context.ThreadContextManager(
+        client, summarizer=thread_context.LLMSummarizer(client, model="fake"),
+        threshold=threshold, background=False)
+    rows = []
+    for turn in range(1, turns + 1):
+        thread_id = context.get_thread_id(username)
+        prompt_tokens = server.thread_tokens(thread_id) + thread_context.estimate_tokens(USER_TEXT)
+        start = time.perf_counter()
+        first = None
+        reply = []
+        for delta in client.stream_reply(thread_id, ASSISTANT_ID, USER_TEXT):
+            if first is None:
+                first = time.perf_counter() - start
+            reply.append(delta)
+        latency = time.perf_counter() - start
+        db.add_message_to_history(username, "user", USER_TEXT)
+        db.add_message_to_history(username, "assistant", "".join(reply))
+        rotation_start = time.perf_counter()
+        context.record_turn(username, thread_id, USER_TEXT, "".join(reply), latency=latency,
+                            time_to_first_token=first)
+        rotation = time.perf_counter() - rotation_start
+        rows.append((turn, prompt_tokens, first, latency, rotation))
+    client.close()
+    metrics = context.metrics()
+    for turn, prompt_tokens, first, latency, rotation in rows:
+        if turn % report_every == 0:
+            print(f"  turno {turn:4d}  prompt {prompt_tokens:7d} tokens  TTFT {first * 1000:7.0f} ms  "
+                  f"turno {latency * 1000:7.0f} ms")
+    total = sum(row[3] for row in rows)
+    print(f"  total {total:.1f} s, prompt médio {sum(row[1] for row in rows) / len(rows):.0f} tokens, "
+          f"rotações {metrics['rotations']} (tempo máx. de rotação {max(row[4] for row in rows) * 1000:.0f} ms)\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--threshold", type=int, default=4000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--prompt-token-latency", type=float, default=0.00002,
+                        help="segundos por token de prompt (20 µs = 0,2 s a cada 10k tokens)")
+    parser.add_argument("--report-every", type=int, default=20)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_context_"))
+    db.DB_NAME = os.path.join(os.getcwd(), "bench.db")
+    db.ensure_database()
+
+    for label, threshold, username in (("Sem gestão de contexto", float("inf"), "sem_gestao"),
+                                       (f"Com rotação a {args.threshold} tokens", args.threshold, "com_gestao")):
+        print(label)
+        with fake_openai.FakeOpenAIServer(latency=args.latency, token_delay=0, tokens=120,
+                                          prompt_token_latency=args.prompt_token_latency) as server:
+            run_session(server, username, args.turns, threshold, args.report_every)
+
+
+if __name__ == "__main__":
+    main()
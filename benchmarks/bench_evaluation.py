@@ -0,0 +1,74 @@
+# benchmarks/bench_evaluation.py
+"""Benchmark do pipeline de avaliação automática com o avaliador local (StubScorer).
+
+Gera N turnos de usuário e mede avaliações/s variando o tamanho do lote e o
+número de workers; a latência simulada por requisição representa o LLM. No fim
+compara a busca por pendentes num histórico já avaliado com e sem a marca d'água.
+
+Uso: python benchmarks/bench_evaluation.py [--turns 5000] [--latency 0.2]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+import evaluation
+import storage
+
+CONFIGS = [(1, 1), (10, 1), (10, 4), (10, 8), (25, 8)]
+
+
+def populate(conn, turns, users):
+    rows = []
+    for i in range(turns):
+        username = f"user{i % users:04d}"
+        rows.append((username, 'assistant', f"Cenário {i}: a equipe perdeu o prazo do cliente."))
+        rows.append((username, 'user', f"Resposta {i}: converso com a equipe e renegocio o prazo."))
+    conn.executemany("INSERT INTO conversations (username, role, content) VALUES (?, ?, ?)", rows)
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.2, help="segundos por requisição simulada")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_eval_"))
+    # Um único arquivo: o benchmark popula e consulta pela conexão direta
+    db.configure_storage(storage.SQLiteBackend(os.path.join(os.getcwd(), "bench.db")))
+    db.ensure_database()
+    conn = db.get_connection_manager().get_connection()
+    populate(conn, args.turns, args.users)
+
+    print(f"\n{'lote':>5} {'workers':>8} {'avaliados':>10} {'requisições':>12} {'tempo (s)':>10} {'aval/s':>9}")
+    for batch_size, workers in CONFIGS:
+        conn.execute("DELETE FROM user_actions")
+        conn.execute("DELETE FROM evaluation_progress")
+        conn.commit()
+        pipeline = evaluation.EvaluationPipeline(evaluation.StubScorer(args.latency),
+                                                 batch_size=batch_size, max_workers=workers)
+        # Sem lote/concorrência a rodada completa levaria turns * latency; limita a amostra
+        limit = min(args.turns, int(20 / args.latency) * batch_size * workers) if args.latency else None
+        report = pipeline.run(limit=limit)
+        print(f"{batch_size:5d} {workers:8d} {report['evaluated']:10d} {report['requests']:12d} "
+              f"{report['elapsed']:10.2f} {report['evaluations_per_second']:9.1f}")
+
+    # Histórico inteiro avaliado: a busca seguinte parte da marca d'água ou revarre tudo
+    evaluation.EvaluationPipeline(evaluation.StubScorer(), batch_size=50, max_workers=8).run()
+    for label in ("com marca d'água", "sem marca d'água"):
+        if label.startswith("sem"):
+            conn.execute("DELETE FROM evaluation_progress")
+            conn.commit()
+        start = time.perf_counter()
+        pending = db.get_unevaluated_turns(limit=100)
+        print(f"\nbusca por pendentes {label}: {(time.perf_counter() - start) * 1000:7.2f} ms ({len(pending)} turnos)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_indexes.py
+"""Benchmark dos índices da migração 3 sobre uma tabela sintética.
+
+Gera N linhas em user_actions/conversations com o esquema anterior aos índices,
+mostra o EXPLAIN QUERY PLAN e o tempo das consultas de database.py, aplica as
+migrações pendentes e repete a medição (SCAN -> SEARCH).
+
+Uso: python benchmarks/bench_indexes.py [--rows 1000000] [--users 2000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import run_migrations
+
+QUERIES = {
+    'get_user_history': (
+        "SELECT role, content, timestamp FROM conversations WHERE username = ? "
+        "ORDER BY timestamp ASC LIMIT 50", 1),
+    'get_user_stats (total)': (
+        "SELECT COUNT(*) FROM user_actions WHERE username = ?", 1),
+    'get_user_stats (acertos)': (
+        "SELECT COUNT(*) FROM user_actions WHERE username = ? AND outcome = 'acerto'", 1),
+    'get_user_login_stats': (
+        "SELECT username, (SELECT COUNT(*) FROM conversations WHERE username = ?), "
+        "(SELECT COUNT(*) FROM user_actions WHERE username = ?) FROM users WHERE username = ?", 3),
+    'delete_user (user_actions)': (
+        "DELETE FROM user_actions WHERE username = ?", 1),
+    'get_all_user_evaluations': (
+        "SELECT u.username, COUNT(ua.action_data), MAX(ua.timestamp) FROM users u "
+        "LEFT JOIN user_actions ua ON u.username = ua.username "
+        "WHERE ua.action_type = 'avaliacao_automatica' OR ua.action_type IS NULL "
+        "GROUP BY u.username", 0),
+}
+
+
+def populate(conn, rows, users):
+    cursor = conn.cursor()
+    names = [f"user{i:05d}" for i in range(users)]
+    cursor.executemany("INSERT INTO users (username, name, email, password_hash) VALUES (?, ?, ?, '')",
+                       [(n, n, f"{n}@example.com") for n in names])
+    rnd = random.Random(42)
+    types = ['avaliacao_automatica', 'login', 'mensagem']
+    outcomes = ['acerto', 'erro', None]
+    batch = 50_000
+    for start in range(0, rows, batch):
+        n = min(batch, rows - start)
+        cursor.executemany(
+            "INSERT INTO user_actions (username, action_type, action_data, outcome, timestamp) "
+            "VALUES (?, ?, ?, ?, datetime('2024-01-01', ? || ' seconds'))",
+            [(rnd.choice(names), rnd.choice(types), 'x', rnd.choice(outcomes), start + i) for i in range(n)])
+        cursor.executemany(
+            "INSERT INTO conversations (username, role, content, timestamp) "
+            "VALUES (?, ?, 'mensagem sintética', datetime('2024-01-01', ? || ' seconds'))",
+            [(rnd.choice(names), rnd.choice(['user', 'assistant']), start + i) for i in range(n)])
+    conn.commit()
+    return names
+
+
+def measure(conn, username, repeats):
+    for label, (sql, nparams) in QUERIES.items():
+        params = (username,) * nparams
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        is_delete = sql.startswith("DELETE")
+        start = time.perf_counter()
+        for _ in range(1 if is_delete else repeats):
+            conn.execute(sql, params).fetchall()
+        if is_delete:
+            conn.rollback()
+        elapsed = (time.perf_counter() - start) / (1 if is_delete else repeats)
+        print(f"  {label:<28} {elapsed * 1000:9.2f} ms")
+        for step in plan:
+            print(f"      {step}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_idx_"), "bench.db")
+    conn = sqlite3.connect(path)
+    run_migrations(conn, target_version=2)
+    print(f"Populando {args.rows} ações e {args.rows} mensagens...")
+    names = populate(conn, args.rows, args.users)
+    target = names[len(names) // 2]
+
+    print("\nSem índices (esquema v2):")
+    measure(conn, target, args.repeats)
+
+    start = time.perf_counter()
+    applied = run_migrations(conn)
+    print(f"\nMigrações {applied} aplicadas em {time.perf_counter() - start:.1f} s")
+    conn.execute("ANALYZE")
+
+    print("\nCom índices (esquema atual):")
+    measure(conn, target, args.repeats)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
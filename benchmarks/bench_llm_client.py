@@ -0,0 +1,197 @@
+# benchmarks/bench_llm_client.py
+"""Benchmark offline da camada llm_client contra o servidor de fake_openai.py.
+
+Simula U usuários simultâneos fazendo T turnos de chat cada e compara:
+  - sync:   caminho antigo (openai.Client síncrono, messages.create + runs.stream)
+  - async:  LLMClient.stream_reply chamado de threads (como as sessões do Streamlit)
+  - native: as mesmas sessões como corrotinas num único event loop
+e as análises subjetivas (polling com sleep(1) contra LLMClient.analyze).
+
+Uso: python benchmarks/bench_llm_client.py [--users 60] [--turns 3] [--latency 0.3]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_openai
+import llm_client
+
+ASSISTANT_ID = "asst_fake"
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def report(label, ttfts, latencies, elapsed, errors, server):
+    print(f"{label:<8} {len(latencies) / elapsed:9.1f} {percentile(ttfts, 0.5) * 1000:9.0f} "
+          f"{percentile(ttfts, 0.95) * 1000:9.0f} {statistics.median(latencies) * 1000 if latencies else 0:10.0f} "
+          f"{percentile(latencies, 0.95) * 1000:10.0f} {errors:7d} {server.stats()['max_active']:8d}")
+
+
+def run_threads(users, turn):
+    ttfts, latencies, errors = [], [], [0]
+    lock = threading.Lock()
+
+    def session(index):
+        for result in turn(index):
+            with lock:
+                if result is None:
+                    errors[0] += 1
+                else:
+                    ttfts.append(result[0])
+                    latencies.append(result[1])
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return ttfts, latencies, time.perf_counter() - start, errors[0]
+
+
+def bench_sync(server, users, turns):
+    import openai
+    client = openai.Client(api_key="fake", base_url=server.base_url)
+
+    def turn(index):
+        thread_id = client.beta.threads.create().id
+        for _ in range(turns):
+            start = time.perf_counter()
+            first = None
+            try:
+                client.beta.threads.messages.create(thread_id=thread_id, role="user", content="resposta")
+                with client.beta.threads.runs.stream(thread_id=thread_id, assistant_id=ASSISTANT_ID) as stream:
+                    for _ in stream.text_deltas:
+                        if first is None:
+                            first = time.perf_counter() - start
+                yield first, time.perf_counter() - start
+            except Exception:
+                yield None
+
+    return run_threads(users, turn)
+
+
+def bench_async(client, users, turns):
+    def turn(index):
+        thread_id = client.create_thread()
+        for _ in range(turns):
+            start = time.perf_counter()
+            first = None
+            try:
+                for _ in client.stream_reply(thread_id, ASSISTANT_ID, "resposta"):
+                    if first is None:
+                        first = time.perf_counter() - start
+                yield first, time.perf_counter() - start
+            except Exception:
+                yield None
+
+    return run_threads(users, turn)
+
+
+def bench_native(client, users, turns):
+    ttfts, latencies, errors = [], [], 0
+
+    async def session():
+        nonlocal errors
+        thread_id = await client.acreate_thread()
+        for _ in range(turns):
+            start = time.perf_counter()
+            first = None
+            try:
+                await client.aadd_message(thread_id, "resposta")
+                async for _ in client.astream_run(thread_id, ASSISTANT_ID):
+                    if first is None:
+                        first = time.perf_counter() - start
+                ttfts.append(first)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    async def all_sessions():
+        await asyncio.gather(*(session() for _ in range(users)))
+
+    start = time.perf_counter()
+    client.run(all_sessions())
+    return ttfts, latencies, time.perf_counter() - start, errors
+
+
+def bench_analysis(server, client, count):
+    import openai
+    legacy = openai.Client(api_key="fake", base_url=server.base_url)
+
+    def legacy_analyze():
+        thread = legacy.beta.threads.create()
+        legacy.beta.threads.messages.create(thread_id=thread.id, role="user", content="prompt")
+        run = legacy.beta.threads.runs.create(thread_id=thread.id, assistant_id=ASSISTANT_ID)
+        while run.status in ['queued', 'in_progress', 'cancelling']:
+            time.sleep(1)
+            run = legacy.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+        return legacy.beta.threads.messages.list(thread_id=thread.id).data[0].content[0].text.value
+
+    for label, analyze in (("sync", legacy_analyze), ("async", lambda: client.analyze("prompt", ASSISTANT_ID))):
+        def turn(index):
+            start = time.perf_counter()
+            try:
+                analyze()
+                yield 0.0, time.perf_counter() - start
+            except Exception:
+                yield None
+        _, latencies, elapsed, errors = run_threads(count, turn)
+        print(f"  {label:<6} {count} análises em {elapsed:5.2f} s, mediana {statistics.median(latencies):5.2f} s, "
+              f"erros {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.3, help="segundos até o primeiro token no servidor")
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=llm_client.OPENAI_MAX_CONCURRENCY)
+    args = parser.parse_args()
+
+    print(f"{args.users} usuários x {args.turns} turnos, TTFT do servidor {args.latency * 1000:.0f} ms, "
+          f"erros simulados {args.error_rate:.0%}, concorrência máx. {args.concurrency}\n")
+    print(f"{'modo':<8} {'turnos/s':>9} {'TTFT p50':>9} {'TTFT p95':>9} {'turno p50':>10} "
+          f"{'turno p95':>10} {'erros':>7} {'conexões':>8}")
+    for mode in ("sync", "async", "native"):
+        with fake_openai.FakeOpenAIServer(latency=args.latency, token_delay=args.token_delay, tokens=args.tokens,
+                                          run_duration=args.latency * 2, error_rate=args.error_rate,
+                                          seed=42) as server:
+            if mode == "sync":
+                results = bench_sync(server, args.users, args.turns)
+            else:
+                client = llm_client.LLMClient(api_key="fake", base_url=server.base_url,
+                                              max_concurrency=args.concurrency, backoff_base=0.05)
+                bench = bench_async if mode == "async" else bench_native
+                results = bench(client, args.users, args.turns)
+                retries = client.metrics()['retries']
+                client.close()
+            report(mode, *results, server)
+            if mode != "sync":
+                print(f"{'':<8} retries: {retries}")
+
+    print("\nAnálises subjetivas (20 simultâneas):")
+    with fake_openai.FakeOpenAIServer(latency=args.latency, token_delay=0, run_duration=args.latency * 2,
+                                      seed=42) as server:
+        client = llm_client.LLMClient(api_key="fake", base_url=server.base_url,
+                                      max_concurrency=args.concurrency)
+        bench_analysis(server, client, 20)
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
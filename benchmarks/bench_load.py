@@ -0,0 +1,236 @@
+# benchmarks/bench_load.py
+"""Teste de carga offline: várias sessões do simulador ao mesmo tempo contra o fake_openai.
+
+Cenários (rodam em P processos x T threads, todos sobre o mesmo arquivo de banco):
+  app: cada sessão é um AppTest do rpg_gestor.py, pelo caminho real do Streamlit:
+       primeira renderização (initialize_session_state), turnos de chat
+       (handle_chat_interaction) e a página de dashboard (show_dashboard)
+  db:  as funções de escrita e leitura de database.py chamadas diretamente
+
+Reporta p50/p99, vazão, erros e bloqueios do SQLite por operação e grava o
+resultado em JSON; com --compare mostra a variação em relação a uma execução anterior.
+
+Uso: python benchmarks/bench_load.py [--processes 4] [--threads 8] [--turns 5] [--scenarios app db]
+     [--latency 0.3] [--tokens-per-second 50] [--tokens 60] [--output load.json] [--compare anterior.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import fake_openai
+
+PROMPT = "Chamo a equipe para entender o atraso e renegocio o prazo com o cliente."
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Recorder:
+    """Latências e erros por operação, compartilhados pelas threads de um processo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def call(self, operation, fn, *args, failed=lambda result: False, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+            error = failed(result)
+        except Exception:
+            result, error = None, True
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.setdefault(operation, []).append(elapsed)
+            if error:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+        return result
+
+
+def db_session(db, recorder, username, turns):
+    # Escritas síncronas devolvem False/None quando falham (o erro vira print em database.py)
+    write_failed = lambda result: not result
+    for turn in range(turns):
+        recorder.call("db.add_message_to_history", db.add_message_to_history, username, "user", PROMPT)
+        recorder.call("db.add_message_to_history", db.add_message_to_history, username, "assistant", PROMPT)
+        recorder.call("db.save_conversation", db.save_conversation, username, "user", PROMPT,
+                      failed=write_failed)
+        recorder.call("db.save_user_action", db.save_user_action, username, "decisao", PROMPT,
+                      "acerto" if turn % 2 else "erro", failed=write_failed)
+        recorder.call("db.get_user_history_page", db.get_user_history_page, username, limit=30)
+        recorder.call("db.get_user_counters", db.get_user_counters, username)
+        recorder.call("db.get_all_user_evaluations", db.get_all_user_evaluations)
+        recorder.call("db.search_conversations", db.search_conversations, "prazo cliente", username=username)
+    recorder.call("db.flush_pending_writes", db.flush_pending_writes)
+
+
+def app_session(recorder, username, turns):
+    from streamlit.testing.v1 import AppTest
+    app_failed = lambda app: bool(app.exception) or bool(app.error)
+    app = AppTest.from_file(os.path.join(REPO, "rpg_gestor.py"), default_timeout=120)
+    app.session_state["username"] = username
+    app.session_state["name"] = username
+    app = recorder.call("app.initialize_session_state", app.run, failed=app_failed)
+    if app is None:
+        return
+    for _ in range(turns):
+        app.chat_input[0].set_value(PROMPT)
+        if recorder.call("app.handle_chat_interaction", app.run, failed=app_failed) is None:
+            return
+    app.selectbox(key="main_menu").set_value('📊 Dashboard')
+    recorder.call("app.show_dashboard", app.run, failed=app_failed)
+
+
+def run_worker(scenario, worker, threads, turns, workdir):
+    """Executa `threads` sessões do cenário num processo; retorna as medições brutas."""
+    os.chdir(workdir)
+    import database as db
+    import instrumentation
+    if scenario == "app":
+        try:
+            import streamlit.testing.v1  # noqa: F401
+        except ImportError as e:
+            return {'unavailable': str(e)}
+    recorder = Recorder()
+
+    def session(index):
+        username = f"trainee_{worker:02d}_{index:03d}"
+        if scenario == "app":
+            app_session(recorder, username, turns)
+        else:
+            db_session(db, recorder, username, turns)
+
+    sessions = [threading.Thread(target=session, args=(i,)) for i in range(threads)]
+    for thread in sessions:
+        thread.start()
+    for thread in sessions:
+        thread.join()
+    db.flush_pending_writes()
+    metrics = instrumentation.snapshot()
+    return {
+        'latencies': recorder.latencies,
+        'errors': recorder.errors,
+        'counters': metrics['counters'],
+        'sql_errors': sum(series['errors'] for name, series in metrics['series'].items()
+                          if name.startswith('sqlite.')),
+    }
+
+
+def run_scenario(scenario, args, workdir):
+    context = multiprocessing.get_context("spawn")
+    jobs = [(scenario, worker, args.threads, args.turns, workdir) for worker in range(args.processes)]
+    started = time.perf_counter()
+    with context.Pool(args.processes) as pool:
+        results = pool.starmap(run_worker, jobs)
+    elapsed = time.perf_counter() - started
+    unavailable = [result['unavailable'] for result in results if 'unavailable' in result]
+    if unavailable:
+        return {'unavailable': unavailable[0]}
+    latencies, errors = {}, {}
+    for result in results:
+        for operation, values in result['latencies'].items():
+            latencies.setdefault(operation, []).extend(values)
+        for operation, count in result['errors'].items():
+            errors[operation] = errors.get(operation, 0) + count
+    return {
+        'elapsed': elapsed,
+        'sessions': args.processes * args.threads,
+        'sqlite_locked': sum(result['counters'].get('sqlite.locked', 0) for result in results),
+        'slow_queries': sum(result['counters'].get('sqlite.slow_queries', 0) for result in results),
+        'sql_errors': sum(result['sql_errors'] for result in results),
+        'operations': {operation: {
+            'count': len(values),
+            'errors': errors.get(operation, 0),
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'throughput': len(values) / elapsed,
+        } for operation, values in sorted(latencies.items())},
+    }
+
+
+def print_scenario(name, result, previous=None):
+    if 'unavailable' in result:
+        print(f"\ncenário {name}: indisponível ({result['unavailable']})")
+        return
+    print(f"\ncenário {name}: {result['sessions']} sessões em {result['elapsed']:.1f} s, "
+          f"bloqueios {result['sqlite_locked']}, erros SQL {result['sql_errors']}, "
+          f"consultas lentas {result['slow_queries']}")
+    print(f"{'operação':<32} {'chamadas':>9} {'erros':>6} {'p50 (ms)':>9} {'p99 (ms)':>9} {'ops/s':>8}")
+    before = (previous or {}).get('operations', {})
+    for operation, stats in result['operations'].items():
+        line = (f"{operation:<32} {stats['count']:9d} {stats['errors']:6d} {stats['p50_ms']:9.1f} "
+                f"{stats['p99_ms']:9.1f} {stats['throughput']:8.1f}")
+        old = before.get(operation)
+        if old and old['p99_ms']:
+            line += f"  p99 {(stats['p99_ms'] / old['p99_ms'] - 1) * 100:+.0f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", choices=("app", "db"), default=["app", "db"])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="sessões por processo")
+    parser.add_argument("--turns", type=int, default=5, help="turnos de chat por sessão")
+    parser.add_argument("--latency", type=float, default=0.3, help="segundos até o primeiro token no servidor")
+    parser.add_argument("--tokens-per-second", type=float, default=50)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output", default=None, help="arquivo JSON com o resultado desta execução")
+    parser.add_argument("--compare", default=None, help="JSON de uma execução anterior")
+    args = parser.parse_args()
+
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f).get('scenarios', {})
+
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    token_delay = 1 / args.tokens_per_second if args.tokens_per_second else 0
+    with fake_openai.FakeOpenAIServer(latency=args.latency, token_delay=token_delay, tokens=args.tokens,
+                                      run_duration=args.latency * 2, error_rate=args.error_rate,
+                                      seed=42) as server:
+        # Herdadas pelos processos filhos; llm_client usa OPENAI_BASE_URL quando base_url é None
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ["OPENAI_API_KEY"] = "fake"
+        os.chdir(workdir)
+        import database as db
+        db.ensure_database()
+        print(f"{args.processes} processos x {args.threads} sessões, {args.turns} turnos, "
+              f"TTFT {args.latency * 1000:.0f} ms, {args.tokens_per_second:g} tokens/s, banco em {workdir}")
+        scenarios = {}
+        for scenario in args.scenarios:
+            scenarios[scenario] = run_scenario(scenario, args, workdir)
+            print_scenario(scenario, scenarios[scenario], previous.get(scenario))
+        server_stats = server.stats()
+
+    report = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'config': vars(args),
+        'fake_openai': server_stats,
+        'scenarios': scenarios,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nResultado gravado em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
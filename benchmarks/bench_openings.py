@@ -0,0 +1,113 @@
+# benchmarks/bench_openings.py
+"""Primeira resposta de sessões novas: abertura gerada pelo LLM x abertura pré-gerada.
+
+Usa o servidor de fake_openai.py e simula N sessões novas:
+  - ao vivo: cria a thread e espera o primeiro token do run (caminho anterior)
+  - cache:   OpeningCache.opening_for + thread criada já com a abertura
+
+Depois mede a taxa de acerto com chegadas contínuas de sessões, trocando as
+instruções do Assistant no meio da execução: o cache percebe a versão nova (após
+--version-ttl segundos), gera o lote novo em segundo plano e volta a acertar.
+
+Uso: python benchmarks/bench_openings.py [--sessions 50] [--latency 0.05] [--run-duration 0.5]
+     [--variants 3] [--version-ttl 0.5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+import fake_openai
+import llm_client
+import scenario_openings
+
+ASSISTANT_ID = "asst_fake"
+FIRST_PROMPT = "Olá, quero começar a simulação."
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def report(label, values):
+    print(f"  {label:<10} p50 {percentile(values, 0.50) * 1000:8.1f} ms  p99 {percentile(values, 0.99) * 1000:8.1f} ms  "
+          f"máx {max(values) * 1000:8.1f} ms")
+
+
+# Os dois caminhos medem o mesmo intervalo: do início da sessão até a primeira resposta
+def live_first_response(client, username):
+    started = time.perf_counter()
+    thread_id = db.get_or_create_thread_id(username, client)
+    for _ in client.stream_reply(thread_id, ASSISTANT_ID, FIRST_PROMPT):
+        return time.perf_counter() - started
+    return time.perf_counter() - started
+
+
+def cached_first_response(client, cache, username):
+    started = time.perf_counter()
+    opening = cache.opening_for(username) if db.get_thread_context(username) is None else None
+    seed = [{"role": "assistant", "content": opening}] if opening else None
+    _, created = db.get_or_create_thread(username, client, messages=seed)
+    if opening is None or not created:
+        return None
+    db.save_conversation(username, "assistant", opening)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--run-duration", type=float, default=0.5)
+    parser.add_argument("--variants", type=int, default=3)
+    parser.add_argument("--version-ttl", type=float, default=0.5)
+    parser.add_argument("--interval", type=float, default=0.05, help="intervalo entre sessões na fase de taxa de acerto")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_openings_"))
+    db.DB_NAME = os.path.join(os.getcwd(), "bench.db")
+    db.ensure_database()
+
+    server = fake_openai.FakeOpenAIServer(latency=args.latency, run_duration=args.run_duration, seed=7)
+    server.start()
+    client = llm_client.LLMClient(api_key="fake", base_url=server.base_url)
+    try:
+        cache = scenario_openings.OpeningCache(client, ASSISTANT_ID, variants=args.variants,
+                                               version_ttl=args.version_ttl)
+        started = time.perf_counter()
+        cache.warm()
+        print(f"Pré-geração de {args.variants} aberturas: {time.perf_counter() - started:.2f} s\n")
+
+        print(f"Primeira resposta de {args.sessions} sessões novas")
+        live = [live_first_response(client, f"ao_vivo_{i}") for i in range(args.sessions)]
+        cached = [cached_first_response(client, cache, f"cache_{i}") for i in range(args.sessions)]
+        report("ao vivo", live)
+        report("cache", [value for value in cached if value is not None])
+        print(f"  {cache.metrics()['hits']}/{args.sessions} sessões atendidas pelo cache\n")
+
+        print(f"Taxa de acerto com troca de versão do Assistant no meio de {args.sessions * 2} sessões")
+        before = cache.metrics()
+        for i in range(args.sessions * 2):
+            if i == args.sessions:
+                server.assistant_instructions += " (revisão 2)"
+            cached_first_response(client, cache, f"versao_{i}")
+            time.sleep(args.interval)
+        cache.wait()
+        after = cache.metrics()
+        hits = after['hits'] - before['hits']
+        misses = after['misses'] - before['misses']
+        print(f"  acertos {hits}, falhas {misses}, taxa {hits / (hits + misses) * 100:.1f}%, "
+              f"lotes gerados {after['refreshes'] - before['refreshes']} (versão final {after['version']})")
+        cache.close()
+    finally:
+        client.close()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/bench_password_hashing.py
+"""Benchmark de logins por segundo com hash lento em diferentes custos.
+
+Para cada custo cria N usuários, faz logins concorrentes com authenticate_user
+(verificação completa no pool de hash) e repete os mesmos logins, que passam a
+ser servidos pelo cache de sessões verificadas. Ao final troca o custo e mede o
+primeiro login, que regrava o hash (rehash-on-login).
+
+Uso: python benchmarks/bench_password_hashing.py [--users 40] [--threads 8] [--scheme scrypt]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+import password_hashing
+
+COSTS = {
+    'bcrypt': [{'bcrypt_rounds': rounds} for rounds in (10, 11, 12)],
+    'scrypt': [{'scrypt_n': 2 ** exponent} for exponent in (13, 14, 15)],
+}
+
+
+def login_all(usernames, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda username: db.authenticate_user(username, "senha123")[0], usernames))
+    elapsed = time.perf_counter() - start
+    return sum(results), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--threads", type=int, default=8, help="sessões fazendo login ao mesmo tempo")
+    parser.add_argument("--workers", type=int, default=password_hashing.PASSWORD_HASH_MAX_WORKERS,
+                        help="threads do pool de hash")
+    parser.add_argument("--scheme", choices=password_hashing.SCHEMES, default=password_hashing.default_scheme())
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_passwords_"))
+    db.DB_NAME = os.path.join(os.getcwd(), "bench.db")
+    db.ensure_database()
+
+    print(f"esquema {args.scheme}, {args.users} usuários, {args.threads} sessões, {args.workers} workers de hash")
+    print(f"\n{'custo':<18} {'hash (ms)':>10} {'logins/s':>10} {'cache/s':>12} {'ok':>5}")
+    costs = COSTS[args.scheme]
+    for i, cost in enumerate(costs):
+        hasher = password_hashing.configure_password_hasher(scheme=args.scheme, max_workers=args.workers, **cost)
+        start = time.perf_counter()
+        hasher.hash("senha123")
+        hash_ms = (time.perf_counter() - start) * 1000
+        prefix = f"custo{i}_"
+        db.create_users_bulk({'username': f"{prefix}{j:04d}", 'email': f"{prefix}{j:04d}@empresa.com",
+                              'password': 'senha123'} for j in range(args.users))
+        usernames = [f"{prefix}{j:04d}" for j in range(args.users)]
+        ok, cold = login_all(usernames, args.threads)
+        _, warm = login_all(usernames, args.threads)
+        label = ", ".join(f"{key}={value}" for key, value in cost.items())
+        print(f"{label:<18} {hash_ms:10.1f} {args.users / cold:10.1f} {args.users / warm:12.0f} {ok:5d}")
+
+    # Custo maior que o dos hashes gravados: o primeiro login regrava, o segundo já não precisa
+    cost = costs[0]
+    upgraded = {key: value * 2 if key == 'scrypt_n' else value + 1 for key, value in cost.items()}
+    password_hashing.configure_password_hasher(scheme=args.scheme, max_workers=args.workers, **upgraded)
+    db.invalidate_verified_sessions()
+    usernames = [f"custo0_{j:04d}" for j in range(args.users)]
+    _, rehash = login_all(usernames, args.threads)
+    db.invalidate_verified_sessions()
+    _, after = login_all(usernames, args.threads)
+    print(f"\nrehash-on-login ({cost} -> {upgraded}): {args.users / rehash:8.1f} logins/s; "
+          f"depois do rehash: {args.users / after:8.1f} logins/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/bench_retention.py
+"""Benchmark do arquivamento: vazão, tamanho do banco e custo do health check.
+
+Gera N meses de conversas e avaliações antigas, mede database_health_check
+(contadores de table_counts) contra os COUNT(*) que ele fazia antes, arquiva tudo
+com retention.run_maintenance e compara o tamanho do banco principal e do
+arquivo morto. Ao final confere que user_stats continua igual a user_actions
+somado à base arquivada.
+
+Uso: python benchmarks/bench_retention.py [--users 50] [--months 12] [--rows-per-month 2000] [--batch-size 5000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+import retention
+
+CONTENT = "Reuni a equipe, revisei o cronograma e renegociei o prazo de entrega com o cliente. " * 4
+
+
+def populate(users, months, rows_per_month):
+    shards = {}
+    for month in range(months):
+        year, number = 2020 + month // 12, month % 12 + 1
+        for i in range(rows_per_month):
+            username = f"trainee_{i % users:03d}"
+            timestamp = f"{year}-{number:02d}-{i % 28 + 1:02d} 10:{i % 60:02d}:00"
+            outcome = 'acerto' if i % 3 else 'erro'
+            shards.setdefault(db.get_connection_manager(username), []).append(
+                (username, timestamp, f'{{"resultado": "{outcome}"}}', outcome))
+    for manager, rows in shards.items():
+        with manager.transaction() as cursor:
+            cursor.executemany("INSERT INTO conversations (username, role, content, timestamp) VALUES (?, 'user', ?, ?)",
+                               [(username, CONTENT, timestamp) for username, timestamp, _, _ in rows])
+            cursor.executemany('''
+                INSERT INTO user_actions (username, action_type, action_data, outcome, timestamp)
+                VALUES (?, 'avaliacao', ?, ?, ?)
+            ''', [(username, data, outcome, timestamp) for username, timestamp, data, outcome in rows])
+
+
+def time_calls(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def count_rows():
+    for manager in db.get_shard_managers():
+        with manager.cursor() as cursor:
+            for table in ('users', 'conversations', 'user_actions'):
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                cursor.fetchone()
+
+
+def sizes():
+    paths = db.get_storage_backend().paths
+    main = sum(os.path.getsize(path) for db_path in paths for path in (db_path, f"{db_path}-wal")
+               if os.path.exists(path))
+    archived = sum(os.path.getsize(retention.archive_path(month, db_path))
+                   for db_path in paths for month in retention.archive_months(db_path))
+    return main / 2 ** 20, archived / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--rows-per-month", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=retention.ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_retention_"))
+    db.DB_NAME = os.path.join(os.getcwd(), "bench.db")
+    db.ensure_database()
+    populate(args.users, args.months, args.rows_per_month)
+    rows = args.months * args.rows_per_month
+
+    print(f"{args.months} meses x {args.rows_per_month} linhas por tabela, {args.users} usuários")
+    print(f"health check (table_counts): {time_calls(db.database_health_check, args.repeat):8.2f} ms")
+    print(f"COUNT(*) nas três tabelas:   {time_calls(count_rows, args.repeat):8.2f} ms")
+
+    main_before, _ = sizes()
+    report = retention.run_maintenance(days=30, batch_size=args.batch_size)
+    archived = report['archive']
+    main_after, archive_size = sizes()
+    moved = archived['conversations'] + archived['user_actions']
+    print(f"\narquivadas {moved} linhas ({2 * rows} esperadas) em {archived['elapsed']:.2f} s: "
+          f"{moved / archived['elapsed']:,.0f} linhas/s, lotes de {args.batch_size}")
+    print(f"banco principal: {main_before:.1f} MB -> {main_after:.1f} MB "
+          f"({report['vacuum']['freed_pages']} páginas liberadas); arquivo morto: {archive_size:.1f} MB")
+
+    start = time.perf_counter()
+    history = db.get_user_history_page("trainee_000", limit=50)
+    print(f"histórico vindo do arquivo morto: {len(history['messages'])} mensagens em "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+    issues = db.check_user_stats_consistency()
+    print("user_stats consistente" if not issues else f"❌ {len(issues)} divergências em user_stats")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/bench_search.py
+"""Benchmark da busca textual: índice FTS5 (migração 7) contra varredura LIKE.
+
+Gera N mensagens sintéticas em conversations e compara, para alguns termos,
+o tempo de `LIKE '%termo%'` com o de database.search_conversations (bm25 + snippet).
+
+Uso: python benchmarks/bench_search.py [--rows 1000000] [--users 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+import storage
+
+WORDS = [
+    "equipe", "prazo", "cliente", "orçamento", "reunião", "conflito", "meta", "projeto",
+    "feedback", "liderança", "entrega", "qualidade", "risco", "contrato", "fornecedor",
+    "treinamento", "demissão", "promoção", "estratégia", "indicador", "processo", "cultura",
+]
+# Vocabulário de fundo: os termos de negócio acima aparecem em poucas mensagens
+FILLER = [f"palavra{i}" for i in range(5000)]
+TERMS = ["fornecedor", "demissao", "feedback liderança", "contrato risco prazo"]
+
+
+def random_message(rnd):
+    words = rnd.choices(FILLER, k=rnd.randint(8, 40))
+    for _ in range(rnd.randint(0, 2)):
+        words.insert(rnd.randrange(len(words) + 1), rnd.choice(WORDS))
+    return " ".join(words)
+
+
+def populate(conn, rows, users):
+    rnd = random.Random(42)
+    names = [f"user{i:05d}" for i in range(users)]
+    batch = 50_000
+    for start in range(0, rows, batch):
+        n = min(batch, rows - start)
+        conn.executemany(
+            "INSERT INTO conversations (username, role, content, timestamp) "
+            "VALUES (?, ?, ?, datetime('2024-01-01', ? || ' seconds'))",
+            [(rnd.choice(names), rnd.choice(['user', 'assistant']),
+              random_message(rnd), start + i) for i in range(n)])
+    conn.commit()
+    return names
+
+
+def timed(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_search_"))
+    # Um único arquivo: o benchmark popula e consulta pela conexão direta
+    db.configure_storage(storage.SQLiteBackend(os.path.join(os.getcwd(), "bench.db")))
+    db.ensure_database()
+    conn = db.get_connection_manager().get_connection()
+
+    print(f"Populando {args.rows} mensagens (triggers mantêm o índice FTS)...")
+    start = time.perf_counter()
+    names = populate(conn, args.rows, args.users)
+    print(f"  {time.perf_counter() - start:.1f} s")
+    target = names[len(names) // 2]
+
+    print(f"\n{'termo':<24} {'filtro':<10} {'LIKE (ms)':>10} {'FTS5 (ms)':>10} {'LIKE n':>8}")
+    for term in TERMS:
+        for username in (None, target):
+            like_sql = "SELECT id FROM conversations WHERE content LIKE ?"
+            like_params = [f"%{term}%"]
+            if username:
+                like_sql += " AND username = ?"
+                like_params.append(username)
+            # Mesmo contrato da busca: as 20 melhores, não as 20 primeiras encontradas
+            like_sql += " ORDER BY timestamp DESC, id DESC LIMIT 20"
+            like_ms, like_rows = timed(lambda: conn.execute(like_sql, like_params).fetchall(), args.repeats)
+            fts_ms, _ = timed(lambda: db.search_conversations(term, username=username, limit=20), args.repeats)
+            print(f"{term:<24} {'usuário' if username else 'todos':<10} "
+                  f"{like_ms * 1000:10.2f} {fts_ms * 1000:10.2f} {len(like_rows):8d}")
+
+
+if __name__ == "__main__":
+    main()
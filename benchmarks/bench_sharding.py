@@ -0,0 +1,124 @@
+# benchmarks/bench_sharding.py
+"""Benchmark de vazão de escrita por número de shards.
+
+P processos x T threads gravam ao mesmo tempo, cada thread como um usuário
+diferente, com save_conversation e save_user_action síncronos (um commit por
+escrita, o caminho que disputa o lock de escrita do SQLite). Repete com 1, 2, 4...
+shards e reporta escritas/s, p99 e quantas vezes o banco estava bloqueado.
+
+Uso: python benchmarks/bench_sharding.py [--shards 1 2 4 8] [--processes 4] [--threads 4]
+     [--writes 200] [--routing hash] [--synchronous NORMAL]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+CONTENT = "Chamo a equipe para entender o atraso e renegocio o prazo com o cliente."
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run_worker(base_path, shards, routing, worker, threads, writes, start_at):
+    """Grava `writes` linhas por thread; retorna latências, falhas e bloqueios do processo."""
+    import threading
+    import database as db
+    import instrumentation
+    import storage
+    db.configure_storage(storage.create_backend(base_path, shards, routing))
+    db.ensure_database()
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def session(index):
+        # Com routing='cohort', cada processo é uma turma
+        username = f"turma{worker:02d}.trainee{index:03d}"
+        local, failed = [], 0
+        for i in range(writes):
+            started = time.perf_counter()
+            if i % 2:
+                ok = db.save_user_action(username, "decisao", CONTENT, "acerto")
+            else:
+                ok = db.save_conversation(username, "user", CONTENT)
+            local.append(time.perf_counter() - started)
+            failed += not ok
+        with lock:
+            latencies.extend(local)
+            failures.append(failed)
+
+    # Todos os processos começam juntos, depois de abrir os bancos
+    time.sleep(max(0.0, start_at - time.time()))
+    sessions = [threading.Thread(target=session, args=(i,)) for i in range(threads)]
+    for thread in sessions:
+        thread.start()
+    for thread in sessions:
+        thread.join()
+    return {
+        'latencies': latencies,
+        'failed': sum(failures),
+        'locked': instrumentation.snapshot()['counters'].get('sqlite.locked', 0),
+        'finished': time.time(),
+    }
+
+
+def run(shards, args):
+    workdir = tempfile.mkdtemp(prefix=f"bench_shards_{shards}_")
+    base_path = os.path.join(workdir, "bench.db")
+    context = multiprocessing.get_context("spawn")
+    start_at = time.time() + 2 + args.processes * 0.5
+    jobs = [(base_path, shards, args.routing, worker, args.threads, args.writes, start_at)
+            for worker in range(args.processes)]
+    with context.Pool(args.processes) as pool:
+        results = pool.starmap(run_worker, jobs)
+    elapsed = max(result['finished'] for result in results) - start_at
+    latencies = [value for result in results for value in result['latencies']]
+    return {
+        'writes': len(latencies),
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'failed': sum(result['failed'] for result in results),
+        'locked': sum(result['locked'] for result in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4, help="usuários gravando por processo")
+    parser.add_argument("--writes", type=int, default=200, help="escritas por usuário")
+    parser.add_argument("--routing", choices=("hash", "cohort"), default="hash")
+    parser.add_argument("--synchronous", default="NORMAL", help="PRAGMA synchronous (FULL = fsync por commit)")
+    args = parser.parse_args()
+    # Herdados pelos processos filhos, lidos por connection_manager e instrumentation na importação
+    os.environ["SQLITE_SYNCHRONOUS"] = args.synchronous
+    os.environ.setdefault("SLOW_QUERY_MS", "1000")
+
+    print(f"{args.processes} processos x {args.threads} usuários, {args.writes} escritas por usuário, "
+          f"roteamento {args.routing}, synchronous={args.synchronous}")
+    print(f"\n{'shards':>6} {'escritas':>9} {'tempo (s)':>10} {'escritas/s':>11} {'p50 (ms)':>9} "
+          f"{'p99 (ms)':>9} {'bloqueios':>10} {'falhas':>7}")
+    baseline = None
+    for shards in args.shards:
+        result = run(shards, args)
+        baseline = baseline or result['throughput']
+        print(f"{shards:6d} {result['writes']:9d} {result['elapsed']:10.2f} {result['throughput']:11.0f} "
+              f"{result['p50_ms']:9.2f} {result['p99_ms']:9.2f} {result['locked']:10d} {result['failed']:7d}"
+              f"  x{result['throughput'] / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/bench_startup.py
+"""Benchmark de inicialização: import a frio e primeira renderização do app.
+
+Cada medição roda num interpretador novo (import a frio de verdade) dentro de
+um diretório temporário, para não tocar no banco real.
+
+Uso: python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {repo!r})
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+FIRST_RENDER_SNIPPET = """
+import sys, time
+sys.path.insert(0, {repo!r})
+from streamlit.testing.v1 import AppTest
+start = time.perf_counter()
+app = AppTest.from_file({script!r}, default_timeout=60)
+app.run()
+print(time.perf_counter() - start)
+"""
+
+
+def run_snippet(code):
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = dict(os.environ, OPENAI_API_KEY="")
+    out = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env,
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def report(label, samples):
+    print(f"{label:<34} mediana {statistics.median(samples) * 1000:8.1f} ms  "
+          f"mín {min(samples) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for module in ("database", "rpg_gestor"):
+        samples = [run_snippet(IMPORT_SNIPPET.format(repo=REPO, module=module)) for _ in range(args.runs)]
+        report(f"import a frio de {module}", samples)
+    try:
+        samples = [run_snippet(FIRST_RENDER_SNIPPET.format(repo=REPO, script=os.path.join(REPO, "rpg_gestor.py")))
+                   for _ in range(args.runs)]
+        report("primeira renderização (AppTest)", samples)
+    except subprocess.CalledProcessError as e:
+        print(f"Primeira renderização indisponível: {e.stderr.strip().splitlines()[-1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/bench_streaming.py
+"""Benchmark do streaming de respostas com um stream falso que reproduz deltas gravados.
+
+Compara o gerador antigo (um yield + time.sleep(0.01) por delta) com
+streaming.coalesce_deltas. A gravação é uma lista JSON de [atraso_s, texto];
+sem --recording é gerada uma resposta sintética de --tokens deltas.
+
+Uso: python benchmarks/bench_streaming.py [--tokens 2000] [--render-ms 1.0]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streaming
+
+
+def synthetic_recording(tokens, seed=7):
+    rnd = random.Random(seed)
+    words = ["liderança", " equipe", " decisão", " conflito", " feedback", " meta", ",", ".", " o", " a"]
+    return [[rnd.uniform(0.0005, 0.003), rnd.choice(words)] for _ in range(tokens)]
+
+
+def fake_text_deltas(recording):
+    for delay, text in recording:
+        time.sleep(delay)
+        yield text
+
+
+def legacy_generator(recording):
+    for text in fake_text_deltas(recording):
+        yield text
+        time.sleep(0.01)
+
+
+def consume(chunks, render_ms):
+    # Simula o custo de re-render do st.write_stream a cada bloco recebido
+    start = time.perf_counter()
+    first = None
+    yields = 0
+    text = []
+    for chunk in chunks:
+        if first is None:
+            first = time.perf_counter() - start
+        yields += 1
+        text.append(chunk)
+        time.sleep(render_ms / 1000)
+    return first, time.perf_counter() - start, yields, "".join(text)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--recording", help="arquivo JSON com [[atraso_s, texto], ...]")
+    parser.add_argument("--render-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.recording:
+        with open(args.recording, encoding="utf-8") as f:
+            recording = json.load(f)
+    else:
+        recording = synthetic_recording(args.tokens)
+    model_time = sum(delay for delay, _ in recording)
+    print(f"{len(recording)} deltas, {model_time:.2f} s de latência do 'modelo'\n")
+
+    ttft, total, yields, legacy_text = consume(legacy_generator(recording), args.render_ms)
+    print(f"{'antigo (sleep por delta)':<28} TTFT {ttft * 1000:7.1f} ms  total {total:6.2f} s  {yields:5d} renders")
+
+    stats = streaming.StreamStats()
+    ttft, total, yields, new_text = consume(
+        streaming.coalesce_deltas(fake_text_deltas(recording), stats=stats), args.render_ms)
+    print(f"{'coalesce_deltas':<28} TTFT {ttft * 1000:7.1f} ms  total {total:6.2f} s  {yields:5d} renders")
+    assert new_text == legacy_text
+    print(f"\nStreamStats: {stats.as_dict()}")
+
+
+if __name__ == "__main__":
+    main()
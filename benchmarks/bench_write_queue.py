@@ -0,0 +1,73 @@
+# benchmarks/bench_write_queue.py
+"""Benchmark da fila write-behind: latência vista pelo chamador e commits por mensagem.
+
+Simula N "turnos" de chat (duas mensagens por turno) em T threads, primeiro com
+save_conversation síncrono e depois com add_message_to_history (fila).
+
+Uso: python benchmarks/bench_write_queue.py [--turns 2000] [--threads 8]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run(label, write, turns, threads):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(worker_id):
+        local = []
+        for i in range(turns // threads):
+            start = time.perf_counter()
+            write(f"user{worker_id}", "user", f"pergunta {i}")
+            write(f"user{worker_id}", "assistant", f"resposta {i}")
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1e6
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1e6
+    print(f"{label:<32} p50 {p50:8.1f} µs  p99 {p99:8.1f} µs  total {elapsed:6.2f} s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_wq_"))
+    import database as db
+    db.DB_NAME = os.path.abspath("bench.db")
+    db.ensure_database()
+
+    print(f"{args.turns} turnos, {args.threads} threads (2 mensagens por turno)\n")
+    run("síncrono (1 commit/mensagem)", db.save_conversation, args.turns, args.threads)
+    run("write-behind (enfileirar)", db.add_message_to_history, args.turns, args.threads)
+    start = time.perf_counter()
+    db.flush_pending_writes()
+    print(f"{'drenagem da fila':<32} {time.perf_counter() - start:.3f} s")
+
+    metrics = db.get_write_queue_metrics()
+    print(f"\nMensagens gravadas: {metrics['rows_written']} em {metrics['batches']} commits "
+          f"({metrics['rows_written'] / max(metrics['batches'], 1):.1f} mensagens/commit)")
+    print(f"Flush: média {metrics['avg_flush_ms']:.2f} ms, máx {metrics['max_flush_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
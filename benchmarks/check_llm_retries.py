@@ -0,0 +1,107 @@
+# benchmarks/check_llm_retries.py
+"""Verifica o retry do llm_client contra o servidor de fake_openai.py (sem rede).
+
+  - POST que cria recurso e expira depois de enviado: não é repetido (1 requisição)
+  - GET idempotente que expira: é repetido até OPENAI_MAX_RETRIES
+  - POST que falha ao conectar (nada enviado): é repetido e passa quando o servidor sobe
+
+Sai com código 1 se alguma verificação falhar.
+
+Uso: python benchmarks/check_llm_retries.py
+"""
+import asyncio
+import os
+import socket
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fake_openai
+import llm_client
+
+ASSISTANT_ID = "asst_fake"
+MAX_RETRIES = 3
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_client(base_url, timeout=5.0, max_retries=MAX_RETRIES, backoff_base=0.01, backoff_max=0.05):
+    return llm_client.LLMClient(api_key="fake", base_url=base_url, timeout=timeout,
+                                max_retries=max_retries, backoff_base=backoff_base, backoff_max=backoff_max)
+
+
+def check(label, ok, detail):
+    print(f"{'OK  ' if ok else 'FALHA'} {label}: {detail}")
+    return ok
+
+
+def check_timeout_after_send():
+    results = []
+    # O servidor lê a requisição e só responde depois do timeout do cliente
+    with fake_openai.FakeOpenAIServer(latency=0, stall=0.5) as server:
+        client = make_client(server.base_url, timeout=0.2)
+        try:
+            for label, call, route, expected in (
+                ("threads.create com timeout", lambda: client.create_thread(), "POST /v1/threads", 1),
+                ("messages.create com timeout",
+                 lambda: client.run(client.aadd_message("thread_1", "oi")), "POST /v1/threads/thread_1/messages", 1),
+                ("assistants.retrieve com timeout", lambda: client.retrieve_assistant(ASSISTANT_ID),
+                 f"GET /v1/assistants/{ASSISTANT_ID}", 1 + MAX_RETRIES),
+            ):
+                try:
+                    call()
+                    error = "nenhum"
+                except Exception as e:
+                    error = type(e).__name__
+                sent = server.stats()['by_route'].get(route, 0)
+                results.append(check(label, sent == expected and error == "APITimeoutError",
+                                     f"{sent} requisições (esperado {expected}), erro {error}"))
+        finally:
+            client.close()
+    return all(results)
+
+
+def check_connect_error_before_send():
+    port = free_port()
+    servers = []
+
+    def start_server():
+        # O construtor já escuta na porta: até aqui as conexões são recusadas
+        server = fake_openai.FakeOpenAIServer(port=port, latency=0)
+        server.start()
+        servers.append(server)
+
+    starter = threading.Timer(0.3, start_server)
+    client = make_client(f"http://127.0.0.1:{port}/v1", max_retries=10, backoff_base=0.2, backoff_max=1.0)
+    try:
+        client.run(asyncio.sleep(0))  # sobe o loop e o cliente antes de contar o tempo
+        starter.start()
+        try:
+            thread_id = client.create_thread()
+        except Exception as e:
+            thread_id = None
+            print(f"      erro: {type(e).__name__}: {e}")
+        starter.join()
+        sent = servers[0].stats()['by_route'].get("POST /v1/threads", 0) if servers else 0
+        retries = client.metrics()['retries']
+        return check("threads.create com falha de conexão", thread_id is not None and sent == 1 and retries >= 1,
+                     f"{retries} repetições, {sent} requisição no servidor, thread {thread_id}")
+    finally:
+        client.close()
+        for server in servers:
+            server.stop()
+
+
+def main():
+    ok = check_timeout_after_send()
+    ok = check_connect_error_before_send() and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# connection_manager.py
+import sqlite3
+import threading
+import os
+import weakref
+from contextlib import contextmanager
+
+import instrumentation
+
+# Valores padrão dos PRAGMAs; podem ser sobrescritos por variáveis de ambiente
+DEFAULT_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+DEFAULT_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+DEFAULT_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-16000"))  # negativo = KiB
+DEFAULT_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+DEFAULT_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+# Só tem efeito em bancos novos (antes da primeira tabela); ver retention.incremental_vacuum
+DEFAULT_AUTO_VACUUM = os.getenv("SQLITE_AUTO_VACUUM", "INCREMENTAL")
+
+
+class _ThreadConnection:
+    """Guardado no threading.local: quando a thread termina ele é coletado e a conexão fechada."""
+
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+
+
+class ConnectionManager:
+    """Mantém uma conexão SQLite de longa duração por thread, já configurada com WAL e PRAGMAs.
+
+    A conexão vive enquanto a thread viver: threads curtas (reruns do Streamlit, workers
+    de pools) não acumulam conexões nem descritores do WAL.
+    """
+
+    def __init__(self, db_path, busy_timeout_ms=None, synchronous=None,
+                 cache_size=None, mmap_size=None, journal_mode=None, auto_vacuum=None):
+        self.db_path = db_path
+        self.busy_timeout_ms = DEFAULT_BUSY_TIMEOUT_MS if busy_timeout_ms is None else busy_timeout_ms
+        self.synchronous = synchronous or DEFAULT_SYNCHRONOUS
+        self.cache_size = DEFAULT_CACHE_SIZE if cache_size is None else cache_size
+        self.mmap_size = DEFAULT_MMAP_SIZE if mmap_size is None else mmap_size
+        self.journal_mode = journal_mode or DEFAULT_JOURNAL_MODE
+        self.auto_vacuum = auto_vacuum or DEFAULT_AUTO_VACUUM
+        self._local = threading.local()
+        # Reentrante: um finalizador pode rodar enquanto a própria thread segura o lock
+        self._lock = threading.RLock()
+        self._connections = set()
+        self._generation = 0
+
+    def _connect(self):
+        # check_same_thread=False apenas para permitir close_all() de outra thread;
+        # cada conexão continua sendo usada somente pela thread que a criou
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000,
+                               check_same_thread=False)
+        cursor = conn.cursor()
+        # Precisa vir antes do journal_mode: o WAL grava o cabeçalho do arquivo
+        cursor.execute(f"PRAGMA auto_vacuum={self.auto_vacuum}")
+        cursor.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={self.synchronous}")
+        cursor.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        cursor.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+        return conn
+
+    def get_connection(self):
+        """Retorna a conexão da thread atual, criando-a na primeira chamada."""
+        holder = getattr(self._local, "holder", None)
+        if holder is not None and holder.generation == self._generation:
+            return holder.conn
+        conn = self._connect()
+        with self._lock:
+            self._connections.add(conn)
+            holder = _ThreadConnection(conn, self._generation)
+        # Fecha a conexão quando o threading.local da thread que terminou é descartado.
+        # O holder antigo é trocado fora do lock, pois o finalizador dele também usa o lock
+        weakref.finalize(holder, self._release, conn)
+        self._local.holder = holder
+        return conn
+
+    def _release(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+        conn.close()
+
+    def open_connections(self):
+        with self._lock:
+            return len(self._connections)
+
+    @contextmanager
+    def cursor(self):
+        """Cursor para leituras; não abre transação."""
+        cursor = self.get_connection().cursor()
+        try:
+            yield instrumentation.wrap_cursor(cursor)
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        """Cursor dentro de uma transação: commit ao sair, rollback em caso de erro."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            yield instrumentation.wrap_cursor(cursor)
+            with instrumentation.span("sqlite.commit"):
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def close_all(self):
+        """Fecha todas as conexões abertas (necessário antes de apagar o arquivo do banco)."""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+            self._generation += 1
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(db_path):
+    """Retorna o gerenciador compartilhado para o arquivo de banco informado."""
+    manager = _managers.get(db_path)
+    if manager is None:
+        with _managers_lock:
+            manager = _managers.get(db_path)
+            if manager is None:
+                manager = ConnectionManager(db_path)
+                _managers[db_path] = manager
+    return manager
@@ -1,96 +1,206 @@
 import sqlite3
-import hashlib
-import pandas as pd
-from datetime import datetime
+import csv
+import heapq
+import json
+import threading
+from datetime import datetime, timezone
 import os
+from connection_manager import get_manager
+from migrations import run_migrations
+from write_queue import create_write_queue
+import stats_rollup
+from thread_cache import ThreadIdCache
+from ttl_cache import TTLCache
+from password_hashing import get_password_hasher, VerifiedSessionCache
+from instrumentation import timed
+import storage
 
+# Com shards (DB_SHARDS > 1), nome base dos arquivos <banco>_shardNN.db
 DB_NAME = "leadership_simulator.db"
+USER_STATS_CACHE_TTL = float(os.getenv("USER_STATS_CACHE_TTL", "30"))
 
-def init_database():
+_initialized_paths = set()
+_init_lock = threading.Lock()
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_storage_backend():
+    """Backend de armazenamento atual (recriado se DB_NAME mudar)"""
+    global _backend
+    backend = _backend
+    if backend is None or backend.base_path != DB_NAME:
+        with _backend_lock:
+            if _backend is None or _backend.base_path != DB_NAME:
+                _backend = storage.create_backend(DB_NAME)
+            backend = _backend
+    return backend
+
+def configure_storage(backend):
+    """Troca o backend de armazenamento (p.ex. storage.ShardedSQLiteBackend) e aponta DB_NAME para ele"""
+    global _backend, DB_NAME
+    # Grava o pendente e descarta as filas: cada uma escreve no arquivo do backend anterior
+    with _write_queues_lock:
+        for write_queue in _write_queues.values():
+            write_queue.stop()
+        _write_queues.clear()
+    with _backend_lock:
+        _backend = backend
+        DB_NAME = backend.base_path
+    _thread_cache.clear()
+    invalidate_user_stats()
+    invalidate_verified_sessions()
+    return backend
+
+def get_connection_manager(username=None):
+    """Gerenciador de conexões (uma conexão persistente por thread) do shard do usuário.
+
+    Sem username, o do shard principal (o único, sem shards), onde ficam os dados globais.
+    """
+    backend = get_storage_backend()
+    path = backend.path_for(username) if username is not None else backend.paths[0]
+    if path not in _initialized_paths:
+        ensure_database()
+    return get_manager(path)
+
+def get_shard_managers():
+    """Gerenciadores de todos os shards, na ordem dos arquivos (um só, sem shards)"""
+    backend = get_storage_backend()
+    if any(path not in _initialized_paths for path in backend.paths):
+        ensure_database()
+    return [get_manager(path) for path in backend.paths]
+
+def _group_by_shard(items, username_of):
+    """{manager: [itens]} na ordem dos shards"""
+    backend = get_storage_backend()
+    grouped = {}
+    for item in items:
+        grouped.setdefault(backend.shard_index(username_of(item)), []).append(item)
+    managers = get_shard_managers()
+    return {managers[index]: grouped[index] for index in sorted(grouped)}
+
+def ensure_database():
+    """Inicializa o banco (todos os shards) no primeiro uso: uma vez por processo, protegido por lock"""
+    backend = get_storage_backend()
+    pending = [path for path in backend.paths if path not in _initialized_paths]
+    if not pending:
+        return True
+    with _init_lock:
+        for db_path in pending:
+            if db_path in _initialized_paths:
+                continue
+            if not init_database(db_path, backend.id_offset(db_path)):
+                return False
+            _initialized_paths.add(db_path)
+        if backend.sharded:
+            _sync_user_emails(backend)
+        return True
+
+def _sync_user_emails(backend):
+    """Completa o índice global de e-mails (shard principal) com os usuários dos demais shards"""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                name TEXT,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_admin BOOLEAN DEFAULT FALSE
-            )
-        ''')
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [column[1] for column in cursor.fetchall()]
-        if 'name' not in columns:
-            cursor.execute("ALTER TABLE users ADD COLUMN name TEXT")
-            cursor.execute("UPDATE users SET name = username WHERE name IS NULL")
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (username) REFERENCES users (username)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_actions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                action_type TEXT NOT NULL,
-                action_data TEXT,
-                outcome TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (username) REFERENCES users (username)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_threads (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                thread_id TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (username) REFERENCES users (username)
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        primary = get_manager(backend.paths[0])
+        for path in backend.paths[1:]:
+            with get_manager(path).cursor() as cursor:
+                cursor.execute("SELECT email, username FROM users")
+                rows = cursor.fetchall()
+            if rows:
+                with primary.transaction() as cursor:
+                    cursor.executemany("INSERT OR IGNORE INTO user_emails (email, username) VALUES (?, ?)", rows)
+    except Exception as e:
+        print(f"Erro ao sincronizar índice de e-mails: {e}")
+
+def _reserve_emails(users):
+    """Reserva no índice global os e-mails de [(email, username)]; retorna os já ocupados (minúsculas).
+
+    Só usado com shards: a reserva é uma transação no shard principal, feita antes do
+    INSERT no shard do usuário, então cadastros simultâneos com o mesmo e-mail em
+    shards diferentes não passam os dois.
+    """
+    taken = set()
+    with get_connection_manager().transaction() as cursor:
+        for email, username in users:
+            cursor.execute("INSERT OR IGNORE INTO user_emails (email, username) VALUES (?, ?)", (email, username))
+            if cursor.rowcount == 0:
+                cursor.execute("SELECT username FROM user_emails WHERE email = ?", (email,))
+                owner = cursor.fetchone()
+                # Reserva órfã do mesmo username (cadastro interrompido) pode ser reaproveitada
+                if owner is None or owner[0].lower() != username.lower():
+                    taken.add(email.lower())
+    return taken
+
+def _release_emails(users):
+    """Desfaz reservas de [(email, username)] cujo INSERT não aconteceu"""
+    try:
+        with get_connection_manager().transaction() as cursor:
+            cursor.executemany("DELETE FROM user_emails WHERE email = ? AND username = ?", list(users))
+    except Exception as e:
+        print(f"Erro ao liberar e-mails reservados: {e}")
+
+def _delete_user_emails(usernames):
+    with get_connection_manager().transaction() as cursor:
+        cursor.execute("DELETE FROM user_emails WHERE username IN (SELECT value FROM json_each(?))",
+                       (json.dumps(list(usernames)),))
+
+def _utc_timestamp():
+    # Mesmo formato de CURRENT_TIMESTAMP; capturado no momento do evento, não do flush
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def init_database(db_path=None, id_offset=0):
+    try:
+        # get_manager direto: get_connection_manager() chamaria ensure_database() de novo
+        conn = get_manager(db_path or DB_NAME).get_connection()
+        applied = run_migrations(conn)
+        storage.reserve_id_range(conn, id_offset)
+        if applied:
+            print(f"🔧 Migrações aplicadas: {applied}")
         print("✅ Banco de dados inicializado com sucesso")
+        return True
     except Exception as e:
         print(f"❌ Erro ao inicializar banco de dados: {e}")
+        return False
 
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hash lento (bcrypt/scrypt) calculado no pool de password_hashing"""
+    return get_password_hasher().hash(password)
 
+@timed()
 def check_user_exists(username=None, email=None):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        user_exists = False
-        email_exists = False
-        if username:
-            cursor.execute("SELECT COUNT(*) FROM users WHERE LOWER(username) = LOWER(?)", (username,))
-            user_exists = cursor.fetchone()[0] > 0
-        if email:
-            cursor.execute("SELECT COUNT(*) FROM users WHERE LOWER(email) = LOWER(?)", (email,))
-            email_exists = cursor.fetchone()[0] > 0
-        conn.close()
-        return user_exists, email_exists
+        # O username só pode estar no shard dele
+        with get_connection_manager(username or '').cursor() as cursor:
+            # COLLATE NOCASE usa os índices idx_users_*_nocase (LOWER() forçava varredura)
+            cursor.execute('''
+                SELECT
+                    EXISTS(SELECT 1 FROM users WHERE username = ? COLLATE NOCASE),
+                    EXISTS(SELECT 1 FROM users WHERE email = ? COLLATE NOCASE)
+            ''', (username or None, email or None))
+            user_exists, email_exists = cursor.fetchone()
+        if email and not email_exists and get_storage_backend().sharded:
+            # O e-mail é único no conjunto: o índice global do shard principal responde por todos
+            with get_connection_manager().cursor() as cursor:
+                cursor.execute("SELECT EXISTS(SELECT 1 FROM user_emails WHERE email = ?)", (email,))
+                email_exists = cursor.fetchone()[0]
+        return bool(user_exists), bool(email_exists)
     except Exception as e:
         print(f"Erro ao verificar usuário: {e}")
         return False, False
 
+def _validate_new_user(username, email, password):
+    """Mensagem de erro para os dados de um novo usuário, ou None se forem válidos"""
+    if not username or not email or not password:
+        return "Todos os campos são obrigatórios"
+    if len(username) < 3:
+        return "Nome de usuário deve ter pelo menos 3 caracteres"
+    if len(password) < 6:
+        return "Senha deve ter pelo menos 6 caracteres"
+    return None
+
+@timed()
 def create_user(username, email, password, is_admin=False, name=None):
     try:
-        if not username or not email or not password:
-            return False, "Todos os campos são obrigatórios"
-        if len(username) < 3:
-            return False, "Nome de usuário deve ter pelo menos 3 caracteres"
-        if len(password) < 6:
-            return False, "Senha deve ter pelo menos 6 caracteres"
+        error = _validate_new_user(username, email, password)
+        if error:
+            return False, error
         if not name:
             name = username
         user_exists, email_exists = check_user_exists(username, email)
@@ -100,15 +210,21 @@ def create_user(username, email, password, is_admin=False, name=None):
             return False, "Nome de usuário já existe"
         elif email_exists:
             return False, "E-mail já existe"
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
         password_hash = hash_password(password)
-        cursor.execute('''
-            INSERT INTO users (username, name, email, password_hash, is_admin)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (username, name, email, password_hash, is_admin))
-        conn.commit()
-        conn.close()
+        sharded = get_storage_backend().sharded
+        if sharded and _reserve_emails([(email, username)]):
+            return False, "E-mail já existe"
+        try:
+            with get_connection_manager(username).transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO users (username, name, email, password_hash, is_admin)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (username, name, email, password_hash, is_admin))
+        except Exception:
+            if sharded:
+                _release_emails([(email, username)])
+            raise
+        invalidate_user_stats(username)
         return True, "Usuário criado com sucesso"
     except sqlite3.IntegrityError as e:
         if "username" in str(e).lower():
@@ -121,23 +237,205 @@ def create_user(username, email, password, is_admin=False, name=None):
         print(f"Erro ao criar usuário: {e}")
         return False, "Erro interno do servidor"
 
-def authenticate_user(username, password):
-    return True, {
-        'username': username,
-        'name': username,
-        'email': '',
-        'is_admin': False
-    }
+def _find_existing_users(cursor, usernames, emails):
+    """Usernames e e-mails (em minúsculas) que já existem, numa única consulta por conjunto"""
+    cursor.execute('''
+        SELECT 'username', lower(j.value) FROM json_each(?) j
+        WHERE EXISTS (SELECT 1 FROM users u WHERE u.username = j.value COLLATE NOCASE)
+        UNION ALL
+        SELECT 'email', lower(j.value) FROM json_each(?) j
+        WHERE EXISTS (SELECT 1 FROM users u WHERE u.email = j.value COLLATE NOCASE)
+    ''', (json.dumps(usernames), json.dumps(emails)))
+    existing = {'username': set(), 'email': set()}
+    for kind, value in cursor.fetchall():
+        existing[kind].add(value)
+    return existing['username'], existing['email']
+
+def _conflict_error(candidate, existing_usernames, existing_emails):
+    """Mensagem de conflito de um candidato de create_users_bulk com usuários existentes, ou None"""
+    if candidate[1].lower() in existing_usernames:
+        return "Nome de usuário já existe"
+    if candidate[3].lower() in existing_emails:
+        return "E-mail já existe"
+    return None
+
+@timed(rows=lambda result: len(result['created']))
+def create_users_bulk(users, is_admin=False):
+    """Cria vários usuários numa única transação (executemany).
+
+    `users` é um iterável de dicts com username, email, password e, opcionalmente,
+    name e is_admin. Linhas inválidas, repetidas no próprio lote ou em conflito com
+    usuários existentes são reportadas e puladas; as demais são inseridas.
+    Retorna {'created': [usernames], 'errors': [{'row', 'username', 'error'}]}.
+    """
+    errors = []
+    candidates = []
+    seen_usernames = set()
+    seen_emails = set()
+    for row_number, user in enumerate(users, start=1):
+        username = (user.get('username') or '').strip()
+        email = (user.get('email') or '').strip()
+        password = user.get('password') or ''
+        error = _validate_new_user(username, email, password)
+        if not error and username.lower() in seen_usernames:
+            error = "Nome de usuário repetido no lote"
+        elif not error and email.lower() in seen_emails:
+            error = "E-mail repetido no lote"
+        if error:
+            errors.append({'row': row_number, 'username': username, 'error': error})
+            continue
+        seen_usernames.add(username.lower())
+        seen_emails.add(email.lower())
+        admin = user.get('is_admin', is_admin)
+        if isinstance(admin, str):
+            admin = admin.strip().lower() in ('1', 'true', 'sim', 's', 'yes')
+        candidates.append((row_number, username, (user.get('name') or '').strip() or username,
+                           email, password, bool(admin)))
+    created = []
+    if not candidates:
+        return {'created': created, 'errors': errors}
+    sharded = get_storage_backend().sharded
+    reserved = []
+    try:
+        # Conflitos com usuários existentes saem antes do hash lento: reimportar uma turma
+        # não gasta bcrypt com linhas que seriam rejeitadas
+        pending = []
+        for manager, group in _group_by_shard(candidates, lambda c: c[1]).items():
+            with manager.cursor() as cursor:
+                existing = _find_existing_users(cursor, [c[1] for c in group], [c[3] for c in group])
+            for candidate in group:
+                error = _conflict_error(candidate, *existing)
+                if error:
+                    errors.append({'row': candidate[0], 'username': candidate[1], 'error': error})
+                else:
+                    pending.append(candidate)
+        if sharded and pending:
+            # Com shards, o índice global do shard principal decide quem fica com cada e-mail
+            taken = _reserve_emails([(c[3], c[1]) for c in pending])
+            errors.extend({'row': c[0], 'username': c[1], 'error': "E-mail já existe"}
+                          for c in pending if c[3].lower() in taken)
+            pending = reserved = [c for c in pending if c[3].lower() not in taken]
+        # Hashes lentos só das linhas restantes, em paralelo e antes do BEGIN IMMEDIATE
+        # (não seguram o lock de escrita)
+        password_hashes = get_password_hasher().hash_many([c[4] for c in pending]) if pending else []
+    except Exception as e:
+        print(f"Erro ao criar usuários em lote: {e}")
+        if reserved:
+            _release_emails([(c[3], c[1]) for c in reserved])
+        flagged = {error['row'] for error in errors}
+        errors.extend({'row': c[0], 'username': c[1], 'error': "Erro interno do servidor"}
+                      for c in candidates if c[0] not in flagged)
+        errors.sort(key=lambda error: error['row'])
+        return {'created': created, 'errors': errors}
+    for manager, group in _group_by_shard(zip(pending, password_hashes), lambda item: item[0][1]).items():
+        try:
+            with manager.transaction() as cursor:
+                # IMMEDIATE: a nova verificação de conflitos e os INSERTs enxergam o mesmo estado
+                cursor.execute("BEGIN IMMEDIATE")
+                existing = _find_existing_users(cursor, [c[1] for c, _ in group], [c[3] for c, _ in group])
+                rows = []
+                for candidate, password_hash in group:
+                    error = _conflict_error(candidate, *existing)
+                    if error:
+                        errors.append({'row': candidate[0], 'username': candidate[1], 'error': error})
+                    else:
+                        row_number, username, name, email, _, admin = candidate
+                        rows.append((username, name, email, password_hash, admin))
+                cursor.executemany('''
+                    INSERT INTO users (username, name, email, password_hash, is_admin)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows)
+            created.extend(row[0] for row in rows)
+            for row in rows:
+                invalidate_user_stats(row[0])
+        except Exception as e:
+            print(f"Erro ao criar usuários em lote: {e}")
+            errors.extend({'row': c[0], 'username': c[1], 'error': "Erro interno do servidor"}
+                          for c, _ in group)
+            rows = []
+        if sharded:
+            inserted = {row[0] for row in rows}
+            _release_emails([(c[3], c[1]) for c, _ in group if c[1] not in inserted])
+    errors.sort(key=lambda error: error['row'])
+    return {'created': created, 'errors': errors}
+
+def create_users_from_csv(source, is_admin=False):
+    """create_users_bulk a partir de um CSV (caminho ou arquivo aberto) com cabeçalho
+    username,email,password[,name,is_admin]"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline='', encoding='utf-8-sig') as csv_file:
+            return create_users_bulk(csv.DictReader(csv_file), is_admin=is_admin)
+    return create_users_bulk(csv.DictReader(source), is_admin=is_admin)
+
+_verified_sessions = VerifiedSessionCache()
+
+def _verify_login(username, password):
+    """Linha do usuário se a senha conferir, ou None.
+
+    Reruns com a mesma senha usam o cache de sessões verificadas em vez do hash lento;
+    hashes com custo desatualizado (ou SHA-256 legado) são regravados com o custo atual.
+    """
+    if not username or not password:
+        return None
+    manager = get_connection_manager(username)
+    with manager.cursor() as cursor:
+        cursor.execute('''
+            SELECT username, name, email, is_admin, created_at, password_hash
+            FROM users WHERE username = ? COLLATE NOCASE
+        ''', (username,))
+        row = cursor.fetchone()
+    if not row:
+        return None
+    username, password_hash = row[0], row[5]
+    if _verified_sessions.check(username, password, password_hash):
+        return row
+    ok, new_hash = get_password_hasher().verify_and_update(password, password_hash)
+    if not ok:
+        return None
+    if new_hash:
+        with manager.transaction() as cursor:
+            # Só regrava se a senha não foi trocada enquanto o hash era calculado
+            cursor.execute("UPDATE users SET password_hash = ? WHERE username = ? AND password_hash = ?",
+                           (new_hash, username, password_hash))
+            if cursor.rowcount == 1:
+                password_hash = new_hash
+    _verified_sessions.remember(username, password, password_hash)
+    return row
 
+@timed()
 def authenticate_user_detailed(username, password):
-    return True, {
-        'username': username,
-        'name': username,
-        'email': '',
-        'is_admin': False,
-        'created_at': '',
-        'login_success': True
-    }
+    try:
+        row = _verify_login(username, password)
+        if row is None:
+            return False, "Usuário ou senha inválidos"
+        return True, {
+            'username': row[0],
+            'name': row[1] or row[0],
+            'email': row[2],
+            'is_admin': bool(row[3]),
+            'created_at': row[4] or '',
+            'login_success': True
+        }
+    except Exception as e:
+        print(f"Erro ao autenticar usuário: {e}")
+        return False, "Erro interno do servidor"
+
+def authenticate_user(username, password):
+    success, user = authenticate_user_detailed(username, password)
+    if not success:
+        return False, user
+    return True, {key: user[key] for key in ('username', 'name', 'email', 'is_admin')}
+
+def invalidate_verified_sessions(username=None):
+    """Força a próxima verificação de senha de um usuário (ou de todos) a usar o hash"""
+    if username is None:
+        _verified_sessions.clear()
+    else:
+        _verified_sessions.invalidate(username)
+
+def get_password_verification_metrics():
+    """Acertos e falhas do cache de sessões verificadas"""
+    return {'hits': _verified_sessions.hits, 'misses': _verified_sessions.misses}
 
 def validate_user_session(username):
     return True
@@ -148,84 +446,301 @@ def log_user_login(username, login_method='manual'):
 def get_formatted_credentials_for_auth():
     return {'usernames': {}}
 
+@timed()
 def save_conversation(username, role, content):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO conversations (username, role, content)
-            VALUES (?, ?, ?)
-        ''', (username, role, content))
-        conn.commit()
-        conn.close()
+        with get_connection_manager(username).transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO conversations (username, role, content)
+                VALUES (?, ?, ?)
+            ''', (username, role, content))
+        invalidate_user_stats(username)
         return True
     except Exception as e:
         print(f"Erro ao salvar conversa: {e}")
         return False
 
-def get_user_history(username):
+@timed(rows=lambda page: len(page['messages']))
+def get_user_history_page(username, limit=50, before=None, after=None):
+    """Página do histórico com cursor (timestamp, id), em ordem cronológica.
+
+    Sem cursor retorna as `limit` mensagens mais recentes; `before` busca as
+    anteriores a um cursor e `after` as posteriores.
+    """
+    empty = {'messages': [], 'oldest_cursor': before, 'newest_cursor': after, 'has_more': False}
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT role, content, timestamp 
-            FROM conversations 
-            WHERE username = ? 
-            ORDER BY timestamp ASC
-            LIMIT 50
-        ''', (username,))
-        messages = []
-        for row in cursor.fetchall():
-            messages.append({
-                'role': row[0],
-                'content': row[1],
-                'timestamp': row[2]
-            })
-        conn.close()
-        return messages
+        with get_connection_manager(username).cursor() as cursor:
+            if after is not None:
+                cursor.execute('''
+                    SELECT id, role, content, timestamp
+                    FROM conversations
+                    WHERE username = ? AND (timestamp, id) > (?, ?)
+                    ORDER BY timestamp ASC, id ASC
+                    LIMIT ?
+                ''', (username, after[0], after[1], limit + 1))
+                rows = cursor.fetchall()
+            else:
+                if before is not None:
+                    cursor.execute('''
+                        SELECT id, role, content, timestamp
+                        FROM conversations
+                        WHERE username = ? AND (timestamp, id) < (?, ?)
+                        ORDER BY timestamp DESC, id DESC
+                        LIMIT ?
+                    ''', (username, before[0], before[1], limit + 1))
+                else:
+                    cursor.execute('''
+                        SELECT id, role, content, timestamp
+                        FROM conversations
+                        WHERE username = ?
+                        ORDER BY timestamp DESC, id DESC
+                        LIMIT ?
+                    ''', (username, limit + 1))
+                rows = cursor.fetchall()
+        if after is None and len(rows) <= limit:
+            # Banco principal esgotado: o restante do histórico pode estar no arquivo morto
+            import retention
+            oldest = (rows[-1][3], rows[-1][0]) if rows else before
+            rows += retention.archived_history_before(username, oldest, limit + 1 - len(rows))
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if after is None:
+            rows.reverse()
+        if not rows:
+            return empty
+        messages = [{
+            'id': row[0],
+            'role': row[1],
+            'content': row[2],
+            'timestamp': row[3]
+        } for row in rows]
+        return {
+            'messages': messages,
+            'oldest_cursor': (rows[0][3], rows[0][0]),
+            'newest_cursor': (rows[-1][3], rows[-1][0]),
+            'has_more': has_more
+        }
     except Exception as e:
         print(f"Erro ao buscar histórico: {e}")
-        return []
+        return empty
+
+def get_user_history(username, limit=50):
+    """As `limit` mensagens mais recentes do usuário, em ordem cronológica"""
+    return get_user_history_page(username, limit)['messages']
 
+@timed()
 def save_user_action(username, action_type, action_data=None, outcome=None):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO user_actions (username, action_type, action_data, outcome)
-            VALUES (?, ?, ?, ?)
-        ''', (username, action_type, action_data, outcome))
-        conn.commit()
-        conn.close()
+        with get_connection_manager(username).transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO user_actions (username, action_type, action_data, outcome)
+                VALUES (?, ?, ?, ?)
+            ''', (username, action_type, action_data, outcome))
+        invalidate_user_stats(username)
         return True
     except Exception as e:
         print(f"Erro ao salvar ação: {e}")
         return False
 
-def get_all_user_actions():
+@timed(rows=lambda inserted: inserted)
+def save_user_actions_bulk(actions):
+    """Grava várias ações numa única transação (executemany).
+
+    `actions` é uma sequência de (username, action_type, action_data, outcome, conversation_id).
+    Ações de um conversation_id já gravado são ignoradas, o que torna a gravação idempotente.
+    Retorna o número de linhas efetivamente inseridas (ou None em caso de erro).
+    """
+    actions = list(actions)
+    if not actions:
+        return 0
+    try:
+        inserted = 0
+        # Uma transação por shard; a gravação é idempotente, então repetir após falha parcial é seguro
+        for manager, group in _group_by_shard(actions, lambda action: action[0]).items():
+            with manager.transaction() as cursor:
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO user_actions
+                        (username, action_type, action_data, outcome, conversation_id, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [(*action, _utc_timestamp()) for action in group])
+                # rowcount soma só as linhas de user_actions (não as dos triggers de resumo)
+                inserted += cursor.rowcount
+        for username in {action[0] for action in actions}:
+            invalidate_user_stats(username)
+        return inserted
+    except Exception as e:
+        print(f"Erro ao salvar ações em lote: {e}")
+        return None
+
+USER_ACTION_COLUMNS = ('id', 'username', 'action_type', 'action_data', 'outcome', 'timestamp')
+CATEGORICAL_ACTION_COLUMNS = ('username', 'action_type', 'outcome')
+
+def _build_user_actions_query(start=None, end=None, usernames=None, columns=None, action_types=None):
+    columns = list(columns or USER_ACTION_COLUMNS)
+    invalid = [c for c in columns if c not in USER_ACTION_COLUMNS]
+    if invalid:
+        raise ValueError(f"Colunas inválidas: {invalid}")
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append("timestamp >= ?")
+        params.append(str(start))
+    if end is not None:
+        conditions.append("timestamp < ?")
+        params.append(str(end))
+    if usernames:
+        conditions.append(f"username IN ({', '.join('?' for _ in usernames)})")
+        params.extend(usernames)
+    if action_types:
+        conditions.append(f"action_type IN ({', '.join('?' for _ in action_types)})")
+        params.extend(action_types)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f"SELECT {', '.join(columns)} FROM user_actions {where} ORDER BY timestamp DESC, id DESC"
+    return sql, params
+
+def _compact_user_actions(df):
+    import pandas as pd
+    for column in CATEGORICAL_ACTION_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    if 'id' in df.columns:
+        df['id'] = pd.to_numeric(df['id'], downcast='unsigned')
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+def iter_user_actions(chunksize=10000, start=None, end=None, usernames=None, columns=None,
+                      action_types=None, compact=True):
+    """Itera user_actions em DataFrames de até `chunksize` linhas.
+
+    Filtros (intervalo [start, end), usuários, tipos) e seleção de colunas são
+    aplicados no SQL; com `compact` as colunas de baixa cardinalidade viram category.
+    Com shards, os blocos vêm shard a shard (a ordenação vale dentro de cada shard).
+    """
+    import pandas as pd
+    sql, params = _build_user_actions_query(start, end, usernames, columns, action_types)
+    if usernames:
+        managers = list(_group_by_shard(usernames, lambda username: username))
+    else:
+        managers = get_shard_managers()
+    for manager in managers:
+        conn = manager.get_connection()
+        for chunk in pd.read_sql_query(sql, conn, params=params, chunksize=chunksize):
+            yield _compact_user_actions(chunk) if compact else chunk
+
+@timed(rows=len)
+def get_all_user_actions(start=None, end=None, usernames=None, columns=None,
+                         action_types=None, compact=False):
+    import pandas as pd
     try:
-        conn = sqlite3.connect(DB_NAME)
-        df = pd.read_sql_query('SELECT * FROM user_actions ORDER BY timestamp DESC', conn)
-        conn.close()
-        return df
+        chunks = list(iter_user_actions(start=start, end=end, usernames=usernames, columns=columns,
+                                        action_types=action_types, compact=False))
+        if not chunks:
+            return pd.DataFrame(columns=list(columns or USER_ACTION_COLUMNS))
+        df = pd.concat(chunks, ignore_index=True)
+        order = [c for c in ('timestamp', 'id') if c in df.columns]
+        if len(get_shard_managers()) > 1 and order:
+            df = df.sort_values(order, ascending=False, ignore_index=True)
+        return _compact_user_actions(df) if compact else df
     except Exception as e:
         print(f"Erro ao buscar ações: {e}")
         return pd.DataFrame()
 
+@timed(rows=lambda total: total)
+def export_user_actions(path, file_format='csv', chunksize=50000, start=None, end=None,
+                        usernames=None, columns=None, action_types=None):
+    """Exporta user_actions para CSV ou Parquet em memória limitada (um bloco por vez).
+
+    Parquet requer pyarrow. Retorna o número de linhas exportadas.
+    """
+    chunks = iter_user_actions(chunksize=chunksize, start=start, end=end, usernames=usernames,
+                               columns=columns, action_types=action_types, compact=False)
+    total = 0
+    if file_format == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            header = True
+            for chunk in chunks:
+                chunk.to_csv(f, index=False, header=header)
+                header = False
+                total += len(chunk)
+            if header:
+                f.write(','.join(columns or USER_ACTION_COLUMNS) + '\n')
+    elif file_format == 'parquet':
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Exportação Parquet requer o pacote 'pyarrow'")
+        # Esquema fixo: um bloco só com NULLs não pode mudar o tipo da coluna
+        schema = pa.schema([(c, pa.int64() if c == 'id' else pa.string())
+                            for c in (columns or USER_ACTION_COLUMNS)])
+        with pq.ParquetWriter(path, schema) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+                total += len(chunk)
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {file_format}")
+    return total
+
+_user_counters_cache = TTLCache(maxsize=2048, ttl=USER_STATS_CACHE_TTL)
+
+def invalidate_user_stats(username=None):
+    """Descarta os contadores em cache de um usuário (ou de todos)"""
+    if username is None:
+        _user_counters_cache.clear()
+    else:
+        _user_counters_cache.invalidate(username)
+
+@timed()
+def get_user_counters(username):
+    """Todos os contadores do usuário numa única consulta indexada (com cache TTL).
+
+    Funciona também para usuários sem registro em `users` (ex.: visitante);
+    nesse caso 'exists' é False.
+    """
+    cached = _user_counters_cache.get(username)
+    if cached is not None:
+        return dict(cached)
+    with get_connection_manager(username).cursor() as cursor:
+        cursor.execute('''
+            SELECT
+                (SELECT name FROM users WHERE username = :u),
+                (SELECT email FROM users WHERE username = :u),
+                (SELECT created_at FROM users WHERE username = :u),
+                EXISTS(SELECT 1 FROM users WHERE username = :u),
+                (SELECT COUNT(*) FROM conversations WHERE username = :u),
+                (SELECT MAX(timestamp) FROM conversations WHERE username = :u),
+                COUNT(*),
+                COALESCE(SUM(outcome = 'acerto'), 0),
+                COALESCE(SUM(outcome = 'erro'), 0),
+                MAX(timestamp)
+            FROM user_actions
+            WHERE username = :u
+        ''', {'u': username})
+        row = cursor.fetchone()
+    counters = {
+        'username': username,
+        'name': row[0] or username,
+        'email': row[1],
+        'created_at': row[2],
+        'exists': bool(row[3]),
+        'total_messages': row[4],
+        'total_actions': row[6],
+        'total_acertos': row[7],
+        'total_erros': row[8],
+        'taxa_acerto': (row[7] / row[6] * 100) if row[6] > 0 else 0,
+        'last_activity': max(filter(None, (row[5], row[9])), default=None)
+    }
+    _user_counters_cache.set(username, counters)
+    return dict(counters)
+
 def get_user_stats(username):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM user_actions WHERE username = ?", (username,))
-        total_actions = cursor.fetchone()[0]
-        cursor.execute("SELECT COUNT(*) FROM user_actions WHERE username = ? AND outcome = 'acerto'", (username,))
-        total_acertos = cursor.fetchone()[0]
-        taxa_acerto = (total_acertos / total_actions * 100) if total_actions > 0 else 0
-        conn.close()
+        counters = get_user_counters(username)
         return {
-            'total_actions': total_actions,
-            'total_acertos': total_acertos,
-            'taxa_acerto': taxa_acerto
+            'total_actions': counters['total_actions'],
+            'total_acertos': counters['total_acertos'],
+            'taxa_acerto': counters['taxa_acerto']
         }
     except Exception as e:
         print(f"Erro ao buscar stats do usuário: {e}")
@@ -233,100 +748,482 @@ def get_user_stats(username):
 
 def reset_database():
     try:
-        if os.path.exists(DB_NAME):
-            os.remove(DB_NAME)
-        init_database()
+        flush_pending_writes()
+        _thread_cache.clear()
+        invalidate_user_stats()
+        invalidate_verified_sessions()
+        import retention
+        retention.remove_archives()
+        for db_path in get_storage_backend().paths:
+            get_manager(db_path).close_all()
+            _initialized_paths.discard(db_path)
+            for path in (db_path, f"{db_path}-wal", f"{db_path}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+        ensure_database()
         print("✅ Banco de dados resetado")
     except Exception as e:
         print(f"❌ Erro ao resetar banco: {e}")
 
+@timed(rows=len)
 def list_all_users():
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT username, name, email, created_at, is_admin FROM users ORDER BY created_at DESC")
-        users = cursor.fetchall()
-        conn.close()
+        users = []
+        for manager in get_shard_managers():
+            with manager.cursor() as cursor:
+                cursor.execute("SELECT username, name, email, created_at, is_admin FROM users ORDER BY created_at DESC")
+                users.extend(cursor.fetchall())
+        if len(get_shard_managers()) > 1:
+            users.sort(key=lambda user: user[3] or '', reverse=True)
         return users
     except Exception as e:
         print(f"Erro ao listar usuários: {e}")
         return []
 
+@timed(rows=lambda page: len(page['users']))
+def list_users(limit=50, after=None, search=None, is_admin=None, created_from=None, created_to=None):
+    """Página de usuários, dos mais recentes para os mais antigos, com cursor (created_at, id).
+
+    `search` filtra por trecho do username, nome ou e-mail; `created_from`/`created_to`
+    limitam o intervalo [created_from, created_to). Retorna {'users', 'next_cursor', 'has_more'}.
+    """
+    conditions = []
+    params = []
+    if after is not None:
+        conditions.append("(created_at, id) < (?, ?)")
+        params.extend(after)
+    if search:
+        conditions.append("(username LIKE ? OR name LIKE ? OR email LIKE ?)")
+        params.extend([f"%{search}%"] * 3)
+    if is_admin is not None:
+        conditions.append("is_admin = ?")
+        params.append(bool(is_admin))
+    if created_from is not None:
+        conditions.append("created_at >= ?")
+        params.append(str(created_from))
+    if created_to is not None:
+        conditions.append("created_at < ?")
+        params.append(str(created_to))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    try:
+        shards = []
+        for manager in get_shard_managers():
+            with manager.cursor() as cursor:
+                cursor.execute(f'''
+                    SELECT id, username, name, email, created_at, is_admin
+                    FROM users
+                    {where}
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT ?
+                ''', params + [limit + 1])
+                shards.append(cursor.fetchall())
+        # Cada shard já vem ordenado; os ids são únicos entre shards, então o cursor continua válido
+        rows = list(heapq.merge(*shards, key=lambda row: (row[4], row[0]), reverse=True))[:limit + 1]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            'users': [{
+                'username': row[1],
+                'name': row[2],
+                'email': row[3],
+                'created_at': row[4],
+                'is_admin': bool(row[5])
+            } for row in rows],
+            'next_cursor': (rows[-1][4], rows[-1][0]) if has_more else None,
+            'has_more': has_more
+        }
+    except Exception as e:
+        print(f"Erro ao listar usuários: {e}")
+        return {'users': [], 'next_cursor': None, 'has_more': False}
+
+# Tabelas com dados por usuário, apagadas junto com ele
+USER_DATA_TABLES = ('conversations', 'user_actions', 'user_threads', 'users', 'user_stats',
+                    'user_stats_daily', 'user_stats_archived', 'user_stats_daily_archived',
+                    'analysis_cache', 'conversation_summaries')
+
+@timed()
 def delete_user(username):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM conversations WHERE username = ?", (username,))
-        cursor.execute("DELETE FROM user_actions WHERE username = ?", (username,))
-        cursor.execute("DELETE FROM user_threads WHERE username = ?", (username,))
-        cursor.execute("DELETE FROM users WHERE username = ?", (username,))
-        conn.commit()
-        conn.close()
+        with get_connection_manager(username).transaction() as cursor:
+            for table in USER_DATA_TABLES:
+                cursor.execute(f"DELETE FROM {table} WHERE username = ?", (username,))
+        if get_storage_backend().sharded:
+            _delete_user_emails([username])
+        import retention
+        retention.delete_user_archives([username])
+        _thread_cache.invalidate(username)
+        invalidate_user_stats(username)
         return True, "Usuário deletado com sucesso"
     except Exception as e:
         print(f"Erro ao deletar usuário: {e}")
         return False, "Erro ao deletar usuário"
 
+@timed(rows=lambda deleted: deleted)
+def delete_users_bulk(usernames):
+    """Apaga vários usuários e seus dados numa transação por shard (um DELETE por tabela).
+
+    Retorna o número de usuários removidos (ou None em caso de erro).
+    """
+    usernames = list(dict.fromkeys(usernames))
+    if not usernames:
+        return 0
+    try:
+        deleted = 0
+        for manager, group in _group_by_shard(usernames, lambda username: username).items():
+            payload = json.dumps(group)
+            with manager.transaction() as cursor:
+                for table in USER_DATA_TABLES:
+                    cursor.execute(f"DELETE FROM {table} WHERE username IN (SELECT value FROM json_each(?))",
+                                   (payload,))
+                    if table == 'users':
+                        deleted += cursor.rowcount
+        if get_storage_backend().sharded:
+            _delete_user_emails(usernames)
+        import retention
+        retention.delete_user_archives(usernames)
+        for username in usernames:
+            _thread_cache.invalidate(username)
+            invalidate_user_stats(username)
+        return deleted
+    except Exception as e:
+        print(f"Erro ao deletar usuários em lote: {e}")
+        return None
+
 def update_user_name(username, new_name):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE users SET name = ? WHERE username = ?", (new_name, username))
-        conn.commit()
-        conn.close()
+        with get_connection_manager(username).transaction() as cursor:
+            cursor.execute("UPDATE users SET name = ? WHERE username = ?", (new_name, username))
+        invalidate_user_stats(username)
         return True, "Nome atualizado com sucesso"
     except Exception as e:
         print(f"Erro ao atualizar nome: {e}")
         return False, "Erro ao atualizar nome"
 
-def get_or_create_thread_id(username, client):
-    """Busca ou cria thread ID para o usuário"""
+def _lookup_thread_id(username):
+    """thread_id persistido do usuário (None se ainda não tiver).
+
+    Erros de leitura propagam: tratá-los como "sem thread" criaria uma thread
+    remota nova (e perderia o contexto) a cada turno enquanto o banco estiver fora.
+    """
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT thread_id FROM user_threads WHERE username = ?", (username,))
-        result = cursor.fetchone()
-        if result:
-            thread_id = result[0]
-        else:
-            thread = client.beta.threads.create()
-            thread_id = thread.id
-            cursor.execute("INSERT INTO user_threads (username, thread_id) VALUES (?, ?)",
-                          (username, thread_id))
-            conn.commit()
-        conn.close()
-        return thread_id
-    except Exception as e:
-        print(f"Erro ao obter thread ID: {e}")
-        thread = client.beta.threads.create()
-        return thread.id
+        with get_connection_manager(username).cursor() as cursor:
+            cursor.execute("SELECT thread_id FROM user_threads WHERE username = ?", (username,))
+            result = cursor.fetchone()
+        return result[0] if result else None
+    except Exception as e:
+        print(f"Erro ao buscar thread ID: {e}")
+        raise
 
+def _store_thread_id(username, thread_id):
+    """Grava o thread_id se o usuário ainda não tiver um; retorna o que ficou no banco"""
+    try:
+        with get_connection_manager(username).transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO user_threads (username, thread_id) VALUES (?, ?)
+                ON CONFLICT (username) DO NOTHING
+            ''', (username, thread_id))
+            cursor.execute("SELECT thread_id FROM user_threads WHERE username = ?", (username,))
+            result = cursor.fetchone()
+        return result[0] if result else thread_id
+    except Exception as e:
+        # Sem gravar, o id não seria encontrado no próximo turno: falha em vez de usá-lo
+        print(f"Erro ao salvar thread ID: {e}")
+        raise
+
+_thread_cache = ThreadIdCache(_lookup_thread_id, _store_thread_id)
+
+def invalidate_thread_id(username):
+    """Descarta o thread_id em cache do usuário (p.ex. a thread foi trocada por outro processo)"""
+    _thread_cache.invalidate(username)
+
+@timed()
+def get_or_create_thread_id(username, client, messages=None):
+    """Busca ou cria thread ID para o usuário (uma thread nova já começa com `messages`)"""
+    return get_or_create_thread(username, client, messages=messages)[0]
+
+def get_or_create_thread(username, client, messages=None):
+    """Como get_or_create_thread_id, mas retorna (thread_id, criada).
+
+    `criada` só é True se esta chamada criou a thread (com `messages`) e ela ficou
+    gravada; se outra sessão ou processo venceu a corrida, a thread é a dela.
+    """
+    created = []
+    def create():
+        created.append(client.create_thread(messages=messages))
+        return created[0]
+    thread_id = _thread_cache.get_or_create(username, create)
+    return thread_id, bool(created) and created[0] == thread_id
+
+@timed()
+def get_thread_context(username):
+    """Thread atual do usuário com a contagem estimada de tokens e de turnos"""
+    try:
+        with get_connection_manager(username).cursor() as cursor:
+            cursor.execute('''
+                SELECT thread_id, token_count, turn_count, rotated_at
+                FROM user_threads WHERE username = ?
+            ''', (username,))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        return {'thread_id': row[0], 'token_count': row[1], 'turn_count': row[2], 'rotated_at': row[3]}
+    except Exception as e:
+        print(f"Erro ao buscar contexto da thread: {e}")
+        return None
+
+@timed()
+def add_thread_tokens(username, thread_id, tokens):
+    """Soma os tokens de um turno à thread; retorna o novo total (None se a thread mudou)"""
+    try:
+        with get_connection_manager(username).transaction() as cursor:
+            cursor.execute('''
+                UPDATE user_threads SET token_count = token_count + ?, turn_count = turn_count + 1
+                WHERE username = ? AND thread_id = ?
+            ''', (tokens, username, thread_id))
+            cursor.execute("SELECT token_count FROM user_threads WHERE username = ? AND thread_id = ?",
+                           (username, thread_id))
+            row = cursor.fetchone()
+        return row[0] if row else None
+    except Exception as e:
+        print(f"Erro ao atualizar tokens da thread: {e}")
+        return None
+
+@timed()
+def rotate_user_thread(username, old_thread_id, new_thread_id, token_count):
+    """Troca a thread do usuário só se ela ainda for `old_thread_id` (evita rotações duplicadas)"""
+    try:
+        with get_connection_manager(username).transaction() as cursor:
+            cursor.execute('''
+                UPDATE user_threads
+                SET thread_id = ?, token_count = ?, turn_count = 0, rotated_at = ?
+                WHERE username = ? AND thread_id = ?
+            ''', (new_thread_id, token_count, _utc_timestamp(), username, old_thread_id))
+            rotated = cursor.rowcount == 1
+        if rotated:
+            _thread_cache.put(username, new_thread_id)
+        return rotated
+    except Exception as e:
+        print(f"Erro ao trocar thread: {e}")
+        return False
+
+@timed()
+def save_conversation_summary(username, thread_id, summary, upto_cursor, token_count):
+    """Guarda o resumo das mensagens até `upto_cursor` (timestamp, id)"""
+    try:
+        upto_timestamp, upto_id = upto_cursor if upto_cursor else (None, None)
+        with get_connection_manager(username).transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO conversation_summaries
+                    (username, thread_id, summary, upto_timestamp, upto_id, token_count)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (username, thread_id, summary, upto_timestamp, upto_id, token_count))
+        return True
+    except Exception as e:
+        print(f"Erro ao salvar resumo: {e}")
+        return False
+
+@timed()
+def get_latest_conversation_summary(username):
+    try:
+        with get_connection_manager(username).cursor() as cursor:
+            cursor.execute('''
+                SELECT summary, upto_timestamp, upto_id, token_count, created_at
+                FROM conversation_summaries
+                WHERE username = ?
+                ORDER BY id DESC
+                LIMIT 1
+            ''', (username,))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            'summary': row[0],
+            'upto_cursor': (row[1], row[2]) if row[2] is not None else None,
+            'token_count': row[3],
+            'created_at': row[4]
+        }
+    except Exception as e:
+        print(f"Erro ao buscar resumo: {e}")
+        return None
+
+def _invalidate_written_users(batch):
+    # O primeiro parâmetro de todo INSERT enfileirado é o username
+    for username in {params[0] for _, params in batch}:
+        invalidate_user_stats(username)
+
+_write_queues = {}
+_write_queues_lock = threading.Lock()
+
+def _write_queue_for(username):
+    """Fila write-behind do shard do usuário: cada shard tem a sua thread escritora"""
+    path = get_storage_backend().path_for(username)
+    write_queue = _write_queues.get(path)
+    if write_queue is None:
+        if path not in _initialized_paths:
+            ensure_database()
+        with _write_queues_lock:
+            write_queue = _write_queues.get(path)
+            if write_queue is None:
+                # Ligada ao arquivo, não ao usuário: outros usuários do shard usam a mesma fila
+                write_queue = create_write_queue(lambda path=path: get_manager(path),
+                                                 on_batch_written=_invalidate_written_users)
+                _write_queues[path] = write_queue
+    return write_queue
+
+@timed()
 def add_message_to_history(username, role, content):
-    return save_conversation(username, role, content)
+    """Registra a mensagem pela fila write-behind, sem esperar o disco"""
+    _write_queue_for(username).submit('''
+        INSERT INTO conversations (username, role, content, timestamp)
+        VALUES (?, ?, ?, ?)
+    ''', (username, role, content, _utc_timestamp()))
+    return True
+
+@timed()
+def log_user_action(username, action_type, action_data, outcome=None):
+    """Registra a ação pela fila write-behind, sem esperar o disco"""
+    _write_queue_for(username).submit('''
+        INSERT INTO user_actions (username, action_type, action_data, outcome, timestamp)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (username, action_type, action_data, outcome, _utc_timestamp()))
+    return True
+
+@timed()
+def flush_pending_writes():
+    """Bloqueia até que tudo o que está nas filas write-behind tenha sido gravado"""
+    for write_queue in list(_write_queues.values()):
+        write_queue.flush()
+
+def get_write_queue_metrics():
+    """Profundidade das filas, lotes gravados e latência de flush (somados entre os shards)"""
+    metrics = {'batches': 0, 'rows_written': 0, 'rows_failed': 0, 'last_flush_ms': 0.0,
+               'max_flush_ms': 0.0, 'total_flush_ms': 0.0, 'queue_depth': 0}
+    for write_queue in list(_write_queues.values()):
+        queue_metrics = write_queue.metrics()
+        for key in ('batches', 'rows_written', 'rows_failed', 'total_flush_ms', 'queue_depth'):
+            metrics[key] += queue_metrics[key]
+        for key in ('last_flush_ms', 'max_flush_ms'):
+            metrics[key] = max(metrics[key], queue_metrics[key])
+    metrics['avg_flush_ms'] = (metrics['total_flush_ms'] / metrics['batches']) if metrics['batches'] else 0.0
+    return metrics
+
+EVALUATION_WATERMARK = 'avaliacao_automatica'
+
+def conversation_shard(conversation_id):
+    """Índice do shard dono de um id de conversations (cada shard numa faixa própria)"""
+    return conversation_id >> storage.SHARD_ID_BITS
+
+def get_evaluation_watermarks():
+    """{shard: maior id até o qual todos os turnos de usuário do shard já foram avaliados}
+
+    Cada shard guarda a sua no próprio arquivo: uma marca única cobriria, com o id
+    de um shard de faixa mais alta, os turnos novos dos shards anteriores.
+    """
+    try:
+        watermarks = {}
+        for index, manager in enumerate(get_shard_managers()):
+            with manager.cursor() as cursor:
+                cursor.execute("SELECT last_id FROM evaluation_progress WHERE name = ?", (EVALUATION_WATERMARK,))
+                row = cursor.fetchone()
+            watermarks[index] = row[0] if row else 0
+        return watermarks
+    except Exception as e:
+        print(f"Erro ao buscar progresso da avaliação: {e}")
+        return {}
+
+def advance_evaluation_watermarks(upto_ids):
+    """Avança a marca de cada shard em {shard: id} (nunca recua); só com todos os turnos até o id avaliados"""
+    try:
+        managers = get_shard_managers()
+        for index, upto_id in sorted(upto_ids.items()):
+            with managers[index].transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO evaluation_progress (name, last_id) VALUES (?, ?)
+                    ON CONFLICT (name) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)
+                ''', (EVALUATION_WATERMARK, upto_id))
+        return True
+    except Exception as e:
+        print(f"Erro ao salvar progresso da avaliação: {e}")
+        return False
+
+def get_last_conversation_ids():
+    """{shard: maior id de conversations do shard} (0 no shard vazio)"""
+    try:
+        last_ids = {}
+        for index, manager in enumerate(get_shard_managers()):
+            with manager.cursor() as cursor:
+                cursor.execute("SELECT MAX(id) FROM conversations")
+                last_ids[index] = cursor.fetchone()[0] or 0
+        return last_ids
+    except Exception as e:
+        print(f"Erro ao buscar último id de conversa: {e}")
+        return {}
+
+@timed(rows=len)
+def get_unevaluated_turns(after_id=0, limit=100):
+    """Mensagens de usuário ainda sem avaliação automática, em ordem de id.
 
-def log_user_action(username, action_type, action_data):
-    return save_user_action(username, action_type, action_data)
+    Cada turno traz a última mensagem do Assistant anterior a ele (o cenário
+    a que o usuário respondeu). `after_id` permite percorrer a fila em páginas
+    (os ids são únicos entre shards, cada shard numa faixa própria); em cada
+    shard a busca começa depois da sua marca d'água, sem revarrer turnos já avaliados.
+    """
+    try:
+        watermarks = get_evaluation_watermarks()
+        turns = []
+        for index, manager in enumerate(get_shard_managers()):
+            if len(turns) >= limit:
+                break
+            with manager.cursor() as cursor:
+                cursor.execute('''
+                    SELECT c.id, c.username, c.content, c.timestamp,
+                           (SELECT p.content FROM conversations p
+                            WHERE p.username = c.username AND p.role = 'assistant'
+                              AND p.timestamp <= c.timestamp AND p.id < c.id
+                            ORDER BY p.timestamp DESC, p.id DESC
+                            LIMIT 1)
+                    FROM conversations c
+                    WHERE c.role = 'user' AND c.id > ?
+                      AND NOT EXISTS (SELECT 1 FROM user_actions ua WHERE ua.conversation_id = c.id)
+                    ORDER BY c.id
+                    LIMIT ?
+                ''', (max(after_id, watermarks.get(index, 0)), limit - len(turns)))
+                turns.extend({
+                    'id': row[0],
+                    'username': row[1],
+                    'content': row[2],
+                    'timestamp': row[3],
+                    'context': row[4] or ''
+                } for row in cursor.fetchall())
+        # Shards em ordem de faixa de ids: a concatenação já sai em ordem de id
+        return turns
+    except Exception as e:
+        print(f"Erro ao buscar turnos não avaliados: {e}")
+        return []
 
+@timed(rows=len)
 def get_all_user_evaluations():
+    """Avaliações por usuário, lidas do resumo user_stats (O(usuários)) de todos os shards"""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT 
-                u.username, 
-                COALESCE(u.name, u.username) as name,
-                u.email,
-                COUNT(CASE WHEN ua.action_data = 'acerto' THEN 1 END) as acertos,
-                COUNT(CASE WHEN ua.action_data = 'erro' THEN 1 END) as erros,
-                COUNT(ua.action_data) as total_decisions,
-                MAX(ua.timestamp) as last_activity
-            FROM users u
-            LEFT JOIN user_actions ua ON u.username = ua.username 
-            WHERE ua.action_type = 'avaliacao_automatica' OR ua.action_type IS NULL
-            GROUP BY u.username, u.name, u.email
-            ORDER BY total_decisions DESC
-        ''')
-        results = cursor.fetchall()
+        results = []
+        for manager in get_shard_managers():
+            with manager.cursor() as cursor:
+                cursor.execute('''
+                    SELECT 
+                        u.username, 
+                        COALESCE(u.name, u.username) as name,
+                        u.email,
+                        COALESCE(s.acertos, 0) as acertos,
+                        COALESCE(s.erros, 0) as erros,
+                        COALESCE(s.total_decisions, 0) as total_decisions,
+                        s.last_activity
+                    FROM users u
+                    LEFT JOIN user_stats s ON u.username = s.username
+                    ORDER BY total_decisions DESC
+                ''')
+                results.extend(cursor.fetchall())
+        if len(get_shard_managers()) > 1:
+            results.sort(key=lambda row: row[5] or 0, reverse=True)
         user_stats = []
         for row in results:
             user_stats.append({
@@ -338,33 +1235,250 @@ def get_all_user_evaluations():
                 'total_decisions': row[5] or 0,
                 'last_activity': row[6] or 'Nunca'
             })
-        conn.close()
         return user_stats
     except Exception as e:
         print(f"Erro ao obter avaliações: {e}")
         return []
 
+@timed(rows=len)
+def get_daily_evaluation_stats(username=None):
+    """Buckets diários de avaliações (de um usuário ou de todos)"""
+    try:
+        if username:
+            with get_connection_manager(username).cursor() as cursor:
+                cursor.execute('''
+                    SELECT day, acertos, erros, total_decisions
+                    FROM user_stats_daily
+                    WHERE username = ? AND total_decisions > 0
+                    ORDER BY day
+                ''', (username,))
+                rows = cursor.fetchall()
+        else:
+            days = {}
+            for manager in get_shard_managers():
+                with manager.cursor() as cursor:
+                    cursor.execute('''
+                        SELECT day, SUM(acertos), SUM(erros), SUM(total_decisions)
+                        FROM user_stats_daily
+                        GROUP BY day
+                        HAVING SUM(total_decisions) > 0
+                    ''')
+                    for day, acertos, erros, total in cursor.fetchall():
+                        totals = days.setdefault(day, [0, 0, 0])
+                        totals[0] += acertos
+                        totals[1] += erros
+                        totals[2] += total
+            rows = [(day, *totals) for day, totals in sorted(days.items())]
+        return [{
+            'day': row[0],
+            'acertos': row[1],
+            'erros': row[2],
+            'total_decisions': row[3]
+        } for row in rows]
+    except Exception as e:
+        print(f"Erro ao obter estatísticas diárias: {e}")
+        return []
+
+def rebuild_user_stats():
+    """Recria o resumo user_stats a partir de user_actions (backfill)"""
+    try:
+        flush_pending_writes()
+        for manager in get_shard_managers():
+            with manager.transaction() as cursor:
+                stats_rollup.rebuild(cursor)
+        return True
+    except Exception as e:
+        print(f"Erro ao recriar resumo de estatísticas: {e}")
+        return False
+
+def check_user_stats_consistency():
+    """Divergências entre user_stats e a agregação de user_actions (vazia = consistente)"""
+    flush_pending_writes()
+    issues = []
+    for manager in get_shard_managers():
+        with manager.cursor() as cursor:
+            issues.extend(stats_rollup.check_consistency(cursor))
+    return issues
+
+def _fts_query(text):
+    # Cada termo vira uma frase entre aspas: evita erros de sintaxe do MATCH com a entrada do usuário
+    terms = [term.replace('"', '""') for term in text.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+@timed(rows=lambda found: len(found['results']))
+def search_conversations(query, username=None, role=None, start=None, end=None, limit=20, offset=0):
+    """Busca textual nas conversas, ordenada por relevância (bm25), com trechos destacados.
+
+    Filtros opcionais por usuário, papel (user/assistant) e intervalo [start, end).
+    Inclui as conversas já arquivadas (retention.search_archived), marcadas com 'archived'.
+    Retorna {'results': [...], 'has_more': bool}; usa LIKE se o FTS5 não estiver disponível.
+    """
+    empty = {'results': [], 'has_more': False}
+    if not query or not query.strip():
+        return empty
+    conditions = []
+    params = []
+    if username:
+        conditions.append("c.username = ?")
+        params.append(username)
+    if role:
+        conditions.append("c.role = ?")
+        params.append(role)
+    if start is not None:
+        conditions.append("c.timestamp >= ?")
+        params.append(str(start))
+    if end is not None:
+        conditions.append("c.timestamp < ?")
+        params.append(str(end))
+    filters = "".join(f" AND {condition}" for condition in conditions)
+    managers = [get_connection_manager(username)] if username else get_shard_managers()
+    import retention
+    archived = any(retention.archive_months(manager.db_path) for manager in managers)
+    # Com várias fontes (shards, arquivo morto) cada uma devolve as primeiras offset+limit+1 linhas
+    # e o OFFSET é aplicado na junção
+    merged = len(managers) > 1 or archived
+    shard_limit, shard_offset = (offset + limit + 1, 0) if merged else (limit + 1, offset)
+    try:
+        rows = []
+        for manager in managers:
+            with manager.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations_fts'")
+                if cursor.fetchone():
+                    cursor.execute(f'''
+                        SELECT c.id, c.username, c.role, c.timestamp,
+                               snippet(conversations_fts, 0, '**', '**', '…', 16),
+                               bm25(conversations_fts) AS rank
+                        FROM conversations_fts
+                        JOIN conversations c ON c.id = conversations_fts.rowid
+                        WHERE conversations_fts MATCH ?{filters}
+                        ORDER BY rank
+                        LIMIT ? OFFSET ?
+                    ''', [_fts_query(query)] + params + [shard_limit, shard_offset])
+                else:
+                    cursor.execute(f'''
+                        SELECT c.id, c.username, c.role, c.timestamp, substr(c.content, 1, 200), 0
+                        FROM conversations c
+                        WHERE c.content LIKE ?{filters}
+                        ORDER BY c.timestamp DESC, c.id DESC
+                        LIMIT ? OFFSET ?
+                    ''', [f"%{query.strip()}%"] + params + [shard_limit, shard_offset])
+                rows.extend(row + (False,) for row in cursor.fetchall())
+            if archived:
+                rows.extend(row + (True,) for row in retention.search_archived(
+                    manager.db_path, _fts_query(query), query, username, role, start, end, shard_limit))
+        if merged:
+            # Mesma ordem das consultas: relevância e, no empate (ou no LIKE), as mais recentes primeiro
+            rows.sort(key=lambda row: (row[3], row[0]), reverse=True)
+            rows.sort(key=lambda row: row[5])
+            rows = rows[offset:]
+        return {
+            'results': [{
+                'id': row[0],
+                'username': row[1],
+                'role': row[2],
+                'timestamp': row[3],
+                'snippet': row[4],
+                'rank': row[5],
+                'archived': row[6]
+            } for row in rows[:limit]],
+            'has_more': len(rows) > limit
+        }
+    except Exception as e:
+        print(f"Erro na busca de conversas: {e}")
+        return empty
+
+@timed()
+def get_cached_analysis(username, input_hash, max_age_seconds):
+    """Análise em cache para (usuário, hash das entradas), se ainda dentro do TTL"""
+    try:
+        with get_connection_manager(username).cursor() as cursor:
+            cursor.execute('''
+                SELECT result, created_at
+                FROM analysis_cache
+                WHERE username = ? AND input_hash = ?
+                  AND created_at >= datetime('now', ?)
+            ''', (username, input_hash, f"-{int(max_age_seconds)} seconds"))
+            row = cursor.fetchone()
+        if row:
+            return {'result': row[0], 'created_at': row[1]}
+        return None
+    except Exception as e:
+        print(f"Erro ao buscar análise em cache: {e}")
+        return None
+
+@timed()
+def save_cached_analysis(username, input_hash, result):
+    try:
+        with get_connection_manager(username).transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO analysis_cache (username, input_hash, result, created_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (username, input_hash) DO UPDATE SET
+                    result = excluded.result,
+                    created_at = excluded.created_at
+            ''', (username, input_hash, result))
+        return True
+    except Exception as e:
+        print(f"Erro ao salvar análise em cache: {e}")
+        return False
+
+def delete_cached_analysis(username, input_hash=None):
+    """Remove a análise em cache de um usuário (apenas a entrada informada, se houver hash)"""
+    try:
+        with get_connection_manager(username).transaction() as cursor:
+            if input_hash:
+                cursor.execute("DELETE FROM analysis_cache WHERE username = ? AND input_hash = ?",
+                               (username, input_hash))
+            else:
+                cursor.execute("DELETE FROM analysis_cache WHERE username = ?", (username,))
+        return True
+    except Exception as e:
+        print(f"Erro ao remover análise em cache: {e}")
+        return False
+
+@timed(rows=len)
+def get_scenario_openings(scenario, version):
+    """Aberturas pré-geradas do cenário para a versão do Assistant, na ordem das variantes"""
+    # Dados globais, não de um usuário: ficam sempre no shard principal
+    try:
+        with get_connection_manager().cursor() as cursor:
+            cursor.execute('''
+                SELECT content FROM scenario_openings
+                WHERE scenario = ? AND version = ?
+                ORDER BY variant
+            ''', (scenario, version))
+            return [row[0] for row in cursor.fetchall()]
+    except Exception as e:
+        print(f"Erro ao buscar aberturas do cenário: {e}")
+        return []
+
+@timed(rows=lambda saved: saved)
+def save_scenario_openings(scenario, version, openings):
+    """Substitui as aberturas do cenário pelas da versão informada; retorna quantas foram gravadas"""
+    try:
+        with get_connection_manager().transaction() as cursor:
+            # Versões antigas nunca mais são servidas
+            cursor.execute("DELETE FROM scenario_openings WHERE scenario = ?", (scenario,))
+            cursor.executemany('''
+                INSERT INTO scenario_openings (scenario, version, variant, content)
+                VALUES (?, ?, ?, ?)
+            ''', [(scenario, version, variant, content) for variant, content in enumerate(openings)])
+        return len(openings)
+    except Exception as e:
+        print(f"Erro ao salvar aberturas do cenário: {e}")
+        return 0
+
 def get_user_login_stats(username):
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT username, name, email, created_at, 
-                   (SELECT COUNT(*) FROM conversations WHERE username = ?) as total_messages,
-                   (SELECT COUNT(*) FROM user_actions WHERE username = ?) as total_actions
-            FROM users 
-            WHERE username = ?
-        ''', (username, username, username))
-        result = cursor.fetchone()
-        conn.close()
-        if result:
+        counters = get_user_counters(username)
+        if counters['exists']:
             return {
-                'username': result[0],
-                'name': result[1] or result[0],
-                'email': result[2],
-                'created_at': result[3],
-                'total_messages': result[4],
-                'total_actions': result[5],
+                'username': counters['username'],
+                'name': counters['name'],
+                'email': counters['email'],
+                'created_at': counters['created_at'],
+                'total_messages': counters['total_messages'],
+                'total_actions': counters['total_actions'],
                 'exists': True
             }
         else:
@@ -373,35 +1487,46 @@ def get_user_login_stats(username):
         print(f"Erro ao buscar stats de login: {e}")
         return {'exists': False}
 
+@timed()
 def database_health_check():
+    """Tabelas obrigatórias e totais de linhas, lidos dos contadores de table_counts (sem COUNT(*)).
+
+    Com shards, as tabelas são verificadas em cada arquivo e os totais somados.
+    """
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
+        managers = get_shard_managers()
         health = {
             'database_exists': True,
             'tables_exist': {},
             'total_users': 0,
             'total_conversations': 0,
             'total_actions': 0,
+            'archived_conversations': 0,
+            'archived_actions': 0,
+            'shards': len(managers),
             'issues': []
         }
         required_tables = ['users', 'conversations', 'user_actions', 'user_threads']
-        for table in required_tables:
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
-            exists = cursor.fetchone() is not None
-            health['tables_exist'][table] = exists
-            if not exists:
-                health['issues'].append(f"Tabela '{table}' não encontrada")
-        if health['tables_exist'].get('users'):
-            cursor.execute("SELECT COUNT(*) FROM users")
-            health['total_users'] = cursor.fetchone()[0]
-        if health['tables_exist'].get('conversations'):
-            cursor.execute("SELECT COUNT(*) FROM conversations")
-            health['total_conversations'] = cursor.fetchone()[0]
-        if health['tables_exist'].get('user_actions'):
-            cursor.execute("SELECT COUNT(*) FROM user_actions")
-            health['total_actions'] = cursor.fetchone()[0]
-        conn.close()
+        for manager in managers:
+            where = f" no shard {os.path.basename(manager.db_path)}" if len(managers) > 1 else ""
+            with manager.cursor() as cursor:
+                for table in required_tables:
+                    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+                    exists = cursor.fetchone() is not None
+                    health['tables_exist'][table] = health['tables_exist'].get(table, True) and exists
+                    if not exists:
+                        health['issues'].append(f"Tabela '{table}' não encontrada{where}")
+                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='table_counts'")
+                if cursor.fetchone() is not None:
+                    cursor.execute("SELECT table_name, row_count FROM table_counts")
+                    counts = dict(cursor.fetchall())
+                    health['total_users'] += counts.get('users', 0)
+                    health['total_conversations'] += counts.get('conversations', 0)
+                    health['total_actions'] += counts.get('user_actions', 0)
+                    health['archived_conversations'] += counts.get('archived_conversations', 0)
+                    health['archived_actions'] += counts.get('archived_user_actions', 0)
+                else:
+                    health['issues'].append(f"Tabela 'table_counts' não encontrada{where} (migrações pendentes)")
         health['is_healthy'] = len(health['issues']) == 0
         return health
     except Exception as e:
@@ -413,6 +1538,17 @@ def database_health_check():
         }
 
 if __name__ == "__main__":
-    init_database()
-else:
-    init_database()
+    import sys
+    ensure_database()
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "rebuild-stats":
+        if rebuild_user_stats():
+            print("✅ Resumo user_stats recriado")
+    elif command == "check-stats":
+        issues = check_user_stats_consistency()
+        if issues:
+            print(f"❌ {len(issues)} divergência(s) em user_stats:")
+            for issue in issues:
+                print(f"   {issue}")
+            sys.exit(1)
+        print("✅ user_stats consistente com user_actions")
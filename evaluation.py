@@ -0,0 +1,326 @@
+# evaluation.py
+"""Pipeline de avaliação automática das respostas dos usuários.
+
+Busca os turnos de usuário ainda não avaliados em `conversations`, agrupa vários
+turnos por requisição ao LLM, processa os lotes num pool de threads limitado
+(com limite opcional de requisições por segundo) e grava os resultados
+'acerto'/'erro' em lote como ações 'avaliacao_automatica'.
+
+É idempotente: cada avaliação guarda o conversation_id do turno e o índice único
+impede duplicatas, então uma execução interrompida pode simplesmente ser repetida.
+
+Uso: python evaluation.py [--stub] [--batch-size 10] [--workers 4] [--rps 2] [--limit N]
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import database as db
+
+EVALUATION_MODEL = os.getenv("EVALUATION_MODEL", "gpt-4-turbo")
+EVALUATION_ACTION_TYPE = 'avaliacao_automatica'
+EVALUATION_BATCH_SIZE = int(os.getenv("EVALUATION_BATCH_SIZE", "10"))
+EVALUATION_MAX_WORKERS = int(os.getenv("EVALUATION_MAX_WORKERS", "4"))
+# Máximo de turnos por execução disparada pelo dashboard (a CLI não tem limite padrão)
+EVALUATION_UI_LIMIT = int(os.getenv("EVALUATION_UI_LIMIT", "200"))
+OUTCOMES = ('acerto', 'erro')
+
+SYSTEM_PROMPT = """Você avalia respostas de gestores num simulador de casos de liderança.
+Para cada item, compare a resposta do usuário com o cenário apresentado e classifique a
+decisão como "acerto" (adequada, ética e bem fundamentada) ou "erro" (caso contrário).
+Responda somente com JSON no formato:
+{"avaliacoes": [{"id": <id>, "resultado": "acerto" | "erro", "justificativa": "<uma frase>"}]}"""
+
+
+class RateLimiter:
+    """Token bucket thread-safe: no máximo `rate` chamadas por segundo (None = sem limite)."""
+
+    def __init__(self, rate=None, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+def build_batch_prompt(turns):
+    items = [{'id': turn['id'], 'cenario': turn['context'], 'resposta': turn['content']} for turn in turns]
+    return json.dumps({'itens': items}, ensure_ascii=False)
+
+
+def parse_batch_response(text, turns):
+    """Converte o JSON do modelo em {conversation_id: (resultado, justificativa)}.
+
+    Itens ausentes ou com resultado inválido ficam de fora (serão reavaliados depois).
+    """
+    expected = {turn['id'] for turn in turns}
+    data = json.loads(text)
+    results = {}
+    for item in data.get('avaliacoes', []):
+        try:
+            turn_id = int(item.get('id'))
+        except (TypeError, ValueError):
+            continue
+        outcome = str(item.get('resultado', '')).strip().lower()
+        if turn_id in expected and outcome in OUTCOMES:
+            results[turn_id] = (outcome, item.get('justificativa', ''))
+    return results
+
+
+class OpenAIScorer:
+    """Avalia um lote de turnos com uma única chamada de chat completions.
+
+    `client` é um llm_client.LLMClient (concorrência, timeout e retry ficam a cargo dele).
+    """
+
+    def __init__(self, client, model=EVALUATION_MODEL):
+        self.client = client
+        self.model = model
+
+    def score(self, turns):
+        text = self.client.chat_completion(
+            model=self.model,
+            temperature=0,
+            response_format={"type": "json_object"},
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": build_batch_prompt(turns)},
+            ],
+        )
+        return parse_batch_response(text, turns)
+
+
+class StubScorer:
+    """Avaliador local determinístico, para testes e benchmarks sem rede.
+
+    `latency` simula o tempo de uma chamada ao LLM (em segundos, por lote).
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def score(self, turns):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        avaliacoes = []
+        for turn in turns:
+            digest = hashlib.sha256(turn['content'].encode('utf-8')).digest()
+            avaliacoes.append({
+                'id': turn['id'],
+                'resultado': OUTCOMES[digest[0] % 2],
+                'justificativa': 'avaliação simulada',
+            })
+        return parse_batch_response(json.dumps({'avaliacoes': avaliacoes}), turns)
+
+
+class EvaluationPipeline:
+    def __init__(self, scorer, batch_size=EVALUATION_BATCH_SIZE, max_workers=EVALUATION_MAX_WORKERS,
+                 requests_per_second=None, fetch_size=None):
+        self.scorer = scorer
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.fetch_size = fetch_size or batch_size * max_workers * 4
+        self.rate_limiter = RateLimiter(requests_per_second)
+
+    def _score_batch(self, turns):
+        self.rate_limiter.acquire()
+        return self.scorer.score(turns)
+
+    def run(self, limit=None, progress=None):
+        """Avalia turnos pendentes até esgotá-los (ou até `limit` turnos).
+
+        Lotes que falham não interrompem a execução: os turnos continuam pendentes
+        e serão pegos na próxima chamada. A marca d'água de cada shard avança enquanto
+        todos os turnos dele, em ordem de id, foram avaliados, então a próxima execução
+        recomeça do primeiro pendente de cada shard. Retorna um relatório com a vazão.
+        """
+        db.flush_pending_writes()
+        report = {'evaluated': 0, 'skipped': 0, 'requests': 0, 'failed_batches': 0, 'errors': []}
+        started = time.perf_counter()
+        after_id = 0
+        stalled = set()   # shards com turno não avaliado: a marca d'água para antes dele
+        finished = set()  # shards já percorridos até o fim nesta execução
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="evaluation") as executor:
+            while limit is None or report['evaluated'] + report['skipped'] < limit:
+                page_size = self.fetch_size
+                if limit is not None:
+                    page_size = min(page_size, limit - report['evaluated'] - report['skipped'])
+                # Lidos antes da busca: num shard percorrido até o fim, tudo até aqui já foi visto
+                horizons = db.get_last_conversation_ids()
+                turns = db.get_unevaluated_turns(after_id=after_id, limit=page_size)
+                rows = []
+                if turns:
+                    after_id = turns[-1]['id']
+                    batches = [turns[i:i + self.batch_size] for i in range(0, len(turns), self.batch_size)]
+                    futures = {executor.submit(self._score_batch, batch): batch for batch in batches}
+                    for future in as_completed(futures):
+                        batch = futures[future]
+                        report['requests'] += 1
+                        try:
+                            results = future.result()
+                        except Exception as e:
+                            report['failed_batches'] += 1
+                            report['errors'].append(str(e))
+                            continue
+                        for turn in batch:
+                            if turn['id'] in results:
+                                outcome, rationale = results[turn['id']]
+                                rows.append((turn['username'], EVALUATION_ACTION_TYPE, rationale, outcome, turn['id']))
+                        report['skipped'] += len(batch) - sum(1 for turn in batch if turn['id'] in results)
+                    inserted = db.save_user_actions_bulk(rows)
+                    if inserted is None:
+                        report['errors'].append("falha ao gravar o lote de avaliações")
+                        report['skipped'] += len(rows)
+                        rows = []
+                    else:
+                        report['evaluated'] += inserted
+                self._advance_watermarks(turns, rows, page_size, after_id, horizons, stalled, finished)
+                if not turns:
+                    break
+                if progress:
+                    progress(report)
+        elapsed = time.perf_counter() - started
+        report['elapsed'] = elapsed
+        report['evaluations_per_second'] = report['evaluated'] / elapsed if elapsed > 0 else 0.0
+        return report
+
+    @staticmethod
+    def _advance_watermarks(turns, rows, page_size, after_id, horizons, stalled, finished):
+        """Avança a marca d'água de cada shard até o último turno avaliado sem lacunas"""
+        evaluated_ids = {row[4] for row in rows}
+        upto_ids = {}
+        for turn in turns:
+            shard = db.conversation_shard(turn['id'])
+            if shard in stalled:
+                continue
+            if turn['id'] not in evaluated_ids:
+                # Para no primeiro turno sem avaliação: ele continua pendente para a próxima execução
+                stalled.add(shard)
+                continue
+            upto_ids[shard] = turn['id']
+        # Percorridos até o fim nesta página: com ela incompleta, todos os shards; senão,
+        # os anteriores ao do último turno (a busca só passa adiante ao esgotar um shard)
+        if len(turns) < page_size:
+            done = set(horizons)
+        else:
+            done = set(range(db.conversation_shard(after_id)))
+        for shard in done - finished - stalled:
+            if shard in horizons:
+                upto_ids[shard] = max(upto_ids.get(shard, 0), horizons[shard])
+        finished.update(done)
+        if upto_ids:
+            db.advance_evaluation_watermarks(upto_ids)
+
+
+class BackgroundEvaluations:
+    """Uma execução do pipeline por vez, numa thread própria: a página não espera o LLM."""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="evaluation-run")
+        self._lock = threading.Lock()
+        self._future = None
+        self._progress = None
+        self._report = None
+        self._error = None
+
+    def start(self, scorer, limit=EVALUATION_UI_LIMIT, **pipeline_options):
+        """Agenda a avaliação de até `limit` turnos; False se já houver uma em andamento."""
+        with self._lock:
+            if self._future is not None and not self._future.done():
+                return False
+            self._progress = None
+            self._error = None
+            pipeline = EvaluationPipeline(scorer, **pipeline_options)
+            self._future = self._executor.submit(self._run, pipeline, limit)
+            return True
+
+    def _run(self, pipeline, limit):
+        try:
+            report = pipeline.run(limit=limit, progress=self._record_progress)
+            with self._lock:
+                self._report = report
+        except Exception as e:
+            with self._lock:
+                self._error = str(e)
+
+    def _record_progress(self, report):
+        with self._lock:
+            self._progress = dict(report)
+
+    def status(self):
+        """{'running', 'progress', 'report', 'error'} da execução atual ou da última."""
+        with self._lock:
+            return {
+                'running': self._future is not None and not self._future.done(),
+                'progress': self._progress,
+                'report': self._report,
+                'error': self._error,
+            }
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def get_background_evaluations():
+    """Instância única por processo (sobrevive aos reruns do Streamlit)."""
+    global _background
+    if _background is None:
+        with _background_lock:
+            if _background is None:
+                _background = BackgroundEvaluations()
+    return _background
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avalia os turnos pendentes do simulador")
+    parser.add_argument("--stub", action="store_true", help="usa o avaliador local (sem OpenAI)")
+    parser.add_argument("--batch-size", type=int, default=EVALUATION_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=EVALUATION_MAX_WORKERS)
+    parser.add_argument("--rps", type=float, default=None, help="máximo de requisições por segundo")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.stub:
+        scorer = StubScorer()
+    else:
+        import llm_client
+        from dotenv import load_dotenv, find_dotenv
+        load_dotenv(find_dotenv())
+        scorer = OpenAIScorer(llm_client.get_llm_client(os.getenv("OPENAI_API_KEY")))
+
+    pipeline = EvaluationPipeline(scorer, batch_size=args.batch_size, max_workers=args.workers,
+                                  requests_per_second=args.rps)
+    report = pipeline.run(limit=args.limit)
+    print(f"✅ {report['evaluated']} turnos avaliados em {report['elapsed']:.1f} s "
+          f"({report['evaluations_per_second']:.1f} avaliações/s, {report['requests']} requisições)")
+    if report['failed_batches']:
+        print(f"⚠️ {report['failed_batches']} lotes falharam; os turnos continuam pendentes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# fake_openai.py
+"""Servidor HTTP local que imita os endpoints da OpenAI usados pelo simulador.
+
+Permite medir latência e vazão da camada llm_client sem rede nem custo:
+threads, mensagens, runs (com e sem streaming SSE), chat completions e a consulta do
+Assistant (cujas instruções podem ser trocadas para simular uma nova versão).
+A latência até o primeiro token, o intervalo entre tokens, a duração dos runs
+e uma taxa de erros 429/500 (para exercitar o retry) são configuráveis; `stall` segura
+a resposta depois de ler a requisição (timeout com a requisição já processada).
+
+Uso: python fake_openai.py [--port 8765] [--latency 0.3]
+     OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake streamlit run rpg_gestor.py
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY_WORDS = ("Considere", "o", "impacto", "da", "decisão", "na", "equipe", "e", "no", "cliente.",
+               "Qual", "seria", "o", "próximo", "passo?")
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Dezenas de usuários simulados conectam ao mesmo tempo
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # Conexões keep-alive fechadas pelo cliente não são erro do servidor
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeOpenAIServer:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, token_delay=0.005, tokens=40,
+                 run_duration=0.2, error_rate=0.0, prompt_token_latency=0.0, stall=0.0, seed=None):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.run_duration = run_duration
+        self.error_rate = error_rate
+        # Latência extra por token já presente na thread (o modelo relê a thread a cada run)
+        self.prompt_token_latency = prompt_token_latency
+        self.stall = stall
+        # Trocar as instruções muda a versão do Assistant vista pelo cache de aberturas
+        self.assistant_instructions = "Simulador de casos de liderança (fake)"
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._runs = {}
+        self._thread_tokens = {}
+        self.requests = 0
+        self.injected_errors = 0
+        self.requests_by_route = {}
+        self.active = 0
+        self.max_active = 0
+        self._httpd = _HTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'injected_errors': self.injected_errors,
+                    'max_active': self.max_active, 'by_route': dict(self.requests_by_route)}
+
+    def thread_tokens(self, thread_id):
+        with self._lock:
+            return self._thread_tokens.get(thread_id, 0)
+
+    def _add_tokens(self, thread_id, text):
+        with self._lock:
+            self._thread_tokens[thread_id] = self._thread_tokens.get(thread_id, 0) + (len(text) + 3) // 4 + 4
+
+    # --- objetos no formato da API ---
+
+    def _new_id(self, prefix):
+        return f"{prefix}_{next(self._ids)}"
+
+    def _reply_text(self):
+        return " ".join(REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(self.tokens))
+
+    def _message(self, thread_id, role, text, message_id=None):
+        return {
+            'id': message_id or self._new_id("msg"), 'object': 'thread.message', 'created_at': int(time.time()),
+            'thread_id': thread_id, 'role': role, 'status': 'completed', 'assistant_id': None, 'run_id': None,
+            'attachments': [], 'metadata': {},
+            'content': [{'type': 'text', 'text': {'value': text, 'annotations': []}}] if text else [],
+        }
+
+    def _run(self, thread_id, assistant_id, status, run_id=None):
+        return {
+            'id': run_id or self._new_id("run"), 'object': 'thread.run', 'created_at': int(time.time()),
+            'thread_id': thread_id, 'assistant_id': assistant_id, 'status': status, 'model': 'fake',
+            'instructions': '', 'tools': [], 'metadata': {}, 'parallel_tool_calls': True,
+        }
+
+    def _assistant(self, assistant_id):
+        return {
+            'id': assistant_id, 'object': 'assistant', 'created_at': 0, 'name': 'Simulador', 'description': None,
+            'model': 'fake', 'instructions': self.assistant_instructions, 'tools': [], 'metadata': {},
+        }
+
+    def _chat_completion(self, body):
+        content = self._reply_text()
+        if body.get('response_format'):
+            # Formato do pipeline de avaliação: um resultado para cada item recebido
+            try:
+                items = json.loads(body['messages'][-1]['content']).get('itens', [])
+            except (ValueError, KeyError, IndexError, AttributeError):
+                items = []
+            content = json.dumps({'avaliacoes': [
+                {'id': item.get('id'), 'resultado': self._rng.choice(['acerto', 'erro']), 'justificativa': 'fake'}
+                for item in items
+            ]})
+        return {
+            'id': self._new_id("chatcmpl"), 'object': 'chat.completion', 'created': int(time.time()),
+            'model': body.get('model', 'fake'),
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': content}}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': self.tokens, 'total_tokens': self.tokens},
+        }
+
+    # --- HTTP ---
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+            def _json(self, payload, status=200):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, text):
+                data = text.encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+            def _event(self, name, payload):
+                data = payload if isinstance(payload, str) else json.dumps(payload)
+                self._chunk(f"event: {name}\ndata: {data}\n\n")
+
+            def _stream_run(self, thread_id, assistant_id):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                run = server._run(thread_id, assistant_id, 'in_progress')
+                self._event('thread.run.created', run)
+                time.sleep(server.latency + server.thread_tokens(thread_id) * server.prompt_token_latency)
+                message = server._message(thread_id, 'assistant', '')
+                self._event('thread.message.created', message)
+                words = server._reply_text().split(" ")
+                for index, word in enumerate(words):
+                    value = word if index == 0 else " " + word
+                    self._event('thread.message.delta', {
+                        'id': message['id'], 'object': 'thread.message.delta',
+                        'delta': {'content': [{'index': 0, 'type': 'text',
+                                               'text': {'value': value, 'annotations': []}}]},
+                    })
+                    if server.token_delay:
+                        time.sleep(server.token_delay)
+                self._event('thread.message.completed',
+                            server._message(thread_id, 'assistant', " ".join(words), message['id']))
+                self._event('thread.run.completed', dict(run, status='completed'))
+                self._event('done', '[DONE]')
+                server._add_tokens(thread_id, " ".join(words))
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def _handle(self, method):
+                with server._lock:
+                    server.requests += 1
+                    route = f"{method} {self.path.split('?')[0]}"
+                    server.requests_by_route[route] = server.requests_by_route.get(route, 0) + 1
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                    fail = server.error_rate and server._rng.random() < server.error_rate
+                    if fail:
+                        server.injected_errors += 1
+                try:
+                    body = self._body() if method == 'POST' else {}
+                    if server.stall:
+                        # A requisição chegou inteira; o cliente desiste antes da resposta
+                        time.sleep(server.stall)
+                    if fail:
+                        status = server._rng.choice([429, 500])
+                        self._json({'error': {'message': 'erro simulado', 'type': 'server_error',
+                                              'code': None, 'param': None}}, status)
+                        return
+                    self._route(method, self.path.split('?')[0], body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Cliente cancelou o streaming no meio
+                    self.close_connection = True
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+            def _route(self, method, path, body):
+                if method == 'POST' and path == '/v1/threads':
+                    thread_id = server._new_id("thread")
+                    for message in body.get('messages') or []:
+                        server._add_tokens(thread_id, str(message.get('content', '')))
+                    self._json({'id': thread_id, 'object': 'thread',
+                                'created_at': int(time.time()), 'metadata': {}, 'tool_resources': None})
+                    return
+                if method == 'POST' and path == '/v1/chat/completions':
+                    time.sleep(server.latency + server.token_delay * server.tokens)
+                    self._json(server._chat_completion(body))
+                    return
+                match = re.fullmatch(r'/v1/assistants/([^/]+)', path)
+                if method == 'GET' and match:
+                    self._json(server._assistant(match.group(1)))
+                    return
+                match = re.fullmatch(r'/v1/threads/([^/]+)/(messages|runs)(?:/([^/]+))?', path)
+                if not match:
+                    self._json({'error': {'message': f'rota desconhecida: {path}', 'type': 'invalid_request_error'}}, 404)
+                    return
+                thread_id, resource, item_id = match.groups()
+                if resource == 'messages' and method == 'POST':
+                    server._add_tokens(thread_id, str(body.get('content', '')))
+                    self._json(server._message(thread_id, body.get('role', 'user'), str(body.get('content', ''))))
+                elif resource == 'messages':
+                    self._json({'object': 'list', 'has_more': False, 'first_id': None, 'last_id': None,
+                                'data': [server._message(thread_id, 'assistant', server._reply_text())]})
+                elif method == 'POST' and body.get('stream'):
+                    self._stream_run(thread_id, body.get('assistant_id'))
+                elif method == 'POST':
+                    run = server._run(thread_id, body.get('assistant_id'), 'queued')
+                    with server._lock:
+                        server._runs[run['id']] = time.perf_counter()
+                    self._json(run)
+                else:
+                    with server._lock:
+                        created = server._runs.get(item_id, 0)
+                    done = time.perf_counter() - created >= server.run_duration
+                    self._json(server._run(thread_id, None, 'completed' if done else 'in_progress', item_id))
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor OpenAI falso para testes offline")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="segundos até o primeiro token")
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--prompt-token-latency", type=float, default=0.0,
+                        help="segundos extras por token já presente na thread")
+    args = parser.parse_args()
+    server = FakeOpenAIServer(args.host, args.port, latency=args.latency, token_delay=args.token_delay,
+                              tokens=args.tokens, error_rate=args.error_rate,
+                              prompt_token_latency=args.prompt_token_latency)
+    print(f"🧪 Servidor OpenAI falso em {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# instrumentation.py
+"""Métricas leves das chamadas ao banco e à OpenAI, em memória e por processo.
+
+Cada série (p.ex. "database.get_user_history_page" ou "openai.threads.create")
+acumula chamadas, erros, linhas retornadas e um histograma de latência com buckets
+fixos, de onde saem p50/p95/p99 aproximados. Consultas SQL acima de SLOW_QUERY_MS
+entram num log circular junto com o `EXPLAIN QUERY PLAN` da consulta.
+
+As métricas podem ser exportadas como JSON ou no formato texto do Prometheus.
+Com INSTRUMENTATION_ENABLED=0 os decoradores e o cursor medido viram no-ops.
+"""
+import atexit
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION_ENABLED", "1") != "0"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "50"))
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH", "")
+# Limites superiores dos buckets, em ms (o último bucket é +Inf)
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+PROMETHEUS_PREFIX = "simulador"
+_UNTIMED_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'PRAGMA', 'EXPLAIN')
+
+
+class _Series:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, elapsed_ms, rows, error):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if rows:
+            self.rows += rows
+        if error:
+            self.errors += 1
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, q):
+        """Limite superior do bucket que contém o quantil q (limitado pelo máximo observado)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for index, bucket in enumerate(self.buckets[:-1]):
+            cumulative += bucket
+            if cumulative >= target:
+                return min(LATENCY_BUCKETS_MS[index], self.max_ms)
+        return self.max_ms
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'rows': self.rows,
+            'total_ms': self.total_ms,
+            'avg_ms': self.total_ms / self.count if self.count else 0.0,
+            'max_ms': self.max_ms,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': list(self.buckets),
+        }
+
+
+class Registry:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS, slow_query_log_size=SLOW_QUERY_LOG_SIZE):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._series = {}
+        self._counters = {}
+        self._slow_queries = deque(maxlen=slow_query_log_size)
+        self.started_at = time.time()
+
+    def observe(self, name, seconds, rows=None, error=False):
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = _Series()
+            series.add(seconds * 1000, rows, error)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def record_slow_query(self, sql, elapsed_ms, plan):
+        entry = {
+            'sql': " ".join(sql.split()),
+            'elapsed_ms': elapsed_ms,
+            'plan': plan,
+            'at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with self._lock:
+            self._slow_queries.append(entry)
+        print(f"🐢 Consulta lenta ({elapsed_ms:.0f} ms): {entry['sql'][:200]}")
+        for line in plan:
+            print(f"   {line}")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'uptime_seconds': time.time() - self.started_at,
+                'series': {name: series.as_dict() for name, series in sorted(self._series.items())},
+                'counters': dict(sorted(self._counters.items())),
+                'slow_queries': list(self._slow_queries),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._counters.clear()
+            self._slow_queries.clear()
+            self.started_at = time.time()
+
+
+registry = Registry()
+
+
+def observe(name, seconds, rows=None, error=False):
+    if INSTRUMENTATION_ENABLED:
+        registry.observe(name, seconds, rows, error)
+
+
+def increment(name, amount=1):
+    if INSTRUMENTATION_ENABLED:
+        registry.increment(name, amount)
+
+
+def snapshot():
+    return registry.snapshot()
+
+
+def reset():
+    registry.reset()
+
+
+class _Span:
+    def __init__(self):
+        self.rows = None
+        self.error = False
+
+
+@contextmanager
+def span(name):
+    """Mede o bloco `with`; atribua `span.rows` para registrar linhas e `span.error` para falhas tratadas."""
+    current = _Span()
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        current.error = True
+        raise
+    finally:
+        observe(name, time.perf_counter() - started, current.rows, current.error)
+
+
+def timed(name=None, rows=None):
+    """Decorador que registra chamadas, latência e (com `rows(resultado)`) linhas da função."""
+    def decorate(fn):
+        if not INSTRUMENTATION_ENABLED:
+            return fn
+        series = name or f"{fn.__module__}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                observe(series, time.perf_counter() - started, error=True)
+                raise
+            elapsed = time.perf_counter() - started
+            count = None
+            if rows is not None:
+                try:
+                    count = rows(result)
+                except Exception:
+                    # Retorno de erro (None, {}) de funções que tratam as próprias exceções
+                    count = None
+            observe(series, elapsed, count)
+            return result
+        return wrapper
+    return decorate
+
+
+class QueryCursor:
+    """Cursor sqlite3 que mede cada execute/executemany e registra as consultas lentas.
+
+    Erros (inclusive "database is locked") são contados aqui, antes de as funções
+    de database.py os transformarem em `print` e valores padrão.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, sql, params=()):
+        self._timed("sqlite.execute", self._cursor.execute, sql, params, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = seq_of_params if isinstance(seq_of_params, (list, tuple)) else list(seq_of_params)
+        sample = seq_of_params[0] if seq_of_params else ()
+        self._timed("sqlite.executemany", self._cursor.executemany, sql, seq_of_params, sample)
+        return self
+
+    def _timed(self, series, method, sql, params, sample_params):
+        started = time.perf_counter()
+        try:
+            method(sql, params)
+        except sqlite3.Error as e:
+            observe(series, time.perf_counter() - started, error=True)
+            if isinstance(e, sqlite3.OperationalError) and 'locked' in str(e):
+                increment("sqlite.locked")
+            raise
+        elapsed = time.perf_counter() - started
+        observe(series, elapsed)
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms >= registry.slow_query_ms and INSTRUMENTATION_ENABLED:
+            statement = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+            if statement not in _UNTIMED_STATEMENTS:
+                increment("sqlite.slow_queries")
+                registry.record_slow_query(sql, elapsed_ms, self._explain(sql, sample_params))
+
+    def _explain(self, sql, params):
+        try:
+            cursor = self._cursor.connection.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[3] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            return [f"(plano indisponível: {e})"]
+
+
+def wrap_cursor(cursor):
+    return QueryCursor(cursor) if INSTRUMENTATION_ENABLED else cursor
+
+
+# --- exportação ---
+
+def to_json(data=None, indent=2):
+    return json.dumps(data or snapshot(), indent=indent, ensure_ascii=False)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(data=None):
+    """Métricas no formato de exposição texto do Prometheus."""
+    data = data or snapshot()
+    metric = f"{PROMETHEUS_PREFIX}_call_duration_seconds"
+    lines = [f"# HELP {metric} Latência das chamadas instrumentadas.", f"# TYPE {metric} histogram"]
+    for name, series in data['series'].items():
+        cumulative = 0
+        for bound, bucket in zip(LATENCY_BUCKETS_MS + ('+Inf',), series['buckets']):
+            cumulative += bucket
+            le = bound if bound == '+Inf' else f"{bound / 1000:g}"
+            lines.append(f'{metric}_bucket{{name="{_label(name)}",le="{le}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{name="{_label(name)}"}} {series["total_ms"] / 1000:.6f}')
+        lines.append(f'{metric}_count{{name="{_label(name)}"}} {series["count"]}')
+    for suffix, key, help_text in (("errors", 'errors', "Chamadas que terminaram em erro."),
+                                   ("rows", 'rows', "Linhas retornadas ou gravadas.")):
+        lines.append(f"# HELP {PROMETHEUS_PREFIX}_call_{suffix}_total {help_text}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_call_{suffix}_total counter")
+        for name, series in data['series'].items():
+            lines.append(f'{PROMETHEUS_PREFIX}_call_{suffix}_total{{name="{_label(name)}"}} {series[key]}')
+    lines.append(f"# HELP {PROMETHEUS_PREFIX}_events_total Eventos contados (bloqueios, consultas lentas).")
+    lines.append(f"# TYPE {PROMETHEUS_PREFIX}_events_total counter")
+    for name, value in data['counters'].items():
+        lines.append(f'{PROMETHEUS_PREFIX}_events_total{{name="{_label(name)}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path, file_format=None):
+    """Grava as métricas em `path` ('json' ou 'prometheus'; padrão pela extensão)."""
+    if file_format is None:
+        file_format = 'json' if str(path).endswith('.json') else 'prometheus'
+    if file_format == 'json':
+        text = to_json()
+    elif file_format == 'prometheus':
+        text = to_prometheus()
+    else:
+        raise ValueError(f"Formato de métricas desconhecido: {file_format}")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+
+if METRICS_DUMP_PATH:
+    atexit.register(write_metrics, METRICS_DUMP_PATH)
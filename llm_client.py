@@ -0,0 +1,337 @@
+# llm_client.py
+"""Camada assíncrona de acesso à OpenAI compartilhada pelo processo.
+
+Um único `openai.AsyncOpenAI` (e seu pool de conexões HTTP keep-alive) roda num
+event loop em thread própria. Todas as chamadas passam por um semáforo que limita
+a concorrência por processo, têm timeout e são repetidas com backoff exponencial
+com jitter em erros transitórios (conexão, timeout, 408/409/429/5xx). Chamadas que
+criam recursos (threads, mensagens, runs) só são repetidas quando a requisição
+certamente não foi processada: falha ao conectar ou 429. Um timeout ou 5xx pode ter
+chegado ao servidor, e repetir criaria uma thread ou mensagem duplicada.
+
+O Streamlit é síncrono, então a classe expõe também métodos síncronos que
+agendam a corrotina no loop e aguardam o resultado; `stream_reply` devolve os
+deltas do Assistant como um gerador comum.
+
+Para benchmarks offline aponte OPENAI_BASE_URL para o servidor de fake_openai.py.
+"""
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+
+import instrumentation
+
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "64"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "8"))
+RUN_POLL_INTERVAL = 0.25
+RUN_POLL_MAX_INTERVAL = 2.0
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+def backoff_delay(attempt, base=OPENAI_BACKOFF_BASE, cap=OPENAI_BACKOFF_MAX, rng=random.random):
+    """Backoff exponencial com "full jitter": uniforme em [0, min(cap, base * 2^attempt)]."""
+    return rng() * min(cap, base * (2 ** attempt))
+
+
+# Erros do cliente HTTP do SDK (httpx ou, nas versões novas, httpx2) em que nada foi enviado
+NOT_SENT_ERRORS = ('ConnectError', 'ConnectTimeout', 'PoolTimeout')
+
+
+def _not_sent(error):
+    # O SDK encadeia o erro do cliente HTTP: só falhas ao abrir a conexão garantem que nada foi enviado
+    cause = error.__cause__
+    return cause is not None and any(cls.__name__ in NOT_SENT_ERRORS for cls in type(cause).__mro__)
+
+
+def is_retryable(error, idempotent=True):
+    """Se vale repetir a chamada; `idempotent=False` para POSTs que criam recursos."""
+    import openai
+    if not idempotent:
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code == 429
+        return isinstance(error, openai.APIConnectionError) and _not_sent(error)
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def _retry_after(error):
+    # Respeita o Retry-After enviado junto com 429/503, quando houver
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+class LLMClient:
+    def __init__(self, api_key=None, base_url=None, max_concurrency=OPENAI_MAX_CONCURRENCY,
+                 timeout=OPENAI_TIMEOUT_SECONDS, max_retries=OPENAI_MAX_RETRIES,
+                 backoff_base=OPENAI_BACKOFF_BASE, backoff_max=OPENAI_BACKOFF_MAX):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._loop = None
+        self._client = None
+        self._semaphore = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self._errors = 0
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._total_latency = 0.0
+
+    # --- event loop e cliente compartilhados ---
+
+    def _ensure_started(self):
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._create_client(), loop).result()
+                self._loop = loop
+        return self._loop
+
+    async def _create_client(self):
+        import openai
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # As repetições ficam a cargo de _call (com jitter); o SDK não repete sozinho
+        self._client = openai.AsyncOpenAI(api_key=self.api_key, base_url=self.base_url,
+                                          timeout=self.timeout, max_retries=0)
+
+    def submit(self, coro):
+        """Agenda a corrotina no loop do cliente e retorna um concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started())
+
+    def run(self, coro):
+        """Executa a corrotina no loop do cliente e bloqueia até o resultado."""
+        return self.submit(coro).result()
+
+    def close(self):
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._client.close(), loop).result()
+        asyncio.run_coroutine_threadsafe(loop.shutdown_asyncgens(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    # --- núcleo: concorrência limitada, timeout e retry ---
+
+    def _record(self, started=None, in_flight=0, retry=False, error=False):
+        with self._metrics_lock:
+            self._in_flight += in_flight
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+            if started is not None:
+                self._requests += 1
+                self._total_latency += time.perf_counter() - started
+            if retry:
+                self._retries += 1
+            if error:
+                self._errors += 1
+
+    async def _call(self, request, operation="request", idempotent=True):
+        """Executa `request(client)` com o semáforo do processo e retry com backoff.
+
+        Com `idempotent=False` (criação de thread, mensagem ou run) só repete o que
+        certamente não chegou ao servidor; ver `is_retryable`. Cada tentativa é
+        registrada na série "openai.<operation>" da instrumentação.
+        """
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                started = time.perf_counter()
+                self._record(in_flight=1)
+                error = None
+                try:
+                    return await request(self._client)
+                except Exception as e:
+                    error = e
+                finally:
+                    self._record(started=started, in_flight=-1)
+                    instrumentation.observe(f"openai.{operation}", time.perf_counter() - started,
+                                            error=error is not None)
+            if attempt >= self.max_retries or not is_retryable(error, idempotent):
+                self._record(error=True)
+                raise error
+            self._record(retry=True)
+            await asyncio.sleep(max(_retry_after(error),
+                                    backoff_delay(attempt, self.backoff_base, self.backoff_max)))
+            attempt += 1
+
+    # --- API assíncrona ---
+
+    async def acreate_thread(self, messages=None):
+        """Cria uma thread, opcionalmente já com mensagens iniciais [{'role', 'content'}]."""
+        if messages:
+            thread = await self._call(lambda client: client.beta.threads.create(messages=messages),
+                                      "threads.create", idempotent=False)
+        else:
+            thread = await self._call(lambda client: client.beta.threads.create(), "threads.create",
+                                      idempotent=False)
+        return thread.id
+
+    async def aretrieve_assistant(self, assistant_id):
+        return await self._call(lambda client: client.beta.assistants.retrieve(assistant_id),
+                                "assistants.retrieve")
+
+    async def aadd_message(self, thread_id, content, role="user"):
+        return await self._call(lambda client: client.beta.threads.messages.create(
+            thread_id=thread_id, role=role, content=content), "messages.create", idempotent=False)
+
+    async def astream_run(self, thread_id, assistant_id):
+        """Gera os deltas de texto de um run em streaming.
+
+        Só repete a chamada se a falha ocorrer antes do primeiro delta (depois
+        disso repetir duplicaria texto já exibido) e, como cada tentativa cria um
+        run, só nos erros em que a requisição não foi processada.
+        """
+        attempt = 0
+        while True:
+            received = False
+            async with self._semaphore:
+                started = time.perf_counter()
+                self._record(in_flight=1)
+                error = None
+                deltas = 0
+                try:
+                    async with self._client.beta.threads.runs.stream(
+                        thread_id=thread_id, assistant_id=assistant_id
+                    ) as stream:
+                        async for delta in stream.text_deltas:
+                            if not received:
+                                instrumentation.observe("openai.runs.stream.first_token",
+                                                        time.perf_counter() - started)
+                            received = True
+                            deltas += 1
+                            yield delta
+                    return
+                except Exception as e:
+                    error = e
+                finally:
+                    self._record(started=started, in_flight=-1)
+                    # rows = deltas recebidos
+                    instrumentation.observe("openai.runs.stream", time.perf_counter() - started,
+                                            rows=deltas, error=error is not None)
+            if received or attempt >= self.max_retries or not is_retryable(error, idempotent=False):
+                self._record(error=True)
+                raise error
+            self._record(retry=True)
+            await asyncio.sleep(max(_retry_after(error),
+                                    backoff_delay(attempt, self.backoff_base, self.backoff_max)))
+            attempt += 1
+
+    async def arun_and_wait(self, thread_id, assistant_id):
+        """Cria um run, aguarda a conclusão e retorna o texto da última mensagem."""
+        run = await self._call(lambda client: client.beta.threads.runs.create(
+            thread_id=thread_id, assistant_id=assistant_id), "runs.create", idempotent=False)
+        interval = RUN_POLL_INTERVAL
+        # Tempo total do polling; rows = número de consultas ao status do run
+        with instrumentation.span("openai.run_wait") as wait:
+            wait.rows = 0
+            while run.status in ('queued', 'in_progress', 'cancelling'):
+                # A espera não ocupa vaga no semáforo
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, RUN_POLL_MAX_INTERVAL)
+                run = await self._call(lambda client: client.beta.threads.runs.retrieve(
+                    thread_id=thread_id, run_id=run.id), "runs.retrieve")
+                wait.rows += 1
+            wait.error = run.status != 'completed'
+        if run.status != 'completed':
+            raise RuntimeError(f"Erro na execução do Assistant: {run.status}")
+        messages = await self._call(lambda client: client.beta.threads.messages.list(
+            thread_id=thread_id, order='desc', limit=1), "messages.list")
+        return messages.data[0].content[0].text.value
+
+    async def aanalyze(self, prompt, assistant_id):
+        thread_id = await self.acreate_thread()
+        await self.aadd_message(thread_id, prompt)
+        return await self.arun_and_wait(thread_id, assistant_id)
+
+    async def achat_completion(self, **kwargs):
+        response = await self._call(lambda client: client.chat.completions.create(**kwargs),
+                                    "chat.completions.create")
+        return response.choices[0].message.content
+
+    # --- fachada síncrona (Streamlit, pools de threads) ---
+
+    def create_thread(self, messages=None):
+        return self.run(self.acreate_thread(messages))
+
+    def retrieve_assistant(self, assistant_id):
+        return self.run(self.aretrieve_assistant(assistant_id))
+
+    def analyze(self, prompt, assistant_id):
+        return self.run(self.aanalyze(prompt, assistant_id))
+
+    def chat_completion(self, **kwargs):
+        return self.run(self.achat_completion(**kwargs))
+
+    def stream_reply(self, thread_id, assistant_id, content):
+        """Envia a mensagem do usuário e gera os deltas da resposta (gerador síncrono)."""
+        deltas = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                await self.aadd_message(thread_id, content)
+                async for delta in self.astream_run(thread_id, assistant_id):
+                    deltas.put(delta)
+            except Exception as e:
+                deltas.put(e)
+            finally:
+                deltas.put(done)
+
+        future = self.submit(pump())
+        try:
+            while True:
+                item = deltas.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Consumidor parou antes do fim (ex.: rerun do Streamlit): cancela o streaming
+            future.cancel()
+
+    def metrics(self):
+        with self._metrics_lock:
+            return {
+                'requests': self._requests,
+                'retries': self._retries,
+                'errors': self._errors,
+                'in_flight': self._in_flight,
+                'max_in_flight': self._max_in_flight,
+                'avg_latency_ms': (self._total_latency / self._requests * 1000) if self._requests else 0.0,
+            }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(api_key=None, base_url=None):
+    """Cliente único por (api_key, base_url) no processo, compartilhado entre páginas e sessões."""
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = LLMClient(api_key=api_key, base_url=base_url)
+        return client
@@ -0,0 +1,326 @@
+# migrations.py
+"""Migrações versionadas do esquema do simulador.
+
+Cada migração é aplicada uma única vez, em ordem, dentro da sua própria transação,
+e registrada na tabela schema_version.
+"""
+import sqlite3
+
+import stats_rollup
+
+
+def _create_base_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            name TEXT,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_admin BOOLEAN DEFAULT FALSE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (username) REFERENCES users (username)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_actions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            action_type TEXT NOT NULL,
+            action_data TEXT,
+            outcome TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (username) REFERENCES users (username)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_threads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            thread_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (username) REFERENCES users (username)
+        )
+    ''')
+
+
+def _add_users_name_column(cursor):
+    # Bancos criados antes da coluna 'name' existir
+    cursor.execute("PRAGMA table_info(users)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'name' not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN name TEXT")
+        cursor.execute("UPDATE users SET name = username WHERE name IS NULL")
+
+
+def _create_history_and_action_indexes(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_username_timestamp "
+                   "ON conversations (username, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_actions_username_timestamp "
+                   "ON user_actions (username, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_actions_username_type_outcome "
+                   "ON user_actions (username, action_type, outcome)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_actions_timestamp "
+                   "ON user_actions (timestamp)")
+
+
+def _create_analysis_cache(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            username TEXT NOT NULL,
+            input_hash TEXT NOT NULL,
+            result TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (username, input_hash)
+        )
+    ''')
+
+
+def _create_nocase_user_indexes(cursor):
+    # Permite buscas case-insensitive (COLLATE NOCASE) sem varrer a tabela
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_username_nocase "
+                   "ON users (username COLLATE NOCASE)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_email_nocase "
+                   "ON users (email COLLATE NOCASE)")
+
+
+def _create_conversations_fts(cursor):
+    # Índice FTS5 de conteúdo externo: guarda só o índice, o texto fica em conversations
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+                content,
+                content='conversations',
+                content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        # SQLite compilado sem FTS5: a busca usa LIKE como alternativa
+        print(f"⚠️ FTS5 indisponível, busca textual usará LIKE: {e}")
+        return
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_conversations_fts_insert
+        AFTER INSERT ON conversations BEGIN
+            INSERT INTO conversations_fts (rowid, content) VALUES (NEW.id, NEW.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_conversations_fts_delete
+        AFTER DELETE ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, content)
+            VALUES ('delete', OLD.id, OLD.content);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_conversations_fts_update
+        AFTER UPDATE OF content ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, content)
+            VALUES ('delete', OLD.id, OLD.content);
+            INSERT INTO conversations_fts (rowid, content) VALUES (NEW.id, NEW.content);
+        END
+    ''')
+    cursor.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')")
+
+
+def _add_evaluation_source(cursor):
+    # Liga cada avaliação automática ao turno avaliado; o índice único torna a gravação idempotente
+    cursor.execute("PRAGMA table_info(user_actions)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'conversation_id' not in columns:
+        cursor.execute("ALTER TABLE user_actions ADD COLUMN conversation_id INTEGER")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_user_actions_conversation_id "
+                   "ON user_actions (conversation_id) WHERE conversation_id IS NOT NULL")
+
+
+def _add_thread_context(cursor):
+    cursor.execute("PRAGMA table_info(user_threads)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if 'token_count' not in columns:
+        cursor.execute("ALTER TABLE user_threads ADD COLUMN token_count INTEGER NOT NULL DEFAULT 0")
+    if 'turn_count' not in columns:
+        cursor.execute("ALTER TABLE user_threads ADD COLUMN turn_count INTEGER NOT NULL DEFAULT 0")
+    if 'rotated_at' not in columns:
+        cursor.execute("ALTER TABLE user_threads ADD COLUMN rotated_at TIMESTAMP")
+    # Threads existentes contêm todo o histórico do usuário (mesma estimativa de thread_context)
+    cursor.execute('''
+        UPDATE user_threads SET
+            token_count = (SELECT COALESCE(SUM((length(c.content) + 3) / 4 + 4), 0)
+                           FROM conversations c WHERE c.username = user_threads.username),
+            turn_count = (SELECT COUNT(*) FROM conversations c
+                          WHERE c.username = user_threads.username AND c.role = 'user')
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            thread_id TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            upto_timestamp TIMESTAMP,
+            upto_id INTEGER,
+            token_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversation_summaries_username "
+                   "ON conversation_summaries (username, id)")
+
+
+def _create_users_listing_index(cursor):
+    # Paginação por cursor (created_at, id) em list_users
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON users (created_at, id)")
+
+
+# Contadas por triggers em table_counts, para que database_health_check não faça COUNT(*)
+COUNTED_TABLES = ('users', 'conversations', 'user_actions')
+# Linhas movidas para o arquivo morto; atualizadas por retention.py
+ARCHIVE_COUNTERS = ('archived_conversations', 'archived_user_actions')
+
+
+def _create_table_counts(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_counts (
+            table_name TEXT PRIMARY KEY,
+            row_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table in COUNTED_TABLES:
+        cursor.execute(f"INSERT OR REPLACE INTO table_counts (table_name, row_count) "
+                       f"SELECT '{table}', COUNT(*) FROM {table}")
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_insert
+            AFTER INSERT ON {table} BEGIN
+                UPDATE table_counts SET row_count = row_count + 1 WHERE table_name = '{table}';
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_count_delete
+            AFTER DELETE ON {table} BEGIN
+                UPDATE table_counts SET row_count = row_count - 1 WHERE table_name = '{table}';
+            END
+        ''')
+    for counter in ARCHIVE_COUNTERS:
+        cursor.execute("INSERT OR IGNORE INTO table_counts (table_name, row_count) VALUES (?, 0)", (counter,))
+
+
+def _prepare_archival(cursor):
+    # O arquivamento seleciona por data em conversations (user_actions já tem idx_user_actions_timestamp)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations (timestamp)")
+    stats_rollup.create_archive_baseline(cursor)
+
+
+def _create_scenario_openings(cursor):
+    # Aberturas pré-geradas por cenário e versão do Assistant; ver scenario_openings.py
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scenario_openings (
+            scenario TEXT NOT NULL,
+            version TEXT NOT NULL,
+            variant INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (scenario, version, variant)
+        )
+    ''')
+
+
+def _create_user_emails(cursor):
+    # Com shards, o UNIQUE de users.email vale só dentro de cada arquivo: o shard principal
+    # guarda o índice global e-mail -> username (ver database._reserve_emails)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_emails (
+            email TEXT PRIMARY KEY COLLATE NOCASE,
+            username TEXT NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_emails_username ON user_emails (username)")
+    cursor.execute("INSERT OR IGNORE INTO user_emails (email, username) SELECT email, username FROM users")
+
+
+def _create_evaluation_progress(cursor):
+    # Marca d'água da avaliação automática: todo turno de usuário com id <= last_id já foi
+    # avaliado, então a busca por pendentes não precisa revarrer o histórico inteiro
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS evaluation_progress (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+# (versão, descrição, função) — nunca altere uma migração já publicada; adicione uma nova
+MIGRATIONS = [
+    (1, "tabelas base", _create_base_tables),
+    (2, "coluna users.name", _add_users_name_column),
+    (3, "índices de histórico e ações", _create_history_and_action_indexes),
+    (4, "resumo user_stats mantido por triggers", stats_rollup.create_rollup),
+    (5, "cache de análises subjetivas", _create_analysis_cache),
+    (6, "índices case-insensitive de usuários", _create_nocase_user_indexes),
+    (7, "busca textual (FTS5) em conversations", _create_conversations_fts),
+    (8, "user_actions.conversation_id para avaliações automáticas", _add_evaluation_source),
+    (9, "contagem de tokens por thread e resumos de conversa", _add_thread_context),
+    (10, "índice de paginação de usuários", _create_users_listing_index),
+    (11, "contadores de linhas mantidos por triggers", _create_table_counts),
+    (12, "arquivamento: índice por data e base arquivada do resumo", _prepare_archival),
+    (13, "cache de aberturas de cenário", _create_scenario_openings),
+    (14, "índice global de e-mails (unicidade entre shards)", _create_user_emails),
+    (15, "marca d'água da avaliação automática", _create_evaluation_progress),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """Versão atual do esquema (0 se nenhuma migração foi aplicada)."""
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    version = cursor.fetchone()[0]
+    cursor.close()
+    return version
+
+
+def run_migrations(conn, target_version=None):
+    """Aplica as migrações pendentes até target_version (padrão: a mais recente).
+
+    Retorna a lista de versões aplicadas nesta chamada.
+    """
+    if target_version is None:
+        target_version = LATEST_VERSION
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version > target_version:
+            break
+        if version <= get_schema_version(conn):
+            continue
+        cursor = conn.cursor()
+        try:
+            # BEGIN IMMEDIATE serializa processos que inicializam o banco ao mesmo tempo
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,))
+            if cursor.fetchone() is None:
+                migrate(cursor)
+                cursor.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                               (version, description))
+                applied.append(version)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    return applied
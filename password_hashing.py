@@ -0,0 +1,201 @@
+# password_hashing.py
+"""Hash de senhas lento e com custo configurável (bcrypt ou scrypt).
+
+O hash e a verificação rodam num pool de threads limitado, para que vários logins
+simultâneos não ocupem todos os núcleos do servidor do Streamlit. O hash guarda o
+esquema e os parâmetros de custo: `needs_rehash` indica quando ele foi gerado com
+parâmetros diferentes dos atuais (ou é o SHA-256 legado, sem salt), e o login o
+regrava de forma transparente.
+
+bcrypt é usado quando o pacote estiver instalado; caso contrário, hashlib.scrypt.
+"""
+import base64
+import hashlib
+import hmac
+import importlib.util
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ttl_cache import TTLCache
+
+PASSWORD_HASH_SCHEME = os.getenv("PASSWORD_HASH_SCHEME", "")  # vazio = bcrypt se instalado
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+SCRYPT_N = int(os.getenv("SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SCRYPT_P", "1"))
+PASSWORD_HASH_MAX_WORKERS = int(os.getenv("PASSWORD_HASH_MAX_WORKERS", "4"))
+VERIFIED_SESSION_TTL = float(os.getenv("VERIFIED_SESSION_TTL", "300"))
+SCHEMES = ('bcrypt', 'scrypt')
+BCRYPT_MAX_PASSWORD_BYTES = 72
+_SCRYPT_SALT_BYTES = 16
+_SCRYPT_KEY_BYTES = 32
+
+
+def default_scheme():
+    if PASSWORD_HASH_SCHEME:
+        return PASSWORD_HASH_SCHEME
+    return 'bcrypt' if importlib.util.find_spec('bcrypt') else 'scrypt'
+
+
+def _import_bcrypt():
+    try:
+        import bcrypt
+    except ImportError:
+        raise RuntimeError("Hash bcrypt requer o pacote 'bcrypt'")
+    return bcrypt
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _is_legacy_sha256(password_hash):
+    return len(password_hash) == 64 and all(c in '0123456789abcdef' for c in password_hash)
+
+
+class PasswordHasher:
+    def __init__(self, scheme=None, bcrypt_rounds=BCRYPT_ROUNDS, scrypt_n=SCRYPT_N, scrypt_r=SCRYPT_R,
+                 scrypt_p=SCRYPT_P, max_workers=PASSWORD_HASH_MAX_WORKERS):
+        self.scheme = scheme or default_scheme()
+        if self.scheme not in SCHEMES:
+            raise ValueError(f"Esquema de hash desconhecido: {self.scheme}")
+        self.bcrypt_rounds = bcrypt_rounds
+        self.scrypt_n = scrypt_n
+        self.scrypt_r = scrypt_r
+        self.scrypt_p = scrypt_p
+        # bcrypt e scrypt liberam o GIL: o pool limita quantos hashes rodam ao mesmo tempo
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+
+    # --- trabalho pesado (roda nas threads do pool) ---
+
+    def _hash(self, password):
+        if self.scheme == 'bcrypt':
+            bcrypt = _import_bcrypt()
+            secret = password.encode('utf-8')[:BCRYPT_MAX_PASSWORD_BYTES]
+            return bcrypt.hashpw(secret, bcrypt.gensalt(self.bcrypt_rounds)).decode('ascii')
+        salt = secrets.token_bytes(_SCRYPT_SALT_BYTES)
+        key = self._scrypt(password, salt, self.scrypt_n, self.scrypt_r, self.scrypt_p)
+        return f"scrypt${self.scrypt_n}${self.scrypt_r}${self.scrypt_p}${_b64encode(salt)}${_b64encode(key)}"
+
+    @staticmethod
+    def _scrypt(password, salt, n, r, p):
+        # O padrão de maxmem (32 MiB) não comporta custos acima de n=2^14, r=8
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                              maxmem=128 * r * (n + p + 2) + 1024 * 1024, dklen=_SCRYPT_KEY_BYTES)
+
+    def _verify(self, password, password_hash):
+        if password_hash.startswith('$2'):
+            bcrypt = _import_bcrypt()
+            secret = password.encode('utf-8')[:BCRYPT_MAX_PASSWORD_BYTES]
+            return bcrypt.checkpw(secret, password_hash.encode('ascii'))
+        if password_hash.startswith('scrypt$'):
+            try:
+                _, n, r, p, salt, key = password_hash.split('$')
+                expected = base64.b64decode(key)
+                computed = self._scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+            except ValueError:
+                return False
+            return hmac.compare_digest(computed, expected)
+        if _is_legacy_sha256(password_hash):
+            computed = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(computed, password_hash)
+        return False
+
+    # --- API síncrona (bloqueia até o pool devolver o resultado) ---
+
+    def hash(self, password):
+        return self._executor.submit(self._hash, password).result()
+
+    def hash_many(self, passwords):
+        """Hashes de várias senhas, calculados em paralelo no pool (mesma ordem da entrada)."""
+        return list(self._executor.map(self._hash, passwords))
+
+    def verify(self, password, password_hash):
+        if not password or not password_hash:
+            return False
+        return self._executor.submit(self._verify, password, password_hash).result()
+
+    def needs_rehash(self, password_hash):
+        """True se o hash não foi gerado com o esquema e o custo atuais."""
+        if self.scheme == 'bcrypt':
+            # Formato $2b$12$<salt+hash>
+            parts = password_hash.split('$')
+            return not (password_hash.startswith('$2') and len(parts) == 4
+                        and parts[2] == f"{self.bcrypt_rounds:02d}")
+        return not password_hash.startswith(
+            f"scrypt${self.scrypt_n}${self.scrypt_r}${self.scrypt_p}$")
+
+    def verify_and_update(self, password, password_hash):
+        """(senha confere, novo hash ou None); o novo hash só vem quando o custo mudou."""
+        if not self.verify(password, password_hash):
+            return False, None
+        if self.needs_rehash(password_hash):
+            return True, self.hash(password)
+        return True, None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+class VerifiedSessionCache:
+    """Lembra por pouco tempo que (usuário, senha) já foi verificada contra um hash.
+
+    Evita repetir o hash lento a cada rerun do Streamlit. A senha nunca é guardada:
+    a chave é um HMAC dela com um segredo aleatório do processo, e a entrada só vale
+    para o hash com que foi verificada (trocar a senha a invalida).
+    """
+
+    def __init__(self, ttl=VERIFIED_SESSION_TTL, maxsize=4096):
+        self._secret = secrets.token_bytes(32)
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def _digest(self, password, password_hash):
+        message = password.encode('utf-8') + b'\0' + password_hash.encode('utf-8')
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def check(self, username, password, password_hash):
+        digest = self._cache.get(username)
+        return digest is not None and hmac.compare_digest(digest, self._digest(password, password_hash))
+
+    def remember(self, username, password, password_hash):
+        self._cache.set(username, self._digest(password, password_hash))
+
+    def invalidate(self, username):
+        self._cache.invalidate(username)
+
+    def clear(self):
+        self._cache.clear()
+
+    @property
+    def hits(self):
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        return self._cache.misses
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher():
+    """Instância única por processo, com o custo definido pelas variáveis de ambiente."""
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher()
+    return _hasher
+
+
+def configure_password_hasher(**kwargs):
+    """Troca o hasher do processo (p.ex. outro custo); hashes antigos serão regravados no login."""
+    global _hasher
+    with _hasher_lock:
+        previous, _hasher = _hasher, PasswordHasher(**kwargs)
+    if previous is not None:
+        previous.shutdown()
+    return _hasher
@@ -0,0 +1,507 @@
+# retention.py
+"""Retenção: arquivo morto mensal de conversations e user_actions e compactação do banco.
+
+Linhas com mais de RETENTION_DAYS dias saem do banco principal e vão para um arquivo
+SQLite por mês (<ARCHIVE_DIR>/AAAA-MM.db), com o texto comprimido (zlib). Os arquivos
+só recebem inserções (INSERT OR IGNORE pelo id original), então uma execução
+interrompida pode simplesmente ser repetida. `iter_rows` junta arquivo morto e banco
+principal numa única leitura, e o histórico paginado de database.py continua no
+arquivo morto quando o banco principal acaba.
+
+Cada mês arquivado tem também um índice FTS5 sem conteúdo (só o índice; o texto segue
+comprimido), então `search_conversations` continua encontrando conversas arquivadas.
+
+As avaliações arquivadas continuam contando no resumo user_stats (ver stats_rollup);
+depois do arquivamento, `incremental_vacuum` devolve as páginas livres ao sistema.
+Com shards (storage.py), cada shard tem o seu próprio arquivo morto.
+
+Uso: python retention.py [--days 365] [--batch-size 5000] [--vacuum-pages 0] [--no-vacuum]
+"""
+import argparse
+import heapq
+import json
+import os
+import re
+import shutil
+import sqlite3
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+import database as db
+import stats_rollup
+
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "365"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")  # vazio = "<banco>_archive", ao lado do banco
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+ARCHIVE_COMPRESSION_LEVEL = 6
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "0"))  # 0 = todas as páginas livres
+
+# tabela -> (colunas, coluna de texto comprimida no arquivo morto)
+ARCHIVED_TABLES = {
+    'conversations': (('id', 'username', 'role', 'content', 'timestamp'), 'content'),
+    'user_actions': (('id', 'username', 'action_type', 'action_data', 'outcome', 'timestamp',
+                      'conversation_id'), 'action_data'),
+}
+
+ARCHIVE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.conversations (
+        id INTEGER PRIMARY KEY,
+        username TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content BLOB NOT NULL,
+        timestamp TIMESTAMP
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_conversations_username_timestamp "
+    "ON conversations (username, timestamp)",
+    '''
+    CREATE TABLE IF NOT EXISTS {schema}.user_actions (
+        id INTEGER PRIMARY KEY,
+        username TEXT NOT NULL,
+        action_type TEXT NOT NULL,
+        action_data BLOB,
+        outcome TEXT,
+        timestamp TIMESTAMP,
+        conversation_id INTEGER
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_user_actions_username_timestamp "
+    "ON user_actions (username, timestamp)",
+]
+# Índice da busca textual do mês: content='' guarda só os termos, o texto fica comprimido em conversations
+ARCHIVE_FTS_SCHEMA = '''
+    CREATE VIRTUAL TABLE {schema}.conversations_fts USING fts5(
+        content,
+        content='',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+'''
+SNIPPET_CHARS = 120
+
+
+def _compress(text):
+    if text is None:
+        return None
+    return zlib.compress(str(text).encode('utf-8'), ARCHIVE_COMPRESSION_LEVEL)
+
+
+def _decompress(blob):
+    if blob is None:
+        return None
+    return zlib.decompress(blob).decode('utf-8')
+
+
+def _snippet(text, terms, width=SNIPPET_CHARS):
+    """Trecho ao redor do primeiro termo encontrado, com os termos em negrito (como o snippet() do FTS5)."""
+    lowered = text.lower()
+    positions = [position for position in (lowered.find(term.lower()) for term in terms) if position >= 0]
+    start = max(0, min(positions) - width // 2) if positions else 0
+    piece = text[start:start + width]
+    if terms:
+        pattern = "|".join(re.escape(term) for term in terms)
+        piece = re.sub(pattern, lambda match: f"**{match.group(0)}**", piece, flags=re.IGNORECASE)
+    return ("…" if start else "") + piece + ("…" if start + width < len(text) else "")
+
+
+def archive_dir(db_path=None):
+    """Diretório do arquivo morto de um arquivo de banco (padrão: o shard principal)."""
+    backend = db.get_storage_backend()
+    db_path = db_path or backend.paths[0]
+    if not ARCHIVE_DIR:
+        return f"{os.path.splitext(db_path)[0]}_archive"
+    if backend.sharded:
+        return os.path.join(ARCHIVE_DIR, os.path.splitext(os.path.basename(db_path))[0])
+    return ARCHIVE_DIR
+
+
+def archive_path(month, db_path=None):
+    return os.path.join(archive_dir(db_path), f"{month}.db")
+
+
+def archive_months(db_path=None):
+    """Meses (AAAA-MM) com arquivo morto, em ordem cronológica."""
+    directory = archive_dir(db_path)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[:-3] for name in os.listdir(directory) if re.fullmatch(r'\d{4}-\d{2}\.db', name))
+
+
+def _month_bounds(month):
+    year, number = map(int, month.split('-'))
+    return f"{month}-01 00:00:00", f"{year + number // 12:04d}-{number % 12 + 1:02d}-01 00:00:00"
+
+
+def _open_archive(month, db_path):
+    # Somente leitura: a leitura nunca cria nem altera um arquivo do mês
+    return sqlite3.connect(f"file:{quote(os.path.abspath(archive_path(month, db_path)))}?mode=ro", uri=True)
+
+
+# --- arquivamento ---
+
+def archive_older_than(days=RETENTION_DAYS, batch_size=ARCHIVE_BATCH_SIZE, now=None):
+    """Move para o arquivo morto as linhas com timestamp anterior a (agora - days).
+
+    Trabalha mês a mês, em lotes de `batch_size` linhas por transação, para não
+    segurar o lock de escrita por muito tempo.
+    Retorna {'cutoff', 'conversations', 'user_actions', 'months', 'elapsed'}.
+    """
+    started = time.perf_counter()
+    now = now or datetime.now(timezone.utc)
+    cutoff = (now - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    report = {'cutoff': cutoff, 'conversations': 0, 'user_actions': 0, 'months': []}
+    db.flush_pending_writes()
+    all_months = set()
+    for manager in db.get_shard_managers():
+        months = set()
+        with manager.cursor() as cursor:
+            for table in ARCHIVED_TABLES:
+                cursor.execute(f"SELECT DISTINCT substr(timestamp, 1, 7) FROM {table} WHERE timestamp < ?",
+                               (cutoff,))
+                months.update(row[0] for row in cursor.fetchall() if row[0])
+        if months:
+            os.makedirs(archive_dir(manager.db_path), exist_ok=True)
+        for month in sorted(months):
+            moved = _archive_month(manager, month, cutoff, batch_size)
+            for table, count in moved.items():
+                report[table] += count
+        all_months |= months
+    report['months'] = sorted(all_months)
+    report['elapsed'] = time.perf_counter() - started
+    return report
+
+
+def _archive_month(manager, month, cutoff, batch_size):
+    conn = manager.get_connection()
+    conn.create_function("archive_compress", 1, _compress, deterministic=True)
+    conn.create_function("archive_decompress", 1, _decompress, deterministic=True)
+    start, end = _month_bounds(month)
+    end = min(end, cutoff)
+    moved = dict.fromkeys(ARCHIVED_TABLES, 0)
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path(month, manager.db_path),))
+    try:
+        with manager.transaction() as cursor:
+            for sql in ARCHIVE_SCHEMA:
+                cursor.execute(sql.format(schema='archive'))
+            searchable = _ensure_archive_fts(cursor)
+        for table, (columns, compressed) in ARCHIVED_TABLES.items():
+            select = ", ".join(f"archive_compress({c})" if c == compressed else c for c in columns)
+            while True:
+                with manager.transaction() as cursor:
+                    cursor.execute("BEGIN IMMEDIATE")
+                    cursor.execute(f'''
+                        SELECT MAX(id) FROM (
+                            SELECT id FROM main.{table}
+                            WHERE timestamp >= ? AND timestamp < ?
+                            ORDER BY id LIMIT ?
+                        )
+                    ''', (start, end, batch_size))
+                    upto_id = cursor.fetchone()[0]
+                    if upto_id is None:
+                        break
+                    where = "timestamp >= ? AND timestamp < ? AND id <= ?"
+                    params = (start, end, upto_id)
+                    # O arquivo morto e o banco principal não têm commit atômico entre si (WAL):
+                    # se o DELETE abaixo se perder, a próxima execução ignora as cópias e apaga
+                    if table == 'conversations' and searchable:
+                        # Só as linhas ainda não copiadas: o índice sem conteúdo não rejeita duplicatas
+                        cursor.execute(f'''
+                            INSERT INTO archive.conversations_fts (rowid, content)
+                            SELECT id, content FROM main.conversations
+                            WHERE {where} AND id NOT IN (SELECT id FROM archive.conversations)
+                        ''', params)
+                    cursor.execute(f'''
+                        INSERT OR IGNORE INTO archive.{table} ({", ".join(columns)})
+                        SELECT {select} FROM main.{table} WHERE {where}
+                    ''', params)
+                    cursor.execute("INSERT INTO retention_guard (active) VALUES (1)")
+                    if table == 'user_actions':
+                        stats_rollup.add_to_archived_baseline(cursor, where, params)
+                    cursor.execute(f"DELETE FROM main.{table} WHERE {where}", params)
+                    count = cursor.rowcount
+                    cursor.execute("DELETE FROM retention_guard")
+                    cursor.execute("UPDATE table_counts SET row_count = row_count + ? WHERE table_name = ?",
+                                   (count, f"archived_{table}"))
+                moved[table] += count
+    finally:
+        conn.execute("DETACH DATABASE archive")
+    return moved
+
+
+def _ensure_archive_fts(cursor):
+    """Cria o índice de busca do mês anexado (indexando o que já estava arquivado); False sem FTS5."""
+    cursor.execute("SELECT 1 FROM archive.sqlite_master WHERE name = 'conversations_fts'")
+    if cursor.fetchone():
+        return True
+    try:
+        cursor.execute(ARCHIVE_FTS_SCHEMA.format(schema='archive'))
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ FTS5 indisponível, busca no arquivo morto será por varredura: {e}")
+        return False
+    # Meses arquivados antes de existir o índice
+    cursor.execute('''
+        INSERT INTO archive.conversations_fts (rowid, content)
+        SELECT id, archive_decompress(content) FROM archive.conversations
+    ''')
+    return True
+
+
+def incremental_vacuum(pages=VACUUM_PAGES):
+    """Devolve ao sistema até `pages` páginas livres de cada shard (0 = todas).
+
+    Bancos criados antes do auto_vacuum incremental são convertidos uma única vez
+    com um VACUUM completo. Retorna {'freed_pages', 'free_pages', 'converted'}.
+    """
+    db.flush_pending_writes()
+    report = {'freed_pages': 0, 'free_pages': 0, 'converted': False}
+    for manager in db.get_shard_managers():
+        conn = manager.get_connection()
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        converted = conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+        if converted:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            # O pragma libera uma página por passo e não devolve linhas: execute() para no primeiro
+            # passo, executescript() vai até o fim
+            conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})" if pages else "PRAGMA incremental_vacuum")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        report['freed_pages'] += before - after
+        report['free_pages'] += after
+        report['converted'] = report['converted'] or converted
+    return report
+
+
+def run_maintenance(days=RETENTION_DAYS, batch_size=ARCHIVE_BATCH_SIZE, vacuum_pages=VACUUM_PAGES, vacuum=True):
+    report = {'archive': archive_older_than(days, batch_size)}
+    if vacuum:
+        report['vacuum'] = incremental_vacuum(vacuum_pages)
+    return report
+
+
+# --- leitura unificada ---
+
+def _archived_select(table, username, start, end):
+    columns, _ = ARCHIVED_TABLES[table]
+    conditions, params = [], []
+    if username:
+        conditions.append("username = ?")
+        params.append(username)
+    if start is not None:
+        conditions.append("timestamp >= ?")
+        params.append(str(start))
+    if end is not None:
+        conditions.append("timestamp < ?")
+        params.append(str(end))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT {', '.join(columns)} FROM {table} {where} ORDER BY timestamp, id", params
+
+
+def _row_dict(table, row, archived):
+    columns, compressed = ARCHIVED_TABLES[table]
+    record = dict(zip(columns, row))
+    if archived:
+        record[compressed] = _decompress(record[compressed])
+    record['archived'] = archived
+    return record
+
+
+def iter_rows(table, username=None, start=None, end=None):
+    """Linhas de `table` do arquivo morto e do banco principal, em ordem cronológica.
+
+    Filtros opcionais por usuário e intervalo [start, end); os meses fora do
+    intervalo nem são abertos. Cada linha traz 'archived' indicando a origem.
+    """
+    if table not in ARCHIVED_TABLES:
+        raise ValueError(f"Tabela sem arquivo morto: {table}")
+    db.flush_pending_writes()
+    managers = [db.get_connection_manager(username)] if username else db.get_shard_managers()
+    shards = [_iter_shard_rows(manager, table, username, start, end) for manager in managers]
+    if len(shards) == 1:
+        yield from shards[0]
+    else:
+        yield from heapq.merge(*shards, key=lambda row: (row['timestamp'] or '', row['id']))
+
+
+def _iter_shard_rows(manager, table, username, start, end):
+    sql, params = _archived_select(table, username, start, end)
+    archived_ids = set()
+    for month in archive_months(manager.db_path):
+        month_start, month_end = _month_bounds(month)
+        if (end is not None and month_start >= str(end)) or (start is not None and month_end <= str(start)):
+            continue
+        conn = _open_archive(month, manager.db_path)
+        try:
+            for row in conn.execute(sql, params):
+                archived_ids.add(row[0])
+                yield _row_dict(table, row, archived=True)
+        finally:
+            conn.close()
+    with manager.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor:
+            # Cópia deixada por um arquivamento interrompido: a do arquivo morto já foi lida
+            if row[0] not in archived_ids:
+                yield _row_dict(table, row, archived=False)
+
+
+def search_archived(db_path, match, text, username=None, role=None, start=None, end=None, limit=20):
+    """Busca textual no arquivo morto de um arquivo de banco.
+
+    `match` é a expressão MATCH do FTS5 e `text` a busca original (usada nos meses sem
+    índice, por varredura). Retorna até `limit` tuplas por mês
+    (id, username, role, timestamp, trecho, rank), como database.search_conversations.
+    """
+    conditions, params = [], []
+    for condition, value in (("c.username = ?", username), ("c.role = ?", role),
+                             ("c.timestamp >= ?", start), ("c.timestamp < ?", end)):
+        if value is not None and value != '':
+            conditions.append(condition)
+            params.append(str(value))
+    filters = "".join(f" AND {condition}" for condition in conditions)
+    terms = text.split()
+    needle = text.strip().lower()
+    rows = []
+    for month in archive_months(db_path):
+        month_start, month_end = _month_bounds(month)
+        if (end is not None and month_start >= str(end)) or (start is not None and month_end <= str(start)):
+            continue
+        conn = _open_archive(month, db_path)
+        try:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'conversations_fts'").fetchone():
+                cursor = conn.execute(f'''
+                    SELECT c.id, c.username, c.role, c.timestamp, c.content, bm25(conversations_fts) AS rank
+                    FROM conversations_fts
+                    JOIN conversations c ON c.id = conversations_fts.rowid
+                    WHERE conversations_fts MATCH ?{filters}
+                    ORDER BY rank
+                    LIMIT ?
+                ''', [match] + params + [limit])
+            else:
+                conn.create_function("archive_contains", 1,
+                                     lambda blob: needle in (_decompress(blob) or '').lower(), deterministic=True)
+                cursor = conn.execute(f'''
+                    SELECT c.id, c.username, c.role, c.timestamp, c.content, 0
+                    FROM conversations c
+                    WHERE archive_contains(c.content){filters}
+                    ORDER BY c.timestamp DESC, c.id DESC
+                    LIMIT ?
+                ''', params + [limit])
+            rows.extend((row[0], row[1], row[2], row[3], _snippet(_decompress(row[4]), terms), row[5])
+                        for row in cursor.fetchall())
+        finally:
+            conn.close()
+    return rows
+
+
+def read_conversations(username=None, start=None, end=None):
+    return list(iter_rows('conversations', username, start, end))
+
+
+def read_user_actions(username=None, start=None, end=None):
+    return list(iter_rows('user_actions', username, start, end))
+
+
+def archived_history_before(username, before, limit):
+    """Até `limit` mensagens arquivadas do usuário anteriores ao cursor (timestamp, id), da mais nova
+    para a mais antiga, como tuplas (id, role, content, timestamp)."""
+    db_path = db.get_connection_manager(username).db_path
+    rows = []
+    for month in reversed(archive_months(db_path)):
+        if before is not None and _month_bounds(month)[0] > before[0]:
+            continue
+        conn = _open_archive(month, db_path)
+        try:
+            if before is not None:
+                cursor = conn.execute('''
+                    SELECT id, role, content, timestamp FROM conversations
+                    WHERE username = ? AND (timestamp, id) < (?, ?)
+                    ORDER BY timestamp DESC, id DESC LIMIT ?
+                ''', (username, before[0], before[1], limit - len(rows)))
+            else:
+                cursor = conn.execute('''
+                    SELECT id, role, content, timestamp FROM conversations
+                    WHERE username = ?
+                    ORDER BY timestamp DESC, id DESC LIMIT ?
+                ''', (username, limit - len(rows)))
+            rows.extend((row[0], row[1], _decompress(row[2]), row[3]) for row in cursor.fetchall())
+        finally:
+            conn.close()
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+# --- exclusão ---
+
+def delete_user_archives(usernames):
+    """Apaga do arquivo morto as linhas dos usuários informados.
+
+    Única exceção ao append-only: a exclusão de um usuário remove também o que foi arquivado.
+    """
+    shards = {}
+    for username in usernames:
+        shards.setdefault(db.get_connection_manager(username), []).append(username)
+    removed = dict.fromkeys(ARCHIVED_TABLES, 0)
+    for manager, group in shards.items():
+        payload = json.dumps(group)
+        shard_removed = dict.fromkeys(ARCHIVED_TABLES, 0)
+        for month in archive_months(manager.db_path):
+            conn = sqlite3.connect(archive_path(month, manager.db_path))
+            conn.create_function("archive_decompress", 1, _decompress, deterministic=True)
+            try:
+                with conn:
+                    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'conversations_fts'").fetchone():
+                        # Índice sem conteúdo: a remoção precisa do texto original de cada linha
+                        conn.execute('''
+                            INSERT INTO conversations_fts (conversations_fts, rowid, content)
+                            SELECT 'delete', id, archive_decompress(content) FROM conversations
+                            WHERE username IN (SELECT value FROM json_each(?))
+                        ''', (payload,))
+                    for table in ARCHIVED_TABLES:
+                        cursor = conn.execute(
+                            f"DELETE FROM {table} WHERE username IN (SELECT value FROM json_each(?))", (payload,))
+                        shard_removed[table] += cursor.rowcount
+            finally:
+                conn.close()
+        if any(shard_removed.values()):
+            with manager.transaction() as cursor:
+                for table, count in shard_removed.items():
+                    cursor.execute("UPDATE table_counts SET row_count = row_count - ? WHERE table_name = ?",
+                                   (count, f"archived_{table}"))
+                    removed[table] += count
+    return removed
+
+
+def remove_archives():
+    """Remove todo o arquivo morto, de todos os shards (usado por database.reset_database)."""
+    for db_path in db.get_storage_backend().paths:
+        directory = archive_dir(db_path)
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquiva conversas e ações antigas e compacta o banco")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="idade mínima (dias) para arquivar")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--vacuum-pages", type=int, default=VACUUM_PAGES, help="0 = todas as páginas livres")
+    parser.add_argument("--no-vacuum", action="store_true")
+    args = parser.parse_args()
+
+    report = run_maintenance(args.days, args.batch_size, args.vacuum_pages, vacuum=not args.no_vacuum)
+    archived = report['archive']
+    print(f"✅ {archived['conversations']} conversas e {archived['user_actions']} ações anteriores a "
+          f"{archived['cutoff']} arquivadas em {archived['elapsed']:.1f} s "
+          f"(meses: {', '.join(archived['months']) or 'nenhum'})")
+    if 'vacuum' in report:
+        vacuum = report['vacuum']
+        label = "VACUUM completo (conversão para auto_vacuum incremental)" if vacuum['converted'] else "VACUUM incremental"
+        print(f"🧹 {label}: {vacuum['freed_pages']} páginas liberadas, {vacuum['free_pages']} livres")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,27 @@
 # rpg_gestor.py
 import streamlit as st
-import openai
-import time
 import database as db
-from dotenv import load_dotenv, find_dotenv
+import llm_client
+import streaming
+import thread_context
+import instrumentation
+import scenario_openings
 import os
+import time
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 ASSISTANT_ID = "asst_rUreeoWsgwlPaxuJ7J7jYTBC"
 EVALUATION_MODEL = "gpt-4-turbo"
+HISTORY_PAGE_SIZE = 30
+STREAM_STATS_HISTORY = 50
+# Mesma regra de pages/01dashboard: só administradores autenticados disparam avaliações pagas
+ADMIN_USERS = ["gbsporto"]
 
 @st.cache_resource
 def init_openai_client():
+    # Imports pesados adiados para o primeiro uso (o script é reexecutado a cada rerun)
+    from dotenv import load_dotenv, find_dotenv
     load_dotenv(find_dotenv())
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
@@ -22,7 +31,8 @@ def init_openai_client():
             return None
     if not api_key:
         return None
-    return openai.Client(api_key=api_key)
+    # Cliente assíncrono compartilhado pelo processo (pool HTTP, limite de concorrência, retry)
+    return llm_client.get_llm_client(api_key)
 
 def get_client():
     c = init_openai_client()
@@ -31,18 +41,65 @@ def get_client():
         st.stop()
     return c
 
+@st.cache_resource
+def get_context_manager():
+    # Contagem de tokens por thread e rotação com resumo, compartilhada entre sessões
+    return thread_context.ThreadContextManager(get_client())
+
+@st.cache_resource
+def get_opening_cache():
+    # Aberturas pré-geradas do cenário, renovadas em segundo plano quando o Assistant muda
+    return scenario_openings.OpeningCache(get_client(), ASSISTANT_ID)
+
+def observe_first_response(kind):
+    """Do início da renderização da página até a primeira resposta aparecer (cache ou ao vivo)"""
+    started = st.session_state.get("render_started")
+    if started is not None:
+        instrumentation.observe(f"chat.first_response.{kind}", time.perf_counter() - started)
+
 def initialize_session_state(username):
     if "thread_id" not in st.session_state:
         try:
             c = get_client()
-            st.session_state.thread_id = db.get_or_create_thread_id(username, c)
+            opening = None
+            if db.get_thread_context(username) is None:
+                # Sessão nova: a abertura em cache já entra como primeira mensagem da thread
+                opening = get_opening_cache().opening_for(username)
+            seed = [{"role": "assistant", "content": opening}] if opening else None
+            st.session_state.thread_id, created = db.get_or_create_thread(username, c, messages=seed)
+            if opening and created:
+                # Só quem criou a thread com a abertura a grava: o histórico segue a thread do modelo
+                db.save_conversation(username, "assistant", opening)
+                st.session_state.opening_pending = True
         except Exception as e:
             st.error(f"Erro ao inicializar sessão: {str(e)}")
             st.stop()
     if "messages" not in st.session_state:
-        st.session_state.messages = db.get_user_history(username)
+        page = db.get_user_history_page(username, limit=HISTORY_PAGE_SIZE)
+        st.session_state.messages = page['messages']
+        st.session_state.history_cursor = page['oldest_cursor']
+        st.session_state.history_has_more = page['has_more']
+
+def load_earlier_messages(username):
+    """Busca a página anterior do histórico e a insere no início da sessão"""
+    page = db.get_user_history_page(username, limit=HISTORY_PAGE_SIZE,
+                                    before=st.session_state.history_cursor)
+    st.session_state.messages[:0] = page['messages']
+    st.session_state.history_cursor = page['oldest_cursor']
+    st.session_state.history_has_more = page['has_more']
+
+def record_stream_stats(stream_stats):
+    """Guarda TTFT e duração do streaming dos últimos turnos da sessão"""
+    history = st.session_state.setdefault("stream_stats", [])
+    history.append(stream_stats.as_dict())
+    del history[:-STREAM_STATS_HISTORY]
+    # Agregado do processo (todas as sessões), exibido em "Detalhes Técnicos"
+    if stream_stats.time_to_first_token is not None:
+        instrumentation.observe("chat.time_to_first_token", stream_stats.time_to_first_token)
+    instrumentation.observe("chat.stream", stream_stats.duration, rows=stream_stats.flushes)
 
 def handle_chat_interaction(username, prompt):
+    first_response = not any(m["role"] == "assistant" for m in st.session_state.messages)
     st.session_state.messages.append({"role": "user", "content": prompt})
     db.add_message_to_history(username, "user", prompt)
     with st.chat_message("user"):
@@ -51,23 +108,24 @@ def handle_chat_interaction(username, prompt):
     with st.chat_message("assistant"):
         try:
             c = get_client()
-            c.beta.threads.messages.create(
-                thread_id=st.session_state.thread_id,
-                role="user",
-                content=prompt
-            )
+            context = get_context_manager()
+            # A thread pode ter sido trocada por uma rotação de contexto desde o último turno
+            thread_id = context.get_thread_id(username)
+            st.session_state.thread_id = thread_id
+            stream_stats = streaming.StreamStats()
             def stream_generator():
                 try:
-                    with c.beta.threads.runs.stream(
-                        thread_id=st.session_state.thread_id,
-                        assistant_id=ASSISTANT_ID,
-                    ) as stream:
-                        for text in stream.text_deltas:
-                            yield text
-                            time.sleep(0.01)
+                    # Envio da mensagem e streaming do run numa única corrotina no loop do cliente
+                    deltas = c.stream_reply(thread_id, ASSISTANT_ID, prompt)
+                    for index, chunk in enumerate(streaming.coalesce_deltas(deltas, stats=stream_stats)):
+                        if index == 0 and first_response:
+                            # Mesmo intervalo de chat.first_response.cached: da renderização ao primeiro texto
+                            observe_first_response("live")
+                        yield chunk
                 except Exception as e:
                     yield f"❌ Erro na comunicação com o assistente: {str(e)}"
             response = st.write_stream(stream_generator)
+            record_stream_stats(stream_stats)
         except Exception as e:
             st.error(f"❌ Erro ao comunicar com o assistente: {str(e)}")
             st.info("🔧 Verifique se o ASSISTANT_ID está correto e se a API Key está configurada.")
@@ -75,9 +133,39 @@ def handle_chat_interaction(username, prompt):
     if response:
         st.session_state.messages.append({"role": "assistant", "content": response})
         db.add_message_to_history(username, "assistant", response)
+        context.record_turn(username, thread_id, prompt, response,
+                            latency=stream_stats.duration,
+                            time_to_first_token=stream_stats.time_to_first_token)
+
+def is_admin_session():
+    return bool(st.session_state.get("authentication_status")) and st.session_state.get("username") in ADMIN_USERS
+
+def show_pending_evaluations():
+    """Avaliação com EVALUATION_MODEL das respostas pendentes, em segundo plano e limitada por execução"""
+    import evaluation
+    runner = evaluation.get_background_evaluations()
+    status = runner.status()
+    if st.button(f"🤖 Avaliar respostas pendentes (até {evaluation.EVALUATION_UI_LIMIT})", key="run_evaluations",
+                 disabled=status['running']):
+        scorer = evaluation.OpenAIScorer(get_client(), model=EVALUATION_MODEL)
+        runner.start(scorer, limit=evaluation.EVALUATION_UI_LIMIT)
+        status = runner.status()
+    if status['running']:
+        done = (status['progress'] or {}).get('evaluated', 0)
+        st.info(f"⏳ Avaliação em andamento: {done} respostas avaliadas até agora.")
+    elif status['error']:
+        st.error(f"❌ Erro na avaliação: {status['error']}")
+    elif status['report']:
+        report = status['report']
+        st.success(f"✅ {report['evaluated']} respostas avaliadas "
+                   f"({report['evaluations_per_second']:.1f} avaliações/s)")
+        if report['failed_batches']:
+            st.warning(f"⚠️ {report['failed_batches']} lotes falharam e serão reavaliados na próxima execução.")
 
 def show_dashboard():
     st.title("📊 Dashboard de Análise")
+    if is_admin_session():
+        show_pending_evaluations()
     st.markdown("---")
     try:
         user_stats = db.get_all_user_evaluations()
@@ -139,6 +227,7 @@ def main():
         page_icon="🎯",
         layout="wide"
     )
+    st.session_state["render_started"] = time.perf_counter()
     st.sidebar.title("Bem-vindo!")
     st.sidebar.info("O login foi DESABILITADO temporariamente para livre acesso. Todas as funções estão disponíveis.")
     if "username" not in st.session_state:
@@ -155,9 +244,15 @@ def main():
         initialize_session_state(st.session_state['username'])
         st.title("🎯 Simulador de Casos - Treinamento")
         st.markdown("---")
+        if st.session_state.get("history_has_more"):
+            if st.button("⬆️ Carregar mensagens anteriores", key="load_earlier"):
+                load_earlier_messages(st.session_state['username'])
+                st.rerun()
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+        if st.session_state.pop("opening_pending", False):
+            observe_first_response("cached")
         if prompt := st.chat_input("Digite sua resposta para continuar a simulação:"):
             handle_chat_interaction(st.session_state['username'], prompt)
             st.rerun()
@@ -0,0 +1,251 @@
+# scenario_openings.py
+"""Aberturas de cenário pré-geradas: o primeiro turno de uma sessão nova sem esperar o LLM.
+
+Para cada cenário, OPENING_VARIANTS aberturas são geradas em lote pelo Assistant e
+guardadas em scenario_openings sob a chave (cenário, versão do Assistant). Uma sessão
+nova recebe na hora uma das variantes (escolhida de forma estável pelo username), que
+já entra como primeira mensagem da thread do usuário.
+
+A versão é um hash do modelo, das instruções e das ferramentas do Assistant, consultado
+no máximo a cada OPENING_VERSION_TTL segundos. Quando ela muda, as aberturas antigas
+deixam de ser servidas e um lote novo é gerado em segundo plano; até ele ficar pronto,
+as sessões novas seguem o caminho normal (miss). Acertos, falhas e latência da consulta
+ficam nas séries "openings.*" da instrumentação.
+
+Uso (pré-geração em lote): python scenario_openings.py --assistant-id asst_... [--scenario padrao]
+     [--variants 3] [--base-url http://127.0.0.1:8000/v1] [--force]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+import instrumentation
+
+OPENING_VARIANTS = int(os.getenv("OPENING_VARIANTS", "3"))
+OPENING_VERSION_TTL = int(os.getenv("OPENING_VERSION_TTL", "300"))
+# Fixa a versão (sem consultar o Assistant); útil quando as instruções vêm de deploy
+ASSISTANT_VERSION = os.getenv("ASSISTANT_VERSION", "")
+DEFAULT_SCENARIO = "padrao"
+
+OPENING_PROMPT = """Inicie uma nova sessão do simulador de casos de liderança. Apresente-se brevemente,
+descreva o cenário inicial (a equipe, o contexto e o problema a resolver) e termine perguntando
+qual é a primeira decisão do usuário. Não mencione que esta é uma mensagem pré-gerada."""
+
+
+def assistant_version(assistant):
+    """Hash curto de tudo que muda as respostas do Assistant (modelo, instruções, ferramentas)."""
+    payload = json.dumps({
+        'model': getattr(assistant, 'model', None),
+        'instructions': getattr(assistant, 'instructions', None),
+        'tools': sorted(getattr(tool, 'type', str(tool)) for tool in (getattr(assistant, 'tools', None) or [])),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class LLMOpeningGenerator:
+    """Gera as variantes em paralelo, cada uma numa thread própria do Assistant."""
+
+    def __init__(self, client, assistant_id):
+        self.client = client
+        self.assistant_id = assistant_id
+
+    def __call__(self, prompt, count):
+        async def generate():
+            return await asyncio.gather(*(self.client.aanalyze(prompt, self.assistant_id) for _ in range(count)))
+        return self.client.run(generate())
+
+
+class OpeningCache:
+    def __init__(self, client, assistant_id, scenario=DEFAULT_SCENARIO, variants=OPENING_VARIANTS,
+                 prompt=OPENING_PROMPT, version=ASSISTANT_VERSION or None, version_ttl=OPENING_VERSION_TTL,
+                 generator=None, background=True):
+        self.client = client
+        self.assistant_id = assistant_id
+        self.scenario = scenario
+        self.variants = variants
+        self.prompt = prompt
+        self.version_ttl = version_ttl
+        self.generator = generator or LLMOpeningGenerator(client, assistant_id)
+        self.background = background
+        self._fixed_version = version
+        self._version = version
+        self._version_checked_at = None
+        self._loaded = (None, [])
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="openings") if background else None
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def _fetch_version(self):
+        try:
+            return assistant_version(self.client.retrieve_assistant(self.assistant_id))
+        except Exception as e:
+            print(f"Erro ao consultar a versão do Assistant: {e}")
+            return None
+
+    def _check_version(self):
+        version = self._fetch_version()
+        with self._lock:
+            self._version_checked_at = time.monotonic()
+            previous = self._version
+            if version is not None:
+                self._version = version
+        if version is not None and version != previous and previous is not None:
+            # Assistant mudou: gera o lote novo antes que as sessões comecem a pedir
+            self.schedule_refresh(version)
+        return self._version
+
+    def current_version(self):
+        """Versão do Assistant; só bloqueia na primeira consulta, depois revalida em segundo plano."""
+        if self._fixed_version:
+            return self._fixed_version
+        with self._lock:
+            checked_at = self._version_checked_at
+            version = self._version
+        if checked_at is None or version is None:
+            return self._check_version()
+        if time.monotonic() - checked_at >= self.version_ttl:
+            with self._lock:
+                # Evita que várias sessões disparem a mesma consulta
+                self._version_checked_at = time.monotonic()
+            if self._executor is not None:
+                self._executor.submit(self._check_version)
+            else:
+                return self._check_version()
+        return version
+
+    def openings(self, version):
+        loaded_version, loaded = self._loaded
+        if loaded_version == version and loaded:
+            return loaded
+        openings = db.get_scenario_openings(self.scenario, version)
+        if openings:
+            self._loaded = (version, openings)
+        return openings
+
+    def opening_for(self, username):
+        """Abertura pré-gerada para a sessão nova do usuário, ou None (e agenda a geração)."""
+        started = time.perf_counter()
+        version = self.current_version()
+        openings = self.openings(version) if version else []
+        hit = bool(openings)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        instrumentation.increment("openings.hit" if hit else "openings.miss")
+        instrumentation.observe("openings.lookup", time.perf_counter() - started)
+        if not hit:
+            if version:
+                self.schedule_refresh(version)
+            return None
+        return openings[zlib.crc32((username or '').lower().encode('utf-8')) % len(openings)]
+
+    def schedule_refresh(self, version):
+        """Gera o lote da versão uma única vez, mesmo com várias sessões pedindo ao mesmo tempo."""
+        with self._lock:
+            if version in self._refreshing:
+                return
+            self._refreshing.add(version)
+        if self._executor is not None:
+            self._executor.submit(self._refresh_job, version)
+        else:
+            self._refresh_job(version)
+
+    def _refresh_job(self, version):
+        try:
+            self.refresh(version)
+        except Exception as e:
+            with self._lock:
+                self.refresh_failures += 1
+            instrumentation.increment("openings.refresh_failures")
+            print(f"Erro ao gerar aberturas do cenário {self.scenario}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(version)
+
+    def refresh(self, version):
+        """Gera e grava as variantes da versão; retorna quantas foram gravadas."""
+        with instrumentation.span("openings.refresh") as span:
+            openings = [text for text in self.generator(self.prompt, self.variants) if text]
+            if not openings:
+                raise ValueError("O Assistant não retornou nenhuma abertura")
+            saved = db.save_scenario_openings(self.scenario, version, openings)
+            span.rows = saved
+        if not saved:
+            raise RuntimeError("Falha ao gravar as aberturas no banco")
+        self._loaded = (version, openings)
+        with self._lock:
+            self.refreshes += 1
+        return saved
+
+    def warm(self, force=False):
+        """Garante o lote da versão atual (bloqueando); retorna quantas aberturas existem."""
+        version = self.current_version()
+        if not version:
+            return 0
+        if force or not self.openings(version):
+            return self.refresh(version)
+        return len(self.openings(version))
+
+    def wait(self):
+        """Espera as gerações em segundo plano já agendadas."""
+        # Um único worker: quando a tarefa vazia roda, as anteriores já terminaram
+        while self._executor is not None:
+            self._executor.submit(lambda: None).result()
+            with self._lock:
+                if not self._refreshing:
+                    return
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'scenario': self.scenario,
+                'version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'refreshes': self.refreshes,
+                'refresh_failures': self.refresh_failures,
+                'refreshing': len(self._refreshing),
+            }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+def main():
+    import llm_client
+    parser = argparse.ArgumentParser(description="Pré-gera as aberturas de cenário para a versão atual do Assistant")
+    parser.add_argument("--assistant-id", default=os.getenv("ASSISTANT_ID"), required=not os.getenv("ASSISTANT_ID"))
+    parser.add_argument("--scenario", default=DEFAULT_SCENARIO)
+    parser.add_argument("--variants", type=int, default=OPENING_VARIANTS)
+    parser.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL"))
+    parser.add_argument("--force", action="store_true", help="gera de novo mesmo se a versão já tiver aberturas")
+    args = parser.parse_args()
+
+    db.ensure_database()
+    client = llm_client.get_llm_client(os.getenv("OPENAI_API_KEY"), args.base_url)
+    cache = OpeningCache(client, args.assistant_id, scenario=args.scenario, variants=args.variants,
+                         background=False)
+    started = time.perf_counter()
+    count = cache.warm(force=args.force)
+    print(f"✅ {count} aberturas do cenário '{args.scenario}' prontas para a versão "
+          f"{cache.current_version()} ({time.perf_counter() - started:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+# stats_rollup.py
+"""Tabelas de resumo (user_stats / user_stats_daily) das avaliações por usuário.
+
+São mantidas por triggers em user_actions (ver migração 4); as funções abaixo
+recriam o resumo a partir da tabela bruta e conferem se os dois batem.
+
+Linhas movidas para o arquivo morto (retention.py) continuam contando: o
+arquivamento apaga com retention_guard preenchido, o que desliga o trigger de
+DELETE, e soma o que saiu em user_stats_archived / user_stats_daily_archived,
+que o rebuild e a conferência usam como base.
+"""
+
+EVALUATION_ACTION = 'avaliacao_automatica'
+
+# Resultado da avaliação: coluna outcome, ou action_data nos registros antigos.
+# Nunca é NULL, para que as comparações abaixo resultem sempre em 0/1.
+RESULT_EXPR = "COALESCE({t}outcome, {t}action_data, '')"
+
+CREATE_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS user_stats (
+        username TEXT PRIMARY KEY,
+        acertos INTEGER NOT NULL DEFAULT 0,
+        erros INTEGER NOT NULL DEFAULT 0,
+        total_decisions INTEGER NOT NULL DEFAULT 0,
+        last_activity TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_stats_daily (
+        username TEXT NOT NULL,
+        day TEXT NOT NULL,
+        acertos INTEGER NOT NULL DEFAULT 0,
+        erros INTEGER NOT NULL DEFAULT 0,
+        total_decisions INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (username, day)
+    )
+    ''',
+]
+
+
+def _trigger_sql():
+    new_result = RESULT_EXPR.format(t="NEW.")
+    old_result = RESULT_EXPR.format(t="OLD.")
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_user_actions_stats_insert
+        AFTER INSERT ON user_actions
+        WHEN NEW.action_type = '{EVALUATION_ACTION}'
+        BEGIN
+            INSERT INTO user_stats (username, acertos, erros, total_decisions, last_activity)
+            VALUES (NEW.username, {new_result} = 'acerto', {new_result} = 'erro',
+                    {new_result} <> '', NEW.timestamp)
+            ON CONFLICT (username) DO UPDATE SET
+                acertos = acertos + excluded.acertos,
+                erros = erros + excluded.erros,
+                total_decisions = total_decisions + excluded.total_decisions,
+                last_activity = MAX(COALESCE(last_activity, ''), excluded.last_activity);
+            INSERT INTO user_stats_daily (username, day, acertos, erros, total_decisions)
+            VALUES (NEW.username, date(NEW.timestamp), {new_result} = 'acerto',
+                    {new_result} = 'erro', {new_result} <> '')
+            ON CONFLICT (username, day) DO UPDATE SET
+                acertos = acertos + excluded.acertos,
+                erros = erros + excluded.erros,
+                total_decisions = total_decisions + excluded.total_decisions;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_user_actions_stats_delete
+        AFTER DELETE ON user_actions
+        WHEN OLD.action_type = '{EVALUATION_ACTION}'
+        BEGIN
+            UPDATE user_stats SET
+                acertos = acertos - ({old_result} = 'acerto'),
+                erros = erros - ({old_result} = 'erro'),
+                total_decisions = total_decisions - ({old_result} <> ''),
+                last_activity = (SELECT MAX(timestamp) FROM user_actions
+                                 WHERE username = OLD.username
+                                   AND action_type = '{EVALUATION_ACTION}')
+            WHERE username = OLD.username;
+            UPDATE user_stats_daily SET
+                acertos = acertos - ({old_result} = 'acerto'),
+                erros = erros - ({old_result} = 'erro'),
+                total_decisions = total_decisions - ({old_result} <> '')
+            WHERE username = OLD.username AND day = date(OLD.timestamp);
+        END
+        ''',
+    ]
+
+
+ARCHIVED_TABLES_SQL = [
+    '''
+    CREATE TABLE IF NOT EXISTS user_stats_archived (
+        username TEXT PRIMARY KEY,
+        acertos INTEGER NOT NULL DEFAULT 0,
+        erros INTEGER NOT NULL DEFAULT 0,
+        total_decisions INTEGER NOT NULL DEFAULT 0,
+        last_activity TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_stats_daily_archived (
+        username TEXT NOT NULL,
+        day TEXT NOT NULL,
+        acertos INTEGER NOT NULL DEFAULT 0,
+        erros INTEGER NOT NULL DEFAULT 0,
+        total_decisions INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (username, day)
+    )
+    ''',
+    # Tem uma linha apenas dentro da transação de arquivamento (nunca é vista já gravada)
+    "CREATE TABLE IF NOT EXISTS retention_guard (active INTEGER NOT NULL)",
+]
+
+
+def _guarded_delete_trigger_sql():
+    old_result = RESULT_EXPR.format(t="OLD.")
+    return f'''
+        CREATE TRIGGER trg_user_actions_stats_delete
+        AFTER DELETE ON user_actions
+        WHEN OLD.action_type = '{EVALUATION_ACTION}' AND NOT EXISTS (SELECT 1 FROM retention_guard)
+        BEGIN
+            UPDATE user_stats SET
+                acertos = acertos - ({old_result} = 'acerto'),
+                erros = erros - ({old_result} = 'erro'),
+                total_decisions = total_decisions - ({old_result} <> ''),
+                last_activity = (SELECT MAX(t) FROM (
+                    SELECT MAX(timestamp) AS t FROM user_actions
+                    WHERE username = OLD.username AND action_type = '{EVALUATION_ACTION}'
+                    UNION ALL
+                    SELECT last_activity FROM user_stats_archived WHERE username = OLD.username))
+            WHERE username = OLD.username;
+            UPDATE user_stats_daily SET
+                acertos = acertos - ({old_result} = 'acerto'),
+                erros = erros - ({old_result} = 'erro'),
+                total_decisions = total_decisions - ({old_result} <> '')
+            WHERE username = OLD.username AND day = date(OLD.timestamp);
+        END
+    '''
+
+
+def create_archive_baseline(cursor):
+    """Cria a base arquivada do resumo e troca o trigger de DELETE pela versão com guarda."""
+    for sql in ARCHIVED_TABLES_SQL:
+        cursor.execute(sql)
+    cursor.execute("DROP TRIGGER IF EXISTS trg_user_actions_stats_delete")
+    cursor.execute(_guarded_delete_trigger_sql())
+
+
+def add_to_archived_baseline(cursor, where, params):
+    """Soma à base arquivada as avaliações de user_actions que satisfazem `where`.
+
+    Deve rodar na mesma transação que apaga essas linhas (com retention_guard preenchido).
+    """
+    result = RESULT_EXPR.format(t="")
+    cursor.execute(f'''
+        INSERT INTO user_stats_archived (username, acertos, erros, total_decisions, last_activity)
+        SELECT username, SUM({result} = 'acerto'), SUM({result} = 'erro'), SUM({result} <> ''), MAX(timestamp)
+        FROM user_actions
+        WHERE action_type = '{EVALUATION_ACTION}' AND {where}
+        GROUP BY username
+        ON CONFLICT (username) DO UPDATE SET
+            acertos = acertos + excluded.acertos,
+            erros = erros + excluded.erros,
+            total_decisions = total_decisions + excluded.total_decisions,
+            last_activity = MAX(COALESCE(last_activity, ''), excluded.last_activity)
+    ''', params)
+    cursor.execute(f'''
+        INSERT INTO user_stats_daily_archived (username, day, acertos, erros, total_decisions)
+        SELECT username, date(timestamp), SUM({result} = 'acerto'), SUM({result} = 'erro'), SUM({result} <> '')
+        FROM user_actions
+        WHERE action_type = '{EVALUATION_ACTION}' AND {where}
+        GROUP BY username, date(timestamp)
+        ON CONFLICT (username, day) DO UPDATE SET
+            acertos = acertos + excluded.acertos,
+            erros = erros + excluded.erros,
+            total_decisions = total_decisions + excluded.total_decisions
+    ''', params)
+
+
+def _has_archived_baseline(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_stats_archived'")
+    return cursor.fetchone() is not None
+
+
+def _totals_sql(cursor):
+    """(username, acertos, erros, total_decisions, last_activity) esperados: tabela bruta + base arquivada."""
+    result = RESULT_EXPR.format(t="")
+    sql = f'''
+        SELECT username, SUM({result} = 'acerto') AS acertos, SUM({result} = 'erro') AS erros,
+               SUM({result} <> '') AS total_decisions, MAX(timestamp) AS last_activity
+        FROM user_actions
+        WHERE action_type = '{EVALUATION_ACTION}'
+        GROUP BY username
+    '''
+    if not _has_archived_baseline(cursor):
+        return sql
+    return f'''
+        SELECT username, SUM(acertos), SUM(erros), SUM(total_decisions), MAX(last_activity)
+        FROM ({sql}
+              UNION ALL
+              SELECT username, acertos, erros, total_decisions, last_activity FROM user_stats_archived)
+        GROUP BY username
+    '''
+
+
+def _daily_sql(cursor):
+    """(username, day, acertos, erros, total_decisions) esperados: tabela bruta + base arquivada."""
+    result = RESULT_EXPR.format(t="")
+    sql = f'''
+        SELECT username, date(timestamp) AS day, SUM({result} = 'acerto') AS acertos,
+               SUM({result} = 'erro') AS erros, SUM({result} <> '') AS total_decisions
+        FROM user_actions
+        WHERE action_type = '{EVALUATION_ACTION}'
+        GROUP BY username, date(timestamp)
+    '''
+    if not _has_archived_baseline(cursor):
+        return sql
+    return f'''
+        SELECT username, day, SUM(acertos), SUM(erros), SUM(total_decisions)
+        FROM ({sql}
+              UNION ALL
+              SELECT username, day, acertos, erros, total_decisions FROM user_stats_daily_archived)
+        GROUP BY username, day
+    '''
+
+
+def create_rollup(cursor):
+    """Cria tabelas e triggers do resumo e faz o backfill inicial."""
+    for sql in CREATE_TABLES_SQL:
+        cursor.execute(sql)
+    for sql in _trigger_sql():
+        cursor.execute(sql)
+    rebuild(cursor)
+
+
+def rebuild(cursor):
+    """Recria user_stats e user_stats_daily a partir de user_actions (e da base arquivada)."""
+    totals_sql = _totals_sql(cursor)
+    daily_sql = _daily_sql(cursor)
+    cursor.execute("DELETE FROM user_stats")
+    cursor.execute("DELETE FROM user_stats_daily")
+    cursor.execute(f'''
+        INSERT INTO user_stats (username, acertos, erros, total_decisions, last_activity)
+        {totals_sql}
+    ''')
+    cursor.execute(f'''
+        INSERT INTO user_stats_daily (username, day, acertos, erros, total_decisions)
+        {daily_sql}
+    ''')
+
+
+def check_consistency(cursor):
+    """Compara o resumo com a agregação da tabela bruta (mais a base arquivada).
+
+    Retorna a lista de divergências (vazia quando está tudo consistente).
+    """
+    daily_sql = _daily_sql(cursor)
+    cursor.execute(_totals_sql(cursor))
+    expected = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    cursor.execute('''
+        SELECT username, acertos, erros, total_decisions, last_activity
+        FROM user_stats
+        WHERE total_decisions > 0 OR last_activity IS NOT NULL
+    ''')
+    actual = {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+    issues = []
+    for username in sorted(set(expected) | set(actual)):
+        if expected.get(username) != actual.get(username):
+            issues.append({
+                'username': username,
+                'expected': expected.get(username),
+                'actual': actual.get(username)
+            })
+    cursor.execute(f'''
+        SELECT COUNT(*) FROM (
+            {daily_sql}
+            EXCEPT
+            SELECT username, day, acertos, erros, total_decisions
+            FROM user_stats_daily
+        )
+    ''')
+    daily_mismatches = cursor.fetchone()[0]
+    cursor.execute(f'''
+        SELECT COUNT(*) FROM (
+            SELECT username, day, acertos, erros, total_decisions
+            FROM user_stats_daily
+            WHERE total_decisions <> 0 OR acertos <> 0 OR erros <> 0
+            EXCEPT
+            {daily_sql}
+        )
+    ''')
+    daily_mismatches += cursor.fetchone()[0]
+    if daily_mismatches:
+        issues.append({'username': None, 'daily_mismatches': daily_mismatches})
+    return issues
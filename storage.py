@@ -0,0 +1,122 @@
+# storage.py
+"""Backends de armazenamento: onde ficam os dados de cada usuário.
+
+database.py continua sendo a única API pública; o backend só decide em qual arquivo
+SQLite cada operação roda.
+
+- SQLiteBackend: um único arquivo (o comportamento original).
+- ShardedSQLiteBackend: N arquivos <banco>_shardNN.db. Cada usuário mora num shard,
+  escolhido pelo hash do username ou pela sua turma (prefixo do username), então
+  turmas diferentes não disputam o mesmo lock de escrita do SQLite. Consultas
+  administrativas percorrem todos os shards e juntam os resultados.
+
+Em bancos com shards, cada shard reserva uma faixa própria de ids (ver
+`reserve_id_range`): ids de conversas e ações continuam únicos no conjunto, e
+cursores baseados em id (avaliação em lote, paginação) seguem funcionando.
+
+Configuração: DB_SHARDS (1 = sem shards), DB_SHARD_ROUTING ('hash' ou 'cohort'),
+DB_SHARD_COHORTS (JSON {"turma": shard} para fixar turmas) e DB_COHORT_SEPARATOR.
+"""
+import hashlib
+import json
+import os
+
+DB_SHARDS = int(os.getenv("DB_SHARDS", "1"))
+DB_SHARD_ROUTING = os.getenv("DB_SHARD_ROUTING", "hash")
+DB_SHARD_COHORTS = json.loads(os.getenv("DB_SHARD_COHORTS", "{}"))
+DB_COHORT_SEPARATOR = os.getenv("DB_COHORT_SEPARATOR", ".")
+ROUTINGS = ('hash', 'cohort')
+# Ids do shard i começam em i << SHARD_ID_BITS (até 2^48 linhas por tabela e por shard)
+SHARD_ID_BITS = 48
+
+
+def _stable_hash(key):
+    # hash() do Python muda a cada processo; o roteamento precisa ser estável entre execuções
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class SQLiteBackend:
+    """Todos os dados num único arquivo SQLite."""
+
+    sharded = False
+
+    def __init__(self, path):
+        self.base_path = path
+        self.paths = [path]
+
+    def shard_index(self, username):
+        return 0
+
+    def path_for(self, username):
+        return self.paths[self.shard_index(username)]
+
+    def id_offset(self, path):
+        return 0
+
+
+class ShardedSQLiteBackend(SQLiteBackend):
+    """Usuários distribuídos em `shards` arquivos SQLite, por hash do username ou por turma.
+
+    Com routing='cohort' a turma é o trecho do username antes de `cohort_separator`
+    ("turma-a.ana" -> "turma-a"): a turma inteira fica no mesmo shard, no índice
+    fixado em `cohorts` ou pelo hash do nome da turma. Usernames sem turma são
+    distribuídos pelo hash. O roteamento ignora maiúsculas, como o login.
+    """
+
+    sharded = True
+
+    def __init__(self, base_path, shards, routing=DB_SHARD_ROUTING, cohorts=None,
+                 cohort_separator=DB_COHORT_SEPARATOR):
+        if shards < 1:
+            raise ValueError("O número de shards deve ser pelo menos 1")
+        if routing not in ROUTINGS:
+            raise ValueError(f"Roteamento de shards desconhecido: {routing}")
+        self.base_path = base_path
+        self.shards = shards
+        self.routing = routing
+        self.cohorts = {name.lower(): index for name, index in (cohorts or {}).items()}
+        self.cohort_separator = cohort_separator
+        root, ext = os.path.splitext(base_path)
+        self.paths = [f"{root}_shard{index:02d}{ext or '.db'}" for index in range(shards)]
+
+    def cohort_of(self, username):
+        key = (username or '').lower()
+        if self.cohort_separator and self.cohort_separator in key:
+            return key.split(self.cohort_separator, 1)[0]
+        return None
+
+    def shard_index(self, username):
+        key = (username or '').lower()
+        if self.routing == 'cohort':
+            cohort = self.cohort_of(key)
+            if cohort is not None:
+                if cohort in self.cohorts:
+                    return self.cohorts[cohort] % self.shards
+                key = cohort
+        return _stable_hash(key) % self.shards
+
+    def id_offset(self, path):
+        return self.paths.index(path) << SHARD_ID_BITS
+
+
+def create_backend(base_path, shards=None, routing=None, cohorts=None):
+    """Backend configurado pelas variáveis de ambiente (ou pelos argumentos)."""
+    shards = DB_SHARDS if shards is None else shards
+    if shards <= 1:
+        return SQLiteBackend(base_path)
+    return ShardedSQLiteBackend(base_path, shards, routing or DB_SHARD_ROUTING,
+                                DB_SHARD_COHORTS if cohorts is None else cohorts)
+
+
+def reserve_id_range(conn, offset):
+    """Faz as tabelas AUTOINCREMENT ainda vazias do shard numerarem a partir de `offset`."""
+    if not offset:
+        return
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE '%AUTOINCREMENT%'")]
+    with conn:
+        for table in tables:
+            conn.execute('''
+                INSERT INTO sqlite_sequence (name, seq)
+                SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+            ''', (table, offset, table))
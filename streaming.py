@@ -0,0 +1,79 @@
+# streaming.py
+"""Agrupamento dos deltas de texto do Assistant antes de enviá-los ao Streamlit.
+
+Em vez de um `yield` (e um re-render) por token, os deltas são acumulados e
+liberados quando passa `max_interval` segundos desde o último envio ou quando o
+buffer atinge `max_chars` caracteres. Não há nenhuma espera artificial.
+"""
+import time
+
+STREAM_FLUSH_INTERVAL = 0.05
+STREAM_FLUSH_CHARS = 120
+
+
+class StreamStats:
+    """Métricas de um turno: tempo até o primeiro token, duração total e envios."""
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self.started_at = clock()
+        self.first_token_at = None
+        self.finished_at = None
+        self.chars = 0
+        self.deltas = 0
+        self.flushes = 0
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def duration(self):
+        end = self.finished_at if self.finished_at is not None else self._clock()
+        return end - self.started_at
+
+    def as_dict(self):
+        return {
+            'time_to_first_token': self.time_to_first_token,
+            'duration': self.duration,
+            'chars': self.chars,
+            'deltas': self.deltas,
+            'flushes': self.flushes,
+        }
+
+
+def coalesce_deltas(deltas, max_interval=STREAM_FLUSH_INTERVAL, max_chars=STREAM_FLUSH_CHARS,
+                    stats=None, clock=time.perf_counter):
+    """Gera blocos de texto a partir de `deltas`, limitados por tempo ou tamanho.
+
+    O primeiro delta é liberado imediatamente para não atrasar o primeiro token.
+    """
+    if stats is None:
+        stats = StreamStats(clock)
+    buffer = []
+    buffered_chars = 0
+    last_flush = None
+    try:
+        for delta in deltas:
+            if not delta:
+                continue
+            now = clock()
+            if stats.first_token_at is None:
+                stats.first_token_at = now
+            stats.deltas += 1
+            stats.chars += len(delta)
+            buffer.append(delta)
+            buffered_chars += len(delta)
+            if last_flush is None or buffered_chars >= max_chars or now - last_flush >= max_interval:
+                stats.flushes += 1
+                yield "".join(buffer)
+                buffer = []
+                buffered_chars = 0
+                last_flush = clock()
+        if buffer:
+            stats.flushes += 1
+            yield "".join(buffer)
+    finally:
+        stats.finished_at = clock()
@@ -0,0 +1,81 @@
+# thread_cache.py
+"""Cache LRU de username -> thread_id com criação "single-flight".
+
+Chamadas concorrentes para o mesmo usuário sem thread compartilham uma única
+criação remota; as demais aguardam o resultado em vez de criar threads duplicadas.
+"""
+import threading
+from collections import OrderedDict
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ThreadIdCache:
+    def __init__(self, lookup, store, maxsize=1024):
+        """`lookup(username)` lê o thread_id persistido (ou None; erros de leitura devem
+        propagar, nunca virar None); `store(username, thread_id)` persiste e retorna o
+        thread_id vencedor."""
+        self._lookup = lookup
+        self._store = store
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def get(self, username):
+        with self._lock:
+            thread_id = self._entries.get(username)
+            if thread_id is not None:
+                self._entries.move_to_end(username)
+            return thread_id
+
+    def put(self, username, thread_id):
+        with self._lock:
+            self._entries[username] = thread_id
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_create(self, username, create):
+        """Retorna o thread_id do usuário; `create()` só é chamado por um único chamador."""
+        thread_id = self.get(username)
+        if thread_id is not None:
+            return thread_id
+        with self._lock:
+            flight = self._in_flight.get(username)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[username] = _Flight()
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            thread_id = self._lookup(username)
+            if thread_id is None:
+                # Chamada de rede fora de qualquer transação do banco
+                thread_id = self._store(username, create())
+            self.put(username, thread_id)
+            flight.result = thread_id
+            return thread_id
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(username, None)
+            flight.event.set()
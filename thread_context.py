@@ -0,0 +1,188 @@
+# thread_context.py
+"""Gestão da janela de contexto das threads do Assistant.
+
+Cada turno soma uma estimativa de tokens à thread do usuário. Quando o total passa
+de CONTEXT_TOKEN_THRESHOLD, as mensagens ainda não resumidas (menos as últimas
+CONTEXT_KEEP_MESSAGES) são condensadas, junto com o resumo anterior, num novo resumo
+guardado em conversation_summaries; o usuário passa então para uma thread nova que
+começa com esse resumo e as mensagens recentes. Assim o prompt de cada turno deixa
+de crescer com o histórico inteiro.
+"""
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+
+CONTEXT_TOKEN_THRESHOLD = int(os.getenv("CONTEXT_TOKEN_THRESHOLD", "8000"))
+CONTEXT_KEEP_MESSAGES = int(os.getenv("CONTEXT_KEEP_MESSAGES", "6"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_CHARS = 4000
+MESSAGE_OVERHEAD_TOKENS = 4
+TURN_METRICS_HISTORY = 500
+HISTORY_PAGE_SIZE = 500
+
+SUMMARY_PROMPT = """Você resume sessões de um simulador de casos de liderança para que a simulação
+continue numa conversa nova. Preserve o cenário atual, as decisões já tomadas pelo usuário,
+as consequências apresentadas e o que ficou pendente. Seja factual e conciso (máximo de 300 palavras)."""
+
+
+def estimate_tokens(text):
+    """Estimativa barata: ~4 caracteres por token mais o overhead de cada mensagem."""
+    return (len(text or '') + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+def format_transcript(messages):
+    return "\n".join(f"{'Usuário' if m['role'] == 'user' else 'Assistente'}: {m['content']}" for m in messages)
+
+
+class LLMSummarizer:
+    """Resumo incremental com o LLM: resumo anterior + mensagens novas -> resumo novo."""
+
+    def __init__(self, client, model=SUMMARY_MODEL):
+        self.client = client
+        self.model = model
+
+    def __call__(self, previous_summary, messages):
+        content = f"RESUMO ANTERIOR:\n{previous_summary}\n\n" if previous_summary else ""
+        content += f"NOVAS MENSAGENS:\n{format_transcript(messages)}"
+        return self.client.chat_completion(
+            model=self.model,
+            temperature=0,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": content},
+            ],
+        )
+
+
+def truncating_summarizer(previous_summary, messages, max_chars=SUMMARY_MAX_CHARS):
+    """Resumo local sem LLM (testes e benchmarks): mantém o final do texto acumulado."""
+    text = "\n".join(part for part in (previous_summary, format_transcript(messages)) if part)
+    return text[-max_chars:]
+
+
+class ThreadContextManager:
+    def __init__(self, client, summarizer=None, threshold=CONTEXT_TOKEN_THRESHOLD,
+                 keep_messages=CONTEXT_KEEP_MESSAGES, background=True):
+        self.client = client
+        self.summarizer = summarizer or LLMSummarizer(client)
+        self.threshold = threshold
+        self.keep_messages = keep_messages
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="context") if background else None
+        self._lock = threading.Lock()
+        self._rotating = set()
+        self._turns = deque(maxlen=TURN_METRICS_HISTORY)
+        self.rotations = 0
+        self.rotation_failures = 0
+
+    def get_thread_id(self, username):
+        return db.get_or_create_thread_id(username, self.client)
+
+    def record_turn(self, username, thread_id, user_text, assistant_text, latency=None, time_to_first_token=None):
+        """Contabiliza os tokens do turno e agenda a rotação se a thread passou do limite.
+
+        Retorna o total estimado de tokens da thread (None se ela já foi trocada).
+        """
+        reply_tokens = estimate_tokens(assistant_text)
+        total = db.add_thread_tokens(username, thread_id, estimate_tokens(user_text) + reply_tokens)
+        if total is None:
+            # Outro processo já trocou a thread: o próximo turno lê a atual do banco
+            db.invalidate_thread_id(username)
+            return None
+        with self._lock:
+            self._turns.append({
+                'username': username,
+                'thread_id': thread_id,
+                # O run leu a thread inteira, inclusive a mensagem do usuário, mas não a resposta
+                'prompt_tokens': total - reply_tokens,
+                'thread_tokens': total,
+                'latency': latency,
+                'time_to_first_token': time_to_first_token,
+            })
+        if total >= self.threshold:
+            self.schedule_rotation(username, thread_id)
+        return total
+
+    def schedule_rotation(self, username, thread_id):
+        with self._lock:
+            if username in self._rotating:
+                return False
+            self._rotating.add(username)
+        if self._executor:
+            self._executor.submit(self._rotate_guarded, username, thread_id)
+        else:
+            self._rotate_guarded(username, thread_id)
+        return True
+
+    def _rotate_guarded(self, username, thread_id):
+        try:
+            self.rotate(username, thread_id)
+        except Exception as e:
+            print(f"Erro ao rotacionar thread de {username}: {e}")
+            with self._lock:
+                self.rotation_failures += 1
+        finally:
+            with self._lock:
+                self._rotating.discard(username)
+
+    def rotate(self, username, thread_id):
+        """Resume o que falta, cria a thread nova (resumo + mensagens recentes) e troca.
+
+        Retorna o novo thread_id, ou None se a thread do usuário já não era `thread_id`.
+        """
+        db.flush_pending_writes()
+        previous = db.get_latest_conversation_summary(username)
+        summary = previous['summary'] if previous else ''
+        upto_cursor = previous['upto_cursor'] if previous else None
+        messages = self._messages_after(username, upto_cursor)
+        keep = messages[-self.keep_messages:] if self.keep_messages else []
+        older = messages[:len(messages) - len(keep)]
+        if older:
+            # Resumo em etapas de até `threshold` tokens: threads antigas podem ter o histórico todo
+            chunk, chunk_tokens = [], 0
+            for message in older:
+                chunk.append(message)
+                chunk_tokens += estimate_tokens(message['content'])
+                if chunk_tokens >= self.threshold or message is older[-1]:
+                    summary = self.summarizer(summary, chunk)
+                    chunk, chunk_tokens = [], 0
+            upto_cursor = (older[-1]['timestamp'], older[-1]['id'])
+            db.save_conversation_summary(username, thread_id, summary, upto_cursor, estimate_tokens(summary))
+        seed = []
+        if summary:
+            seed.append({'role': 'user', 'content': f"Resumo da simulação até aqui (continue a partir dele):\n{summary}"})
+        seed.extend({'role': m['role'], 'content': m['content']} for m in keep)
+        new_thread_id = self.client.create_thread(messages=seed)
+        seed_tokens = sum(estimate_tokens(m['content']) for m in seed)
+        if not db.rotate_user_thread(username, thread_id, new_thread_id, seed_tokens):
+            return None
+        with self._lock:
+            self.rotations += 1
+        return new_thread_id
+
+    def _messages_after(self, username, cursor):
+        # ('', 0) antecede qualquer (timestamp, id): sem resumo, lê desde o início
+        cursor = cursor or ('', 0)
+        messages = []
+        while True:
+            page = db.get_user_history_page(username, limit=HISTORY_PAGE_SIZE, after=cursor)
+            messages.extend(page['messages'])
+            if not page['has_more']:
+                return messages
+            cursor = page['newest_cursor']
+
+    def metrics(self):
+        with self._lock:
+            turns = list(self._turns)
+            metrics = {
+                'rotations': self.rotations,
+                'rotation_failures': self.rotation_failures,
+                'pending_rotations': len(self._rotating),
+                'turns': turns,
+            }
+        prompt_sizes = [turn['prompt_tokens'] for turn in turns]
+        metrics['avg_prompt_tokens'] = sum(prompt_sizes) / len(prompt_sizes) if prompt_sizes else 0.0
+        metrics['max_prompt_tokens'] = max(prompt_sizes, default=0)
+        return metrics
@@ -0,0 +1,141 @@
+# write_queue.py
+"""Fila write-behind: agrupa INSERTs pendentes e grava em lote numa thread de fundo.
+
+Quem chama `submit` não espera pelo disco; a thread escritora junta os itens até
+`batch_size` ou `flush_interval` segundos e faz um único commit por lote
+(um `executemany` por instrução SQL distinta).
+"""
+import atexit
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    def __init__(self, manager_factory, batch_size=200, flush_interval=0.05, max_queue_size=10000,
+                 on_batch_written=None):
+        self.manager_factory = manager_factory
+        # Chamado com a lista de (sql, params) gravada, p.ex. para invalidar caches
+        self.on_batch_written = on_batch_written
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'batches': 0,
+            'rows_written': 0,
+            'rows_failed': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+
+    def submit(self, sql, params):
+        """Enfileira um INSERT; bloqueia apenas se a fila estiver cheia."""
+        self._ensure_started()
+        self._queue.put((sql, params))
+
+    def flush(self):
+        """Aguarda até que tudo o que foi enfileirado esteja gravado."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+    def stop(self, timeout=10):
+        """Grava o que estiver pendente e encerra a thread escritora."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def metrics(self):
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics['queue_depth'] = self._queue.qsize()
+        metrics['avg_flush_ms'] = (metrics['total_flush_ms'] / metrics['batches']) if metrics['batches'] else 0.0
+        return metrics
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        stop = False
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _write_batch(self, batch):
+        grouped = {}
+        for sql, params in batch:
+            grouped.setdefault(sql, []).append(params)
+        start = time.perf_counter()
+        failed = 0
+        manager = self.manager_factory()
+        try:
+            with manager.transaction() as cursor:
+                for sql, rows in grouped.items():
+                    cursor.executemany(sql, rows)
+        except Exception as e:
+            # Uma linha inválida não deve derrubar o lote inteiro: grava uma a uma
+            print(f"Erro ao gravar lote ({len(batch)} itens), tentando individualmente: {e}")
+            for sql, params in batch:
+                try:
+                    with manager.transaction() as cursor:
+                        cursor.execute(sql, params)
+                except Exception as row_error:
+                    failed += 1
+                    print(f"Erro ao gravar item da fila: {row_error}")
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if self.on_batch_written is not None:
+            try:
+                self.on_batch_written(batch)
+            except Exception as e:
+                print(f"Erro no callback da fila de escrita: {e}")
+        with self._metrics_lock:
+            self._metrics['batches'] += 1
+            self._metrics['rows_written'] += len(batch) - failed
+            self._metrics['rows_failed'] += failed
+            self._metrics['last_flush_ms'] = elapsed_ms
+            self._metrics['total_flush_ms'] += elapsed_ms
+            self._metrics['max_flush_ms'] = max(self._metrics['max_flush_ms'], elapsed_ms)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                self._queue.task_done()
+                return
+            batch, stop = self._collect_batch(first)
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self._queue.task_done()
+            if stop:
+                return
+
+
+def create_write_queue(manager_factory, **kwargs):
+    """Cria a fila e garante que ela seja esvaziada no encerramento do processo."""
+    write_queue = WriteBehindQueue(manager_factory, **kwargs)
+    atexit.register(write_queue.stop)
+    return write_queue